@@ -0,0 +1,164 @@
+"""Agent that stays resident and publishes the changes of hooks."""
+
+import json
+import os
+import queue
+import socketserver
+import threading
+
+from bb_change_broker.client import Client
+from bb_change_broker.util.spool import Spool
+
+
+class AgentRequestHandler(socketserver.StreamRequestHandler):
+    """Handler for a request of a hook."""
+
+    # maximum size of a request in bytes
+    MAX_REQUEST_SIZE = 64 * 1024 * 1024
+
+    def handle(self):
+        """Journal the request of a hook and confirm it."""
+        try:
+            request = json.loads(self.rfile.readline(self.MAX_REQUEST_SIZE))
+            if not isinstance(request, dict) or not (
+                "refs" in request or "revision" in request
+            ):
+                raise ValueError("Invalid request %r" % (request,))
+        except ValueError as e:
+            self.server.agent.logger.error("Rejected request: %s" % e)
+            self.wfile.write(b'{"status": "error"}\n')
+            return
+        try:
+            self.server.agent.submit(request)
+        except OSError as e:
+            # the hook runs the client itself
+            self.server.agent.logger.error("Failed to journal request: %s" % e)
+            self.wfile.write(b'{"status": "error"}\n')
+            return
+        self.wfile.write(b'{"status": "ok"}\n')
+
+
+class Agent(object):
+    """Agent that stays resident and publishes the changes of hooks.
+
+    Hooks hand their input to the agent over a unix socket and return
+    immediately. The agent collects the changes of all requests that
+    arrived meanwhile and publishes them together over its broker
+    connection.
+
+    A request is written to a journal on disk before the hook gets its
+    confirmation, and only dropped from the journal once its changes were
+    published. The requests that a killed agent did not publish are
+    published when it starts again.
+    """
+
+    # content type of the requests in the journal
+    REQUEST_TYPE = "application/x-bb-change-broker-request"
+
+    def __init__(self, config, client=None):
+        """Initialize the agent.
+
+        :param config (dict): The configuration of the agent.
+        :param client (Client): The client that publishes the changes.
+        """
+        self.client = (
+            client
+            if client is not None
+            else Client(
+                config, cwd=config["git"]["repository"] if "git" in config else None
+            )
+        )
+        self.logger = self.client.logger
+        self.socket_path = config["agent"]["socket"]
+        self.socket_mode = int(str(config["agent"].get("socket_mode", "660")), 8)
+        self.journal = Spool(
+            directory=config["agent"].get("journal", self.socket_path + ".journal"),
+            logger=self.logger,
+        )
+        # wakes up the worker for new requests, None stops it
+        self.requests = queue.Queue()
+        self.server = None
+
+    def submit(self, request):
+        """Write a request to the journal and wake up the worker.
+
+        :param request (dict): The refs or revision to publish.
+        """
+        self.journal.append([(self.REQUEST_TYPE, json.dumps(request))])
+        self.requests.put(True)
+
+    def run(self):
+        """Run the agent until it is shut down."""
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self.server = socketserver.ThreadingUnixStreamServer(
+            self.socket_path, AgentRequestHandler
+        )
+        self.server.daemon_threads = True
+        self.server.agent = self
+        os.chmod(self.socket_path, self.socket_mode)
+        # publish the requests that the last run left in the journal
+        self.requests.put(True)
+        worker = threading.Thread(target=self.__work, daemon=True)
+        worker.start()
+        self.logger.info("Agent listening on %s" % self.socket_path)
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            os.remove(self.socket_path)
+            self.requests.put(None)
+            worker.join()
+            self.client.close()
+
+    def shutdown(self):
+        """Stop the agent, the journaled requests are still published."""
+        self.server.shutdown()
+
+    def __work(self):
+        """Publish the requests of the journal whenever new ones arrive."""
+        while True:
+            wakeups = [self.requests.get()]
+            # group all requests that arrived meanwhile
+            while True:
+                try:
+                    wakeups.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.journal.drain(self.__publish_requests)
+            except Exception as e:
+                self.logger.error("Failed to publish the journaled requests")
+                self.logger.stack_trace(e)
+            if None in wakeups:
+                return
+
+    def __publish_requests(self, records) -> int:
+        """Publish the changes of journaled requests.
+
+        :param records (list): The requests as (content type, body) tuples.
+        :return (int): The number of requests, counted from the start, that
+            were published, all or none.
+        """
+        changes = []
+        for _, body in records:
+            request = json.loads(body)
+            try:
+                changes.extend(self.client.get_changes(request))
+            except Exception as e:
+                self.logger.error("Failed to get changes of %r" % (request,))
+                self.logger.stack_trace(e)
+        # requests without changes, like deleted branches, are published too
+        published = True
+        if changes:
+            self.logger.info(
+                "Publishing %d change(s) of %d request(s)"
+                % (len(changes), len(records))
+            )
+            try:
+                published = self.client.publish(changes)
+            except Exception as e:
+                published = False
+                self.logger.stack_trace(e)
+        self.client.record_publish(published)
+        return len(records) if published else 0
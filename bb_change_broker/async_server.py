@@ -0,0 +1,222 @@
+"""Server that consumes changes from broker and publishs them to buildbot with asyncio."""
+
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from bb_change_broker.codec.base import CodecError
+from bb_change_broker.codec.registry import decode_change
+from bb_change_broker.backend.async_http_handler import AsyncHTTPHandler
+from bb_change_broker.consumer.async_broker import AsyncBrokerConsumer
+from bb_change_broker.publisher.async_buildbot import AsyncBuildbotPublisher
+from bb_change_broker.util.dedup import DedupIndex, change_id
+from bb_change_broker.util.log import Logger
+
+
+class AsyncServer(object):
+    """Server that consumes changes and sends them to buildbot on one event loop.
+
+    Consuming and sending overlap: every message is processed by a task, at
+    most max_in_flight changes are sent to buildbot at the same time and each
+    message is acknowledged as soon as its change was sent. Changes of the
+    same repository and branch are sent in order. The prefetch count bounds
+    the number of messages, and so of tasks, held at the same time.
+    """
+
+    # seconds between availability checks while paused, buildbot itself is
+    # only probed after the availability ttl of the publisher
+    PROBE_INTERVAL = 1
+
+    # default prefetch count per change sent at the same time
+    PREFETCH_PER_REQUEST = 4
+
+    def __init__(self, config):
+        """Initialize the server.
+
+        :param config (dict): The configuration of the server.
+        """
+        if sys.version_info < (3, 7):
+            raise RuntimeError("The async-server mode requires Python 3.7 or newer")
+        pool_size = int(config["buildbot"].get("pool_size", 4))
+        self.max_in_flight = int(config["buildbot"].get("max_in_flight", pool_size))
+        # every message becomes a task, without limit the whole queue would be
+        # held as pending tasks
+        prefetch_count = int(
+            config["rabbitmq"].get(
+                "prefetch_count", self.PREFETCH_PER_REQUEST * self.max_in_flight
+            )
+        )
+        if prefetch_count <= 0:
+            raise ValueError(
+                "The async-server mode requires a positive prefetch_count, got %d"
+                % prefetch_count
+            )
+        self.logger = Logger(config["logging"] if "logging" in config else None)
+        self.rabbitmq = AsyncBrokerConsumer(
+            host=config["rabbitmq"]["host"],
+            port=int(config["rabbitmq"]["port"]),
+            username=config["rabbitmq"]["username"],
+            password=config["rabbitmq"]["password"],
+            logger=self.logger,
+            prefetch_count=prefetch_count,
+            retry_delays=[
+                float(delay)
+                for delay in config["rabbitmq"].get("retry_delays", [5, 30, 120, 600])
+            ],
+        )
+        self.buildbot = AsyncBuildbotPublisher(
+            host=config["buildbot"]["host"],
+            port=int(config["buildbot"]["port"]),
+            username=config["buildbot"]["username"],
+            password=config["buildbot"]["password"],
+            encoding=config["DEFAULT"]["encoding"],
+            http_handler=AsyncHTTPHandler(
+                pool_size=pool_size,
+                idle_timeout=int(config["buildbot"].get("idle_timeout", 60)),
+                timeout=int(config["buildbot"].get("timeout", 30)),
+            ),
+            logger=self.logger,
+            availability_ttl=int(config["buildbot"].get("availability_ttl", 30)),
+            failure_threshold=int(config["buildbot"].get("failure_threshold", 3)),
+        )
+        self.queue = config["rabbitmq"]["queue"]
+        self.encoding = config["DEFAULT"]["encoding"]
+        dedup = config.get("dedup", {})
+        self.dedup = DedupIndex(
+            path=dedup.get("path"),
+            size=int(dedup.get("size", 10000)),
+            ttl=int(dedup.get("ttl", 86400)),
+        )
+        # thread of the dedup index, created in serve
+        self.dedup_executor = None
+        # created in serve, semaphores are bound to the running loop
+        self.in_flight = None
+        # tasks of the messages, and the last task per repository and branch
+        self.tasks = set()
+        self.tails = {}
+        # task that resumes the consumer when buildbot is back
+        self.prober = None
+
+    def run(self):
+        """Run the server."""
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        """Consume messages until the consumer exits and wait for their tasks."""
+        self.in_flight = asyncio.Semaphore(self.max_in_flight)
+        # the index queries sqlite, which must not block the loop
+        self.dedup_executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            await self.rabbitmq.consume(self.queue, self.callback)
+        finally:
+            if self.tasks:
+                await asyncio.wait(list(self.tasks))
+            if self.prober is not None:
+                self.prober.cancel()
+            await self.buildbot.close()
+            self.dedup_executor.shutdown()
+
+    def callback(self, ch, method, properties, body):
+        """Callback function that is called on the loop when a message is received.
+
+        :param ch (BaseAsyncBrokerChannel): The channel of the message.
+        :param method (pika.spec.Basic.Deliver): The method of the message.
+        :param properties (pika.spec.BasicProperties): The properties of the message.
+        :param body (str): The body of the message.
+        """
+        self.logger.info("Received message %r" % body)
+        try:
+            change = decode_change(body, properties.content_type, self.encoding)
+        except (CodecError, ValueError) as e:
+            self.logger.error("Dropping message that cannot be decoded: %s" % e)
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            return
+        if isinstance(change, list):
+            change = change[0]
+        key = (change.get("repository"), change.get("branch"))
+        task = asyncio.ensure_future(
+            self.__process(self.tails.get(key), ch, method, properties, body, change)
+        )
+        self.tasks.add(task)
+        self.tails[key] = task
+        task.add_done_callback(lambda done: self.__done(key, done))
+
+    async def __process(self, previous, ch, method, properties, body, change):
+        """Send a change to buildbot after the previous change of its branch.
+
+        :param previous (asyncio.Task): The task of the previous change of the branch.
+        :param ch (BaseAsyncBrokerChannel): The channel of the message.
+        :param method (pika.spec.Basic.Deliver): The method of the message.
+        :param properties (pika.spec.BasicProperties): The properties of the message.
+        :param body (str): The body of the message.
+        :param change (dict): The decoded change.
+        """
+        if previous is not None:
+            await asyncio.wait([previous])
+        # messages of older clients and of the spool have no id
+        message_id = getattr(properties, "message_id", None) or change_id(
+            change, self.encoding
+        )
+        try:
+            if await self.__run_dedup(self.dedup.contains, message_id):
+                self.logger.info("Dropping duplicate change %s" % message_id)
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+                return
+            async with self.in_flight:
+                success = await self.buildbot.is_available() and (
+                    await self.buildbot.publish(change)
+                )
+            if success:
+                self.logger.debug("Sent to buildbot")
+                await self.__run_dedup(self.dedup.add, message_id)
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+                return
+            delay = self.rabbitmq.retry(ch, method, self.queue, properties, body)
+            self.logger.error(
+                "Failed to send change %s to buildbot, retrying in %d seconds"
+                % (message_id, delay)
+            )
+        except Exception as e:
+            # the channel is gone, the broker redelivers the unacknowledged message
+            self.logger.error("Failed to finish change %s" % message_id)
+            self.logger.stack_trace(e)
+            return
+        if not await self.buildbot.is_available():
+            self.__pause()
+
+    async def __run_dedup(self, method, message_id):
+        """Run a method of the dedup index on its thread.
+
+        :param method (callable): The method of the index.
+        :param message_id (str): The id of the message.
+        :return (object): The result of the method.
+        """
+        return await asyncio.get_event_loop().run_in_executor(
+            self.dedup_executor, method, message_id
+        )
+
+    def __done(self, key, task):
+        """Forget the task of a message when it is done.
+
+        :param key (tuple): The repository and branch of the change.
+        :param task (asyncio.Task): The task.
+        """
+        self.tasks.discard(task)
+        if self.tails.get(key) is task:
+            del self.tails[key]
+
+    def __pause(self):
+        """Stop consuming until buildbot is available again."""
+        if self.prober is not None:
+            return
+        self.logger.warning("Buildbot is unavailable, pausing the consumer")
+        self.rabbitmq.pause()
+        self.prober = asyncio.ensure_future(self.__probe())
+
+    async def __probe(self):
+        """Wait until buildbot is available and resume consuming."""
+        while not await self.buildbot.is_available():
+            await asyncio.sleep(self.PROBE_INTERVAL)
+        self.logger.info("Buildbot is available again")
+        self.prober = None
+        self.rabbitmq.resume()
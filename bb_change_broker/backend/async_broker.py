@@ -0,0 +1,348 @@
+"""Module for asyncio broker connection."""
+
+import asyncio
+from abc import ABCMeta, abstractmethod
+
+import pika
+from pika.adapters.asyncio_connection import AsyncioConnection
+
+
+class BaseAsyncBrokerHandler(metaclass=ABCMeta):
+    """Abstract class for asyncio broker handler."""
+
+    @abstractmethod
+    def credentials(self, username, password):
+        """Return credentials for broker connection."""
+        pass
+
+    @abstractmethod
+    def connection_parameters(self, host, port, virtual_host, credentials):
+        """Return connection parameters for broker connection.
+
+        :param host (str): The host of the broker.
+        :param port (int): The port of the broker.
+        :param virtual_host (str): The virtual host of the broker.
+        :param credentials (pika.PlainCredentials): The credentials for the broker connection.
+        """
+        pass
+
+    @abstractmethod
+    async def connect(self, connection_parameters):
+        """Open a connection to broker.
+
+        :param connection_parameters (pika.ConnectionParameters): The connection parameters for the broker connection.
+        :return (BaseAsyncBrokerConnection): The open connection.
+        """
+        pass
+
+
+class BaseAsyncBrokerConnection(metaclass=ABCMeta):
+    """Abstract class for asyncio broker connection."""
+
+    @abstractmethod
+    async def channel(self):
+        """Open a channel on the connection.
+
+        :return (BaseAsyncBrokerChannel): The open channel.
+        """
+        pass
+
+    @abstractmethod
+    async def close(self):
+        """Close the connection to broker."""
+        pass
+
+    @abstractmethod
+    def is_open(self):
+        """Return whether the connection to broker is open."""
+        pass
+
+    @abstractmethod
+    async def wait_closed(self):
+        """Wait until the connection is closed, by close or by the broker."""
+        pass
+
+
+class BaseAsyncBrokerChannel(metaclass=ABCMeta):
+    """Abstract class for asyncio broker channel.
+
+    Methods that wait for an answer of the broker are coroutines, the others
+    only send a frame and return immediately.
+    """
+
+    @abstractmethod
+    async def queue_declare(self, queue, durable, arguments=None):
+        """Declare queue for broker channel.
+
+        :param queue (str): The queue to declare.
+        :param durable (bool): Whether the queue should be durable or not.
+        :param arguments (dict): The optional arguments of the queue, like x-message-ttl.
+        """
+        pass
+
+    @abstractmethod
+    async def basic_qos(self, prefetch_count):
+        """Limit the number of unacknowledged messages.
+
+        :param prefetch_count (int): The maximum number of unacknowledged messages.
+        """
+        pass
+
+    @abstractmethod
+    def basic_consume(self, queue, callback):
+        """Consume messages from broker.
+
+        :param queue (str): The queue to consume messages from.
+        :param callback (function): The function that is called with
+            (channel, method, properties, body) when a message is received.
+        :return (str): The consumer tag.
+        """
+        pass
+
+    @abstractmethod
+    def basic_cancel(self, consumer_tag):
+        """Cancel a consumer.
+
+        :param consumer_tag (str): The consumer tag returned by basic_consume.
+        """
+        pass
+
+    @abstractmethod
+    def basic_publish(self, exchange, routing_key, body, properties):
+        """Publish a message to broker.
+
+        :param exchange (str): The exchange to publish the message to.
+        :param routing_key (str): The routing key to publish the message with.
+        :param body (str): The message to publish.
+        :param properties (pika.BasicProperties): The properties for the message.
+        """
+        pass
+
+    @abstractmethod
+    def basic_ack(self, delivery_tag):
+        """Acknowledge a message.
+
+        :param delivery_tag (int): The delivery tag of the message.
+        """
+        pass
+
+    @abstractmethod
+    def basic_nack(self, delivery_tag, requeue=True):
+        """Negatively acknowledge a message.
+
+        :param delivery_tag (int): The delivery tag of the message.
+        :param requeue (bool): Whether the message is requeued.
+        """
+        pass
+
+    @abstractmethod
+    def get_properties(
+        self, delivery_mode, content_type=None, message_id=None, headers=None
+    ):
+        """Return properties for message.
+
+        :param delivery_mode (int): The delivery mode for the message.
+        :param content_type (str): The content type of the message.
+        :param message_id (str): The id of the message.
+        :param headers (dict): The headers of the message.
+        """
+        pass
+
+
+class PikaAsyncHandler(BaseAsyncBrokerHandler):
+    """Class for asyncio broker handler that uses the asyncio adapter of pika."""
+
+    def credentials(self, username, password):
+        """Return credentials for broker connection."""
+        return pika.PlainCredentials(username, password)
+
+    def connection_parameters(self, host, port, virtual_host, credentials):
+        """Return connection parameters for broker connection."""
+        return pika.ConnectionParameters(host, port, virtual_host, credentials)
+
+    async def connect(self, connection_parameters):
+        """Open a connection to broker.
+
+        :param connection_parameters (pika.ConnectionParameters): The connection parameters for the broker connection.
+        :return (PikaAsyncConnection): The open connection.
+        """
+        connection = PikaAsyncConnection(connection_parameters)
+        await connection.opened
+        return connection
+
+
+class PikaAsyncConnection(BaseAsyncBrokerConnection):
+    """Class for asyncio broker connection."""
+
+    def __init__(self, connection_parameters):
+        """Start to open the connection, await opened to wait for it.
+
+        :param connection_parameters (pika.ConnectionParameters): The connection parameters for the broker connection.
+        """
+        loop = asyncio.get_event_loop()
+        self.opened = loop.create_future()
+        self.closed = loop.create_future()
+        self.connection = AsyncioConnection(
+            connection_parameters,
+            on_open_callback=lambda connection: resolve(self.opened, None),
+            on_open_error_callback=lambda connection, error: reject(self.opened, error),
+            on_close_callback=self.__on_close,
+            custom_ioloop=loop,
+        )
+
+    async def channel(self):
+        """Open a channel on the connection.
+
+        :return (PikaAsyncChannel): The open channel.
+        """
+        opened = asyncio.get_event_loop().create_future()
+        self.connection.channel(
+            on_open_callback=lambda channel: resolve(opened, channel)
+        )
+        return PikaAsyncChannel(await opened)
+
+    async def close(self):
+        """Close the connection to broker."""
+        if self.connection.is_open:
+            self.connection.close()
+        await self.wait_closed()
+
+    def is_open(self):
+        """Return whether the connection to broker is open."""
+        return self.connection.is_open
+
+    async def wait_closed(self):
+        """Wait until the connection is closed, by close or by the broker."""
+        await asyncio.shield(self.closed)
+
+    def __on_close(self, connection, reason):
+        """Resolve the futures of the connection when it is closed.
+
+        :param connection (pika.adapters.asyncio_connection.AsyncioConnection): The connection.
+        :param reason (Exception): The reason why the connection was closed.
+        """
+        reject(self.opened, reason)
+        resolve(self.closed, reason)
+
+
+class PikaAsyncChannel(BaseAsyncBrokerChannel):
+    """Class for asyncio broker channel."""
+
+    def __init__(self, channel):
+        """Initialize the channel.
+
+        :param channel (pika.channel.Channel): The open channel of pika.
+        """
+        self.channel = channel
+
+    async def queue_declare(self, queue, durable, arguments=None):
+        """Declare queue for broker channel.
+
+        :param queue (str): The queue to declare.
+        :param durable (bool): Whether the queue is durable or not.
+        :param arguments (dict): The optional arguments of the queue, like x-message-ttl.
+        """
+        declared = asyncio.get_event_loop().create_future()
+        self.channel.queue_declare(
+            queue,
+            durable=durable,
+            arguments=arguments,
+            callback=lambda frame: resolve(declared, frame),
+        )
+        await declared
+
+    async def basic_qos(self, prefetch_count):
+        """Limit the number of unacknowledged messages.
+
+        :param prefetch_count (int): The maximum number of unacknowledged messages.
+        """
+        done = asyncio.get_event_loop().create_future()
+        self.channel.basic_qos(
+            prefetch_count=prefetch_count, callback=lambda frame: resolve(done, frame)
+        )
+        await done
+
+    def basic_consume(self, queue, callback):
+        """Consume messages from broker.
+
+        :param queue (str): The queue to consume messages from.
+        :param callback (function): The callback function to call when a message is received.
+        :return (str): The consumer tag.
+        """
+        return self.channel.basic_consume(
+            queue,
+            lambda ch, method, properties, body: callback(
+                self, method, properties, body
+            ),
+        )
+
+    def basic_cancel(self, consumer_tag):
+        """Cancel a consumer.
+
+        :param consumer_tag (str): The consumer tag returned by basic_consume.
+        """
+        self.channel.basic_cancel(consumer_tag)
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        """Publish a message to broker.
+
+        :param exchange (str): The exchange to publish the message to.
+        :param routing_key (str): The routing key to publish the message with.
+        :param body (str): The message to publish.
+        :param properties (pika.BasicProperties): The properties of the message.
+        """
+        self.channel.basic_publish(exchange, routing_key, body, properties)
+
+    def basic_ack(self, delivery_tag):
+        """Acknowledge a message.
+
+        :param delivery_tag (int): The delivery tag of the message.
+        """
+        self.channel.basic_ack(delivery_tag=delivery_tag)
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        """Negatively acknowledge a message.
+
+        :param delivery_tag (int): The delivery tag of the message.
+        :param requeue (bool): Whether the message is requeued.
+        """
+        self.channel.basic_nack(delivery_tag=delivery_tag, requeue=requeue)
+
+    def get_properties(
+        self, delivery_mode, content_type=None, message_id=None, headers=None
+    ):
+        """Get broker properties.
+
+        :param delivery_mode (int): The delivery mode of the message.
+        :param content_type (str): The content type of the message.
+        :param message_id (str): The id of the message.
+        :param headers (dict): The headers of the message.
+        """
+        return pika.BasicProperties(
+            delivery_mode=delivery_mode,
+            content_type=content_type,
+            message_id=message_id,
+            headers=headers,
+        )
+
+
+def resolve(future, result):
+    """Set the result of a future that is not done yet.
+
+    :param future (asyncio.Future): The future.
+    :param result (object): The result.
+    """
+    if not future.done():
+        future.set_result(result)
+
+
+def reject(future, error):
+    """Set the exception of a future that is not done yet.
+
+    :param future (asyncio.Future): The future.
+    :param error (Exception): The exception.
+    """
+    if not future.done():
+        future.set_exception(
+            error if isinstance(error, BaseException) else Exception(error)
+        )
@@ -0,0 +1,266 @@
+"""Module for asyncio HTTP handler to abstract the HTTP calls."""
+
+import asyncio
+import base64
+import json
+import time
+import urllib.parse
+from abc import ABCMeta, abstractmethod
+
+
+class BaseAsyncHTTPHandler(metaclass=ABCMeta):
+    """Abstract class for asyncio HTTP handler."""
+
+    @abstractmethod
+    async def post(self, data, url, encoding="utf-8", username=None, password=None):
+        """Post data to a url.
+
+        :param data (dict): The data to post, a list is sent as is.
+        :param url (str): The url to post the data to.
+        :param encoding (str): The encoding of the data.
+        :param username (str): The username to use for basic auth.
+        :param password (str): The password to use for basic auth.
+        :return (AsyncResponse): The response from the url.
+        """
+        pass
+
+    @abstractmethod
+    async def head(self, url, encoding="utf-8"):
+        """Request only the headers of a url.
+
+        :param url (str): The url to request.
+        :param encoding (str): The encoding of the data.
+        :return (AsyncResponse): The response from the url.
+        """
+        pass
+
+    async def close(self):
+        """Close the connections of the handler."""
+        pass
+
+
+class AsyncResponse(object):
+    """Response of the asyncio HTTP handler, the body is already read."""
+
+    def __init__(self, status, reason, headers, data):
+        """Initialize the response.
+
+        :param status (int): The status code.
+        :param reason (str): The reason phrase.
+        :param headers (dict): The headers, the names are lower case.
+        :param data (bytes): The body.
+        """
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.data = data
+
+    def read(self):
+        """Return the body of the response.
+
+        :return (bytes): The body of the response.
+        """
+        return self.data
+
+
+class AsyncHTTPHandler(BaseAsyncHTTPHandler):
+    """Minimal HTTP/1.1 client on asyncio streams with persistent connections.
+
+    Like the PooledHTTPHandler, connections are reused for following requests
+    to the same host, each host has at most pool_size connections and
+    connections that were idle longer than idle_timeout are closed. Only
+    plain http is supported, which is what the change hook of buildbot
+    usually listens on.
+    """
+
+    # errors of a reused connection that was closed by the server meanwhile
+    STALE_ERRORS = (
+        asyncio.IncompleteReadError,
+        ConnectionResetError,
+        BrokenPipeError,
+    )
+
+    def __init__(self, pool_size=4, idle_timeout=60, timeout=30):
+        """Initialize the asyncio HTTP handler.
+
+        :param pool_size (int): The maximum number of connections per host.
+        :param idle_timeout (int): The time in seconds after which idle connections are closed.
+        :param timeout (int): The timeout in seconds of connects and requests.
+        """
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        # idle connections per host, the most recently used one is last
+        self.idle = {}
+        # semaphores that limit the connections per host
+        self.slots = {}
+        # basic auth headers per credentials
+        self.auth_headers = {}
+
+    async def post(self, data, url, encoding="utf-8", username=None, password=None):
+        """Post data to a url.
+
+        :param data (dict): The data to post, a list is sent as is.
+        :param url (str): The url to post the data to.
+        :param encoding (str): The encoding of the data.
+        :param username (str): The username to use for basic auth.
+        :param password (str): The password to use for basic auth.
+        :return (AsyncResponse): The response from the url.
+        """
+        if not isinstance(data, list):
+            data = [data]
+        headers = {"Content-Type": "application/json"}
+        if username is not None:
+            headers["Authorization"] = self.__auth_header(username, password, encoding)
+        return await self.request(
+            "POST", url, json.dumps(data).encode(encoding), headers
+        )
+
+    async def head(self, url, encoding="utf-8"):
+        """Request only the headers of a url.
+
+        :param url (str): The url to request.
+        :param encoding (str): The encoding of the data.
+        :return (AsyncResponse): The response from the url.
+        """
+        return await self.request("HEAD", url)
+
+    async def request(self, method, url, body=None, headers=None):
+        """Send a request over a pooled connection.
+
+        A reused connection that was closed by the server is replaced by a new
+        connection and the request is sent again.
+
+        :param method (str): The HTTP method.
+        :param url (str): The url to send the request to.
+        :param body (bytes): The body of the request.
+        :param headers (dict): The headers of the request.
+        :return (AsyncResponse): The response from the url.
+        """
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.hostname, parts.port or 80)
+        path = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+        head = "%s %s HTTP/1.1\r\nHost: %s\r\n" % (method, path, parts.netloc)
+        for name, value in (headers or {}).items():
+            head += "%s: %s\r\n" % (name, value)
+        head += "Content-Length: %d\r\n\r\n" % len(body or b"")
+        message = head.encode("latin-1") + (body or b"")
+        async with self.__slot(key):
+            while True:
+                (reader, writer), reused = await self.__acquire(key)
+                try:
+                    writer.write(message)
+                    response, keep_alive = await asyncio.wait_for(
+                        self.__read_response(reader, method), self.timeout
+                    )
+                except self.STALE_ERRORS:
+                    writer.close()
+                    if reused:
+                        continue
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                if keep_alive:
+                    self.__release(key, (reader, writer))
+                else:
+                    writer.close()
+                return response
+
+    async def close(self):
+        """Close all idle connections."""
+        idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for (reader, writer), last_used in connections:
+                writer.close()
+
+    async def __read_response(self, reader, method):
+        """Read a response.
+
+        :param reader (asyncio.StreamReader): The reader of the connection.
+        :param method (str): The method of the request.
+        :return (tuple): The response and whether the connection can be reused.
+        """
+        line = await reader.readuntil(b"\r\n")
+        status_line = line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+        version, status = status_line[0], int(status_line[1])
+        reason = status_line[2] if len(status_line) > 2 else ""
+        headers = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = headers.get("connection", "").lower() != "close" and (
+            version != "HTTP/1.0"
+        )
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            data = b""
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            data = b""
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    # skip the trailers up to the empty line
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    break
+                data += (await reader.readexactly(size + 2))[:-2]
+        elif "content-length" in headers:
+            data = await reader.readexactly(int(headers["content-length"]))
+        else:
+            data = await reader.read()
+            keep_alive = False
+        return AsyncResponse(status, reason, headers, data), keep_alive
+
+    def __slot(self, key):
+        """Return the semaphore that limits the connections to a host.
+
+        :param key (tuple): The host and port.
+        :return (asyncio.Semaphore): The semaphore.
+        """
+        if key not in self.slots:
+            self.slots[key] = asyncio.Semaphore(self.pool_size)
+        return self.slots[key]
+
+    async def __acquire(self, key):
+        """Take an idle connection to a host or open a new one.
+
+        :param key (tuple): The host and port.
+        :return (tuple): The reader and writer and whether they were used before.
+        """
+        now = time.monotonic()
+        connections = self.idle.get(key, [])
+        # the connections are sorted by last use, evict the expired ones
+        while connections and now - connections[0][1] >= self.idle_timeout:
+            connections.pop(0)[0][1].close()
+        if connections:
+            return connections.pop()[0], True
+        host, port = key
+        connection = await asyncio.wait_for(
+            asyncio.open_connection(host, port), self.timeout
+        )
+        return connection, False
+
+    def __release(self, key, connection):
+        """Return a connection to the idle connections of a host.
+
+        :param key (tuple): The host and port.
+        :param connection (tuple): The reader and writer of the connection.
+        """
+        self.idle.setdefault(key, []).append((connection, time.monotonic()))
+
+    def __auth_header(self, username, password, encoding):
+        """Return the basic auth header for the credentials.
+
+        :param username (str): The username.
+        :param password (str): The password.
+        :param encoding (str): The encoding of the credentials.
+        :return (str): The value of the Authorization header.
+        """
+        key = (username, password, encoding)
+        if key not in self.auth_headers:
+            token = ("%s:%s" % (username, password or "")).encode(encoding)
+            self.auth_headers[key] = "Basic " + base64.b64encode(token).decode("ascii")
+        return self.auth_headers[key]
@@ -1,6 +1,5 @@
 """Module for broker connection."""
 
-import pika
 from abc import ABCMeta, abstractmethod
 
 
@@ -42,27 +41,66 @@ class BaseBrokerConnection(metaclass=ABCMeta):
         """Close the connection to broker."""
         pass
 
+    @abstractmethod
+    def is_open(self):
+        """Return whether the connection to broker is open."""
+        pass
+
+    @abstractmethod
+    def add_callback_threadsafe(self, callback):
+        """Schedule a callback on the thread that runs the connection.
+
+        :param callback (function): The callback to run.
+        """
+        pass
+
 
 class BaseBrokerChannel(metaclass=ABCMeta):
     """Abstract class for broker channel."""
 
     @abstractmethod
-    def queue_declare(self, queue, durable):
+    def queue_declare(self, queue, durable, arguments=None):
         """Declare queue for broker channel.
 
         :param queue (str): The queue to declare.
         :param durable (bool): Whether the queue should be durable or not.
+        :param arguments (dict): The optional arguments of the queue, like x-message-ttl.
         """
         pass
 
     @abstractmethod
-    def basic_publish(self, exchange, routing_key, body, properties):
+    def basic_publish(self, exchange, routing_key, body, properties, mandatory=False):
         """Publish a message to broker.
 
         :param exchange (str): The exchange to publish the message to.
         :param routing_key (str): The routing key to publish the message with.
         :param body (str): The message to publish.
         :param properties (pika.BasicProperties): The properties for the message.
+        :param mandatory (bool): Whether the broker returns the message if it
+            cannot be routed to a queue.
+        """
+        pass
+
+    @abstractmethod
+    def confirm_delivery(self, on_confirm, on_return):
+        """Turn on publisher confirms without waiting for each message.
+
+        The broker numbers the published messages from 1 on and confirms them
+        asynchronously. The callbacks are called while process_data_events runs.
+
+        :param on_confirm (function): Called with (delivery_tag, multiple, ack)
+            when messages are acknowledged or negatively acknowledged. With
+            multiple, all messages up to the delivery tag are confirmed.
+        :param on_return (function): Called with the body of a mandatory message
+            that could not be routed, before its confirm.
+        """
+        pass
+
+    @abstractmethod
+    def process_data_events(self, time_limit):
+        """Wait for events of the broker, like confirms, and dispatch them.
+
+        :param time_limit (float): The maximum time in seconds to wait.
         """
         pass
 
@@ -77,14 +115,53 @@ class BaseBrokerChannel(metaclass=ABCMeta):
 
         :param queue (str): The queue to consume messages from.
         :param callback (function): The callback function to call when a message is consumed.
+        :return (str): The consumer tag.
+        """
+        pass
+
+    @abstractmethod
+    def basic_cancel(self, consumer_tag):
+        """Cancel a consumer, start_consuming returns when all consumers are cancelled.
+
+        :param consumer_tag (str): The consumer tag returned by basic_consume.
+        """
+        pass
+
+    @abstractmethod
+    def basic_qos(self, prefetch_count):
+        """Limit the number of unacknowledged messages.
+
+        :param prefetch_count (int): The maximum number of unacknowledged messages.
+        """
+        pass
+
+    @abstractmethod
+    def basic_ack(self, delivery_tag):
+        """Acknowledge a message.
+
+        :param delivery_tag (int): The delivery tag of the message.
         """
         pass
 
     @abstractmethod
-    def get_properties(self, delivery_mode):
+    def basic_nack(self, delivery_tag, requeue=True):
+        """Negatively acknowledge a message.
+
+        :param delivery_tag (int): The delivery tag of the message.
+        :param requeue (bool): Whether the message is requeued.
+        """
+        pass
+
+    @abstractmethod
+    def get_properties(
+        self, delivery_mode, content_type=None, message_id=None, headers=None
+    ):
         """Return properties for message.
 
         :param delivery_mode (int): The delivery mode for the message.
+        :param content_type (str): The content type of the message.
+        :param message_id (str): The id of the message.
+        :param headers (dict): The headers of the message.
         """
         pass
 
@@ -94,10 +171,14 @@ class PikaHandler(BaseBrokerHandler):
 
     def credentials(self, username, password):
         """Return credentials for broker connection."""
+        import pika
+
         return pika.PlainCredentials(username, password)
 
     def connection_parameters(self, host, port, virtual_host, credentials):
         """Return connection parameters for broker connection."""
+        import pika
+
         return pika.ConnectionParameters(host, port, virtual_host, credentials)
 
     def blocking_connection(self, connection_parameters):
@@ -113,6 +194,8 @@ class PikaConnection(BaseBrokerConnection):
 
         :param connection_parameters (pika.ConnectionParameters): The connection parameters for the broker connection.
         """
+        import pika
+
         self.connection = pika.BlockingConnection(connection_parameters)
 
     def channel(self):
@@ -126,6 +209,20 @@ class PikaConnection(BaseBrokerConnection):
         """Close the connection to broker."""
         self.connection.close()
 
+    def is_open(self):
+        """Return whether the connection to broker is open.
+
+        :return (bool): True if the connection is open, False otherwise.
+        """
+        return self.connection.is_open
+
+    def add_callback_threadsafe(self, callback):
+        """Schedule a callback on the thread that runs the connection.
+
+        :param callback (function): The callback to run.
+        """
+        self.connection.add_callback_threadsafe(callback)
+
 
 class PikaChannel(BaseBrokerChannel):
     """Class for broker channel."""
@@ -135,25 +232,67 @@ class PikaChannel(BaseBrokerChannel):
 
         :param connection (pika.BlockingConnection): The connection to broker.
         """
+        self.connection = connection
         self.channel = connection.channel()
 
-    def queue_declare(self, queue, durable):
+    def queue_declare(self, queue, durable, arguments=None):
         """Declare queue for broker channel.
 
         :param queue (str): The queue to declare.
         :param durable (bool): Whether the queue is durable or not.
+        :param arguments (dict): The optional arguments of the queue, like x-message-ttl.
         """
-        self.channel.queue_declare(queue, durable=durable)
+        self.channel.queue_declare(queue, durable=durable, arguments=arguments)
 
-    def basic_publish(self, exchange, routing_key, body, properties):
+    def basic_publish(self, exchange, routing_key, body, properties, mandatory=False):
         """Publish a message to broker.
 
         :param exchange (str): The exchange to publish the message to.
         :param routing_key (str): The routing key to publish the message with.
         :param body (str): The message to publish.
         :param properties (pika.BasicProperties): The properties of the message.
+        :param mandatory (bool): Whether the broker returns the message if it
+            cannot be routed to a queue.
         """
-        self.channel.basic_publish(exchange, routing_key, body, properties)
+        self.channel.basic_publish(exchange, routing_key, body, properties, mandatory)
+
+    def confirm_delivery(self, on_confirm, on_return):
+        """Turn on publisher confirms without waiting for each message.
+
+        The confirm mode of the BlockingChannel waits for the confirm of every
+        message, so the confirms are requested on the underlying channel. Its
+        callbacks run while the connection processes data events, returns are
+        dispatched before the confirm of the same message. The underlying
+        channel is the private _impl of the BlockingChannel, which pika has
+        kept throughout 1.x, hence the pika version range of pyproject.toml.
+
+        :param on_confirm (function): Called with (delivery_tag, multiple, ack).
+        :param on_return (function): Called with the body of a returned message.
+        """
+        import pika
+
+        channel = self.channel._impl
+        selected = []
+        channel.add_on_return_callback(
+            lambda ch, method, properties, body: on_return(body)
+        )
+        channel.confirm_delivery(
+            ack_nack_callback=lambda frame: on_confirm(
+                frame.method.delivery_tag,
+                frame.method.multiple,
+                isinstance(frame.method, pika.spec.Basic.Ack),
+            ),
+            callback=selected.append,
+        )
+        while not selected:
+            self.connection.process_data_events(time_limit=1)
+
+    def process_data_events(self, time_limit):
+        """Wait for events of the broker, like confirms, and dispatch them.
+
+        :param time_limit (float): The maximum time in seconds to wait.
+        """
+        self.connection.process_data_events(time_limit=time_limit)
 
     def start_consuming(self):
         """Start consuming messages from broker."""
@@ -162,14 +301,65 @@ class PikaChannel(BaseBrokerChannel):
     def basic_consume(self, queue, callback):
         """Set up consumer for broker channel.
 
+        The callback receives this channel instead of the pika channel.
+
         :param queue (str): The queue to consume messages from.
         :param callback (function): The callback function to call when a message is received.
+        :return (str): The consumer tag.
+        """
+        return self.channel.basic_consume(
+            queue,
+            lambda ch, method, properties, body: callback(
+                self, method, properties, body
+            ),
+        )
+
+    def basic_cancel(self, consumer_tag):
+        """Cancel a consumer.
+
+        Messages that were received but not dispatched yet are requeued.
+
+        :param consumer_tag (str): The consumer tag returned by basic_consume.
+        """
+        self.channel.basic_cancel(consumer_tag)
+
+    def basic_qos(self, prefetch_count):
+        """Limit the number of unacknowledged messages.
+
+        :param prefetch_count (int): The maximum number of unacknowledged messages.
+        """
+        self.channel.basic_qos(prefetch_count=prefetch_count)
+
+    def basic_ack(self, delivery_tag):
+        """Acknowledge a message.
+
+        :param delivery_tag (int): The delivery tag of the message.
+        """
+        self.channel.basic_ack(delivery_tag=delivery_tag)
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        """Negatively acknowledge a message.
+
+        :param delivery_tag (int): The delivery tag of the message.
+        :param requeue (bool): Whether the message is requeued.
         """
-        self.channel.basic_consume(queue, callback)
+        self.channel.basic_nack(delivery_tag=delivery_tag, requeue=requeue)
 
-    def get_properties(self, delivery_mode):
+    def get_properties(
+        self, delivery_mode, content_type=None, message_id=None, headers=None
+    ):
         """Get broker properties.
 
         :param delivery_mode (int): The delivery mode of the message.
+        :param content_type (str): The content type of the message.
+        :param message_id (str): The id of the message.
+        :param headers (dict): The headers of the message.
         """
-        return pika.BasicProperties(delivery_mode=delivery_mode)
+        import pika
+
+        return pika.BasicProperties(
+            delivery_mode=delivery_mode,
+            content_type=content_type,
+            message_id=message_id,
+            headers=headers,
+        )
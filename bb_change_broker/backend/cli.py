@@ -1,7 +1,13 @@
 """Abstracts the command line interface."""
+
 import sys
 
-from bb_change_broker.util.cli import check_output
+from bb_change_broker.util import cli
+from bb_change_broker.util.git import (
+    parse_commit_info,
+    parse_commit_infos,
+    split_commits,
+)
 
 
 class BaseCli(object):
@@ -11,6 +17,10 @@ class BaseCli(object):
         """Initialize the base cli."""
         pass
 
+    def close(self):
+        """Release the resources of the cli, nothing by default."""
+        pass
+
     def get_svn_commit_message(self, rev_arg, repository):
         """Get the svn message.
 
@@ -48,7 +58,13 @@ class BaseCli(object):
         pass
 
     def get_git_commits(
-        self, refname, newrev, baserev, first_parent=True, new_branch=True
+        self,
+        refname,
+        newrev,
+        baserev,
+        first_parent=True,
+        new_branch=True,
+        boundaries=None,
     ):
         """Get the git commits.
 
@@ -59,10 +75,47 @@ class BaseCli(object):
             only the first parent of a merge commit is considered.
         :param new_branch (bool): The new branch flag controls if
             only the new branch commits are considered.
+        :param boundaries (list): The commits whose history is excluded from a
+            new branch, None for the heads of all other branches.
         :return (str): The git commits.
         """
         pass
 
+    def iter_git_commits(
+        self,
+        refname,
+        newrev,
+        baserev,
+        first_parent=True,
+        new_branch=True,
+        boundaries=None,
+    ):
+        """Iterate over the git commits, see get_git_commits.
+
+        The default implementation splits the output of get_git_commits.
+
+        :param refname (str): The refname.
+        :param newrev (str): The new revision.
+        :param baserev (str): The base revision.
+        :param first_parent (bool): The first parent flag.
+        :param new_branch (bool): The new branch flag.
+        :param boundaries (list): The boundaries of a new branch.
+        :return (iterator): The lines of the git commits.
+        """
+        return iter(
+            self.get_git_commits(
+                refname, newrev, baserev, first_parent, new_branch, boundaries
+            ).split("\n")
+        )
+
+    def get_git_refs(self, prefix="refs/heads/"):
+        """Get the refs of the repository.
+
+        :param prefix (str): The prefix of the refs.
+        :return (dict): The commit of each ref by full ref name.
+        """
+        pass
+
     def get_git_merge_base(self, oldrev, newrev):
         """Get the git merge base.
 
@@ -80,6 +133,26 @@ class BaseCli(object):
         """
         pass
 
+    def get_git_commit_infos(self, revs):
+        """Get the git commit infos of several revisions.
+
+        The default implementation gets the info of each revision separately.
+
+        :param revs (list): The revisions.
+        :return (list): The git commit infos in the order of the revisions.
+        """
+        return [self.get_git_commit_info(rev) for rev in revs]
+
+    def iter_git_commit_infos(self, revs):
+        """Iterate over the parsed git commit infos of several revisions.
+
+        The default implementation parses the infos of get_git_commit_infos.
+
+        :param revs (list): The revisions.
+        :return (iterator): The CommitInfo of each revision in the order of the revisions.
+        """
+        return (parse_commit_info(info) for info in self.get_git_commit_infos(revs))
+
     def get_git_diff(self, oldrev, newrev):
         """Get the git diff.
 
@@ -93,6 +166,23 @@ class BaseCli(object):
 class DefaultCli(BaseCli):
     """Default implementation of the cli."""
 
+    def __init__(self, cwd=None):
+        """Initialize the default cli.
+
+        :param cwd (str): The working directory of the commands, None for the
+            current one. Git commands need to run in the repository.
+        """
+        self.cwd = cwd
+
+    def check_output(self, command, input=None) -> str:
+        """Execute a command in the working directory of the cli.
+
+        :param command (str): The command to execute.
+        :param input (bytes): The data to write to the stdin of the command.
+        :return (str): The output of the command.
+        """
+        return cli.check_output(command, input=input, cwd=self.cwd)
+
     def get_svn_commit_message(self, rev_arg, repository, encoding="utf-8"):
         """Get the svn message.
 
@@ -101,7 +191,7 @@ class DefaultCli(BaseCli):
         :param encoding (str): The encoding.
         :return (str): The svn commit message.
         """
-        return check_output('svnlook log %s "%s"' % (rev_arg, repository)).decode(
+        return self.check_output('svnlook log %s "%s"' % (rev_arg, repository)).decode(
             encoding
         )
 
@@ -113,9 +203,9 @@ class DefaultCli(BaseCli):
         :param encoding (str): The encoding.
         :return (str): The svn commit author.
         """
-        return check_output('svnlook author %s "%s"' % (rev_arg, repository)).decode(
-            encoding
-        )
+        return self.check_output(
+            'svnlook author %s "%s"' % (rev_arg, repository)
+        ).decode(encoding)
 
     def get_svn_commit_revision(self, rev_arg, repository, encoding="utf-8"):
         """Get the svn commit revision.
@@ -125,7 +215,7 @@ class DefaultCli(BaseCli):
         :param encoding (str): The encoding.
         :return (str): The svn commit revision.
         """
-        return check_output("svnlook youngest %s" % (repository)).decode(encoding)
+        return self.check_output("svnlook youngest %s" % (repository)).decode(encoding)
 
     def get_svn_changed(self, rev_arg, repository, encoding="utf-8"):
         """Get the svn changed.
@@ -135,9 +225,9 @@ class DefaultCli(BaseCli):
         :param encoding (str): The encoding.
         :return (str): The svn changed files list.
         """
-        return check_output("svnlook changed %s %s" % (rev_arg, repository)).decode(
-            encoding
-        )
+        return self.check_output(
+            "svnlook changed %s %s" % (rev_arg, repository)
+        ).decode(encoding)
 
     def get_git_stdin(self):
         """Get the git stdin.
@@ -154,6 +244,7 @@ class DefaultCli(BaseCli):
         first_parent=True,
         new_branch=True,
         encoding="utf-8",
+        boundaries=None,
     ):
         """Get the git commits.
 
@@ -165,21 +256,85 @@ class DefaultCli(BaseCli):
         :param new_branch (bool): The new branch flag controls if
             the branch was newly created. A different logic is used.
         :param encoding (str): The encoding.
+        :param boundaries (list): The commits whose history is excluded from a
+            new branch, None for the heads of all other branches.
         :return (str): The git commits.
         """
+        command, input = self.__git_commits_command(
+            refname, newrev, baserev, first_parent, new_branch, encoding, boundaries
+        )
+        return self.check_output(command, input=input).decode(encoding)
+
+    def iter_git_commits(
+        self,
+        refname,
+        newrev,
+        baserev,
+        first_parent=True,
+        new_branch=True,
+        encoding="utf-8",
+        boundaries=None,
+    ):
+        """Iterate over the git commits while git lists them, see get_git_commits.
+
+        :param refname (str): The refname.
+        :param newrev (str): The new revision.
+        :param baserev (str): The base revision.
+        :param first_parent (bool): The first parent flag.
+        :param new_branch (bool): The new branch flag.
+        :param encoding (str): The encoding.
+        :param boundaries (list): The boundaries of a new branch.
+        :return (iterator): The lines of the git commits.
+        """
+        command, input = self.__git_commits_command(
+            refname, newrev, baserev, first_parent, new_branch, encoding, boundaries
+        )
+        return (
+            line.decode(encoding)
+            for line in cli.iter_output_lines(command, input=input, cwd=self.cwd)
+        )
+
+    def __git_commits_command(
+        self, refname, newrev, baserev, first_parent, new_branch, encoding, boundaries
+    ):
+        """Return the rev-list command that lists the git commits.
+
+        :param refname (str): The refname.
+        :param newrev (str): The new revision.
+        :param baserev (str): The base revision.
+        :param first_parent (bool): The first parent flag.
+        :param new_branch (bool): The new branch flag.
+        :param encoding (str): The encoding.
+        :param boundaries (list): The boundaries of a new branch, None for all
+            other branches.
+        :return (tuple): The command and its input, None if it reads no input.
+        """
+        if new_branch and boundaries is not None:
+            return (
+                "git rev-list --reverse --pretty=oneline --stdin %s" % newrev,
+                "".join("^%s\n" % sha for sha in boundaries).encode(encoding),
+            )
         if new_branch:
-            return check_output(
-                "git rev-parse --not --branches"
-                + "| grep -v $(git rev-parse %s)" % refname
-                + "| git rev-list --reverse --pretty=oneline --stdin %s" % newrev,
-            ).decode(encoding)
-        else:
-            options = (
-                "--reverse --pretty=oneline" + " --first-parent" if first_parent else ""
+            # exclude the commits of all other branches, the new branch itself
+            # already points to newrev
+            current = (
+                self.check_output("git rev-parse %s" % refname).decode(encoding).strip()
             )
-            return check_output(
-                "git rev-list %s %s..%s" % (options, baserev, newrev)
-            ).decode(encoding)
+            boundaries = [
+                line
+                for line in self.check_output("git rev-parse --not --branches")
+                .decode(encoding)
+                .split()
+                if line != "^" + current
+            ]
+            return (
+                "git rev-list --reverse --pretty=oneline --stdin %s" % newrev,
+                "\n".join(boundaries).encode(encoding),
+            )
+        options = "--reverse --pretty=oneline" + (
+            " --first-parent" if first_parent else ""
+        )
+        return "git rev-list %s %s..%s" % (options, baserev, newrev), None
 
     def get_git_merge_base(self, oldrev, newrev, encoding="utf-8"):
         """Get the git merge base.
@@ -190,11 +345,27 @@ class DefaultCli(BaseCli):
         :return (str): The git merge base.
         """
         return (
-            check_output("git merge-base %s %s" % (oldrev, newrev))
+            self.check_output("git merge-base %s %s" % (oldrev, newrev))
             .decode(encoding)
             .strip()
         )
 
+    def get_git_refs(self, prefix="refs/heads/", encoding="utf-8"):
+        """Get the refs of the repository like git for-each-ref.
+
+        :param prefix (str): The prefix of the refs.
+        :param encoding (str): The encoding.
+        :return (dict): The commit of each ref by full ref name.
+        """
+        output = self.check_output(
+            "git for-each-ref --format='%%(objectname) %%(refname)' %s" % prefix
+        ).decode(encoding)
+        refs = {}
+        for line in output.splitlines():
+            sha, refname = line.split(" ", 1)
+            refs[refname] = sha
+        return refs
+
     def get_git_commit_info(self, rev, encoding="utf-8"):
         """Get the git commit info.
 
@@ -202,7 +373,70 @@ class DefaultCli(BaseCli):
         :param encoding (str): The encoding.
         :return (str): The git commit info.
         """
-        return check_output("git show --raw --pretty=full %s" % rev).decode(encoding)
+        return self.check_output("git show --raw --pretty=full %s" % rev).decode(
+            encoding
+        )
+
+    def get_git_commit_infos(self, revs, encoding="utf-8", chunk_size=500):
+        """Get the git commit infos of several revisions.
+
+        Runs one git show for up to chunk_size revisions instead of one per revision.
+
+        :param revs (list): The revisions.
+        :param encoding (str): The encoding.
+        :param chunk_size (int): The maximum number of revisions per git call.
+        :return (list): The git commit infos in the order of the revisions.
+        """
+        # git show prints each commit only once
+        unique_revs = list(dict.fromkeys(revs))
+        infos = []
+        for start in range(0, len(unique_revs), chunk_size):
+            chunk = unique_revs[start : start + chunk_size]
+            output = self.check_output(
+                "git show --raw --pretty=full %s" % " ".join(chunk)
+            ).decode(encoding)
+            infos.extend(split_commits(output))
+        if len(infos) != len(unique_revs):
+            raise ValueError(
+                "Expected %d commits from git show, got %d"
+                % (len(unique_revs), len(infos))
+            )
+        infos_by_rev = dict(zip(unique_revs, infos))
+        return [infos_by_rev[rev] for rev in revs]
+
+    def iter_git_commit_infos(self, revs, encoding="utf-8", chunk_size=500):
+        """Iterate over the parsed git commit infos while git shows them.
+
+        The output of git show is parsed line by line, a commit is available
+        as soon as git printed it.
+
+        :param revs (list): The revisions.
+        :param encoding (str): The encoding.
+        :param chunk_size (int): The maximum number of revisions per git call.
+        :return (iterator): The CommitInfo of each revision in the order of the revisions.
+        """
+        for start in range(0, len(revs), chunk_size):
+            chunk = revs[start : start + chunk_size]
+            # git show prints each commit only once
+            unique_revs = list(dict.fromkeys(chunk))
+            lines = cli.iter_output_lines(
+                "git show --raw --pretty=full %s" % " ".join(unique_revs), cwd=self.cwd
+            )
+            if len(unique_revs) == len(chunk):
+                infos = parse_commit_infos(lines, encoding)
+            else:
+                infos_by_rev = dict(
+                    zip(unique_revs, parse_commit_infos(lines, encoding))
+                )
+                infos = (infos_by_rev[rev] for rev in chunk if rev in infos_by_rev)
+            count = 0
+            for info in infos:
+                count += 1
+                yield info
+            if count != len(chunk):
+                raise ValueError(
+                    "Expected %d commits from git show, got %d" % (len(chunk), count)
+                )
 
     def get_git_diff(self, oldrev, newrev, encoding="utf-8"):
         """Get the git diff.
@@ -212,6 +446,6 @@ class DefaultCli(BaseCli):
         :param encoding (str): The encoding.
         :return (str): The git diff.
         """
-        return check_output("git diff --raw %s..%s" % (oldrev, newrev)).decode(
+        return self.check_output("git diff --raw %s..%s" % (oldrev, newrev)).decode(
             encoding
         )
@@ -1,7 +1,11 @@
 """HTTP handler to abstract the HTTP calls."""
 
+import base64
+import http.client
 import json
-import urllib.request
+import threading
+import time
+import urllib.parse
 from abc import ABCMeta, abstractmethod
 
 
@@ -12,7 +16,7 @@ class BaseHTTPHandler(object, metaclass=ABCMeta):
     def post(self, data, url, encoding="utf-8", username=None, password=None):
         """Send data to a url.
 
-        :param data (dict): The data to send.
+        :param data (dict): The data to send, a list is sent as is.
         :param url (str): The url to send the data to.
         :param encoding (str): The encoding of the data.
         :param username (str): The username to use for basic auth.
@@ -31,6 +35,20 @@ class BaseHTTPHandler(object, metaclass=ABCMeta):
         """
         pass
 
+    @abstractmethod
+    def head(self, url, encoding="utf-8"):
+        """Request only the headers of a url.
+
+        :param url (str): The url to request.
+        :param encoding (str): The encoding of the data.
+        :return (HTTPResponse): The response from the url.
+        """
+        pass
+
+    def close(self):
+        """Close the connections of the handler."""
+        pass
+
 
 class DefaultHTTPHandler(BaseHTTPHandler):
     """HTTP handler to abstract the HTTP calls."""
@@ -38,15 +56,21 @@ class DefaultHTTPHandler(BaseHTTPHandler):
     def post(self, data, url, encoding="utf-8", username=None, password=None):
         """Post data to a url.
 
-        :param data (dict): The data to post.
+        :param data (dict): The data to post, a list is sent as is.
         :param url (str): The url to post the data to.
         :param encoding (str): The encoding of the data.
         :param username (str): The username to use for basic auth.
         :param password (str): The password to use for basic auth.
         :return (HTTPResponse): The response from the url.
         """
+        # urllib.request is only imported by the handler that uses it, the
+        # pooled handler is the one that the client and the server run
+        import urllib.request
+
+        if not isinstance(data, list):
+            data = [data]
         req = urllib.request.Request(
-            url, data=json.dumps([data]).encode(encoding), method="POST"
+            url, data=json.dumps(data).encode(encoding), method="POST"
         )
         password_mgr = urllib.request.HTTPPasswordMgrWithDefaultRealm()
         password_mgr.add_password(None, url, username, password)
@@ -62,6 +86,215 @@ class DefaultHTTPHandler(BaseHTTPHandler):
         :param encoding (str): The encoding of the data.
         :return (HTTPResponse): The response from the url.
         """
+        import urllib.request
+
         req = urllib.request.Request(url, method="GET")
         resp = urllib.request.urlopen(req)
         return resp
+
+    def head(self, url, encoding="utf-8"):
+        """Request only the headers of a url.
+
+        :param url (str): The url to request.
+        :param encoding (str): The encoding of the data.
+        :return (HTTPResponse): The response from the url.
+        """
+        import urllib.request
+
+        req = urllib.request.Request(url, method="HEAD")
+        resp = urllib.request.urlopen(req)
+        return resp
+
+
+class PooledResponse(object):
+    """Response of the pooled HTTP handler, the body is already read."""
+
+    def __init__(self, response):
+        """Initialize the response.
+
+        :param response (http.client.HTTPResponse): The response to read.
+        """
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self.data = response.read()
+
+    def read(self):
+        """Return the body of the response.
+
+        :return (bytes): The body of the response.
+        """
+        return self.data
+
+
+class PooledHTTPHandler(BaseHTTPHandler):
+    """HTTP handler that keeps persistent connections to each host.
+
+    Connections are reused for following requests to the same host. The
+    handler is thread safe, each host has at most pool_size connections and
+    connections that were idle longer than idle_timeout are closed.
+    """
+
+    # errors of a reused connection that was closed by the server meanwhile
+    STALE_ERRORS = (
+        http.client.RemoteDisconnected,
+        http.client.BadStatusLine,
+        ConnectionResetError,
+        BrokenPipeError,
+    )
+
+    def __init__(self, pool_size=4, idle_timeout=60, timeout=30):
+        """Initialize the pooled HTTP handler.
+
+        :param pool_size (int): The maximum number of connections per host.
+        :param idle_timeout (int): The time in seconds after which idle connections are closed.
+        :param timeout (int): The timeout in seconds of connects and requests.
+        """
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        # idle connections per host, the most recently used one is last
+        self.idle = {}
+        # semaphores that limit the connections per host
+        self.slots = {}
+        # basic auth headers per credentials
+        self.auth_headers = {}
+
+    def post(self, data, url, encoding="utf-8", username=None, password=None):
+        """Post data to a url.
+
+        :param data (dict): The data to post, a list is sent as is.
+        :param url (str): The url to post the data to.
+        :param encoding (str): The encoding of the data.
+        :param username (str): The username to use for basic auth.
+        :param password (str): The password to use for basic auth.
+        :return (PooledResponse): The response from the url.
+        """
+        if not isinstance(data, list):
+            data = [data]
+        headers = {"Content-Type": "application/json"}
+        if username is not None:
+            headers["Authorization"] = self.__auth_header(username, password, encoding)
+        return self.request("POST", url, json.dumps(data).encode(encoding), headers)
+
+    def get(self, url, encoding="utf-8"):
+        """Get data from a url.
+
+        :param url (str): The url to get the data from.
+        :param encoding (str): The encoding of the data.
+        :return (PooledResponse): The response from the url.
+        """
+        return self.request("GET", url)
+
+    def head(self, url, encoding="utf-8"):
+        """Request only the headers of a url.
+
+        :param url (str): The url to request.
+        :param encoding (str): The encoding of the data.
+        :return (PooledResponse): The response from the url.
+        """
+        return self.request("HEAD", url)
+
+    def request(self, method, url, body=None, headers=None):
+        """Send a request over a pooled connection.
+
+        A reused connection that was closed by the server is replaced by a new
+        connection and the request is sent again.
+
+        :param method (str): The HTTP method.
+        :param url (str): The url to send the request to.
+        :param body (bytes): The body of the request.
+        :param headers (dict): The headers of the request.
+        :return (PooledResponse): The response from the url.
+        """
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+        slot = self.__slot(key)
+        with slot:
+            while True:
+                connection, reused = self.__acquire(key)
+                try:
+                    connection.request(method, path, body=body, headers=headers or {})
+                    response = PooledResponse(connection.getresponse())
+                except self.STALE_ERRORS:
+                    connection.close()
+                    if reused:
+                        continue
+                    raise
+                except Exception:
+                    connection.close()
+                    raise
+                if response.headers.get("Connection", "").lower() == "close":
+                    connection.close()
+                else:
+                    self.__release(key, connection)
+                return response
+
+    def close(self):
+        """Close all idle connections."""
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for connection, last_used in connections:
+                connection.close()
+
+    def __slot(self, key):
+        """Return the semaphore that limits the connections to a host.
+
+        :param key (tuple): The scheme, host and port.
+        :return (threading.BoundedSemaphore): The semaphore.
+        """
+        with self.lock:
+            if key not in self.slots:
+                self.slots[key] = threading.BoundedSemaphore(self.pool_size)
+            return self.slots[key]
+
+    def __acquire(self, key):
+        """Take an idle connection to a host or open a new one.
+
+        :param key (tuple): The scheme, host and port.
+        :return (tuple): The connection and whether it was used before.
+        """
+        now = time.monotonic()
+        expired = []
+        connection = None
+        with self.lock:
+            connections = self.idle.get(key, [])
+            # the connections are sorted by last use, evict the expired ones
+            while connections and now - connections[0][1] >= self.idle_timeout:
+                expired.append(connections.pop(0)[0])
+            if connections:
+                connection = connections.pop()[0]
+        for candidate in expired:
+            candidate.close()
+        if connection is not None:
+            return connection, True
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout), False
+        return http.client.HTTPConnection(host, port, timeout=self.timeout), False
+
+    def __release(self, key, connection):
+        """Return a connection to the idle connections of a host.
+
+        :param key (tuple): The scheme, host and port.
+        :param connection (http.client.HTTPConnection): The connection.
+        """
+        with self.lock:
+            self.idle.setdefault(key, []).append((connection, time.monotonic()))
+
+    def __auth_header(self, username, password, encoding):
+        """Return the basic auth header for the credentials.
+
+        :param username (str): The username.
+        :param password (str): The password.
+        :param encoding (str): The encoding of the credentials.
+        :return (str): The value of the Authorization header.
+        """
+        key = (username, password, encoding)
+        if key not in self.auth_headers:
+            token = ("%s:%s" % (username, password or "")).encode(encoding)
+            self.auth_headers[key] = "Basic " + base64.b64encode(token).decode("ascii")
+        return self.auth_headers[key]
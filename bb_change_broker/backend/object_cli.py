@@ -0,0 +1,537 @@
+"""Cli that reads the git objects in the process instead of running git."""
+
+import heapq
+
+from bb_change_broker.backend.cli import DefaultCli
+from bb_change_broker.util.cache import LRUCache
+from bb_change_broker.util.git import CommitInfo
+from bb_change_broker.util.git_objects import (
+    Commit,
+    ObjectStore,
+    find_git_dir,
+    parse_tree,
+)
+
+# the type bits of a mode
+MODE_TYPE = 0o170000
+MODE_TREE = 0o040000
+ZERO_SHA = "0" * 40
+
+# flags of the commit walks
+PARENT1 = 1
+PARENT2 = 2
+STALE = 4
+
+# number of commits walked after only uninteresting ones are left, like git
+# does to tolerate clock skew
+SLOP = 5
+
+# number of parsed trees kept, a commit compares the trees of its parent
+TREE_CACHE_SIZE = 256
+
+# number of parsed commits kept, the walks of a push visit each commit a few times
+COMMIT_CACHE_SIZE = 16384
+
+
+class ObjectCli(DefaultCli):
+    """Implementation of the git methods of the cli on the objects of the repository.
+
+    Loose objects and packs are read directly, so a push does not spawn any
+    git process. The output has the format of the git commands of the
+    DefaultCli, with these differences: renames are listed as deleted and
+    added file, paths are not quoted, and .mailmap is not applied. The svn
+    methods are those of the DefaultCli.
+    """
+
+    def __init__(self, cwd=None, cache_size=4096):
+        """Initialize the object cli.
+
+        :param cwd (str): The directory of the repository, None for the current
+            one. The git directory is searched like git does.
+        :param cache_size (int): The number of delta bases kept in memory.
+        """
+        super().__init__(cwd=cwd)
+        self.cache_size = cache_size
+        self.store = None
+        # recently parsed commits by hex id
+        self.commits = LRUCache(COMMIT_CACHE_SIZE)
+        # entries of recently compared trees by hex id
+        self.trees = LRUCache(TREE_CACHE_SIZE)
+
+    def close(self):
+        """Close the packs of the repository."""
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def get_git_commits(
+        self,
+        refname,
+        newrev,
+        baserev,
+        first_parent=True,
+        new_branch=True,
+        encoding="utf-8",
+        boundaries=None,
+    ):
+        """Get the git commits like git rev-list --reverse --pretty=oneline.
+
+        :param refname (str): The refname.
+        :param newrev (str): The new revision.
+        :param baserev (str): The base revision.
+        :param first_parent (bool): The first parent flag controls if
+            only the first parent of a merge commit is considered.
+        :param new_branch (bool): The new branch flag controls if
+            the branch was newly created. A different logic is used.
+        :param encoding (str): The encoding.
+        :param boundaries (list): The commits whose history is excluded from a
+            new branch, None for the heads of all other branches.
+        :return (str): The git commits.
+        """
+        return "\n".join(
+            self.iter_git_commits(
+                refname, newrev, baserev, first_parent, new_branch, encoding, boundaries
+            )
+        )
+
+    def iter_git_commits(
+        self,
+        refname,
+        newrev,
+        baserev,
+        first_parent=True,
+        new_branch=True,
+        encoding="utf-8",
+        boundaries=None,
+    ):
+        """Iterate over the git commits, see get_git_commits.
+
+        :param refname (str): The refname.
+        :param newrev (str): The new revision.
+        :param baserev (str): The base revision.
+        :param first_parent (bool): The first parent flag.
+        :param new_branch (bool): The new branch flag.
+        :param encoding (str): The encoding.
+        :param boundaries (list): The boundaries of a new branch.
+        :return (iterator): The lines of the git commits.
+        """
+        store = self.__get_store()
+        if new_branch and boundaries is not None:
+            commits = self.__rev_list([store.resolve(newrev)], list(boundaries), False)
+        elif new_branch:
+            # exclude the commits of all other branches, the new branch itself
+            # already points to newrev
+            current = store.resolve(refname)
+            exclude = [sha for sha in store.refs().values() if sha != current]
+            commits = self.__rev_list([store.resolve(newrev)], exclude, False)
+        else:
+            commits = self.__rev_list(
+                [store.resolve(newrev)], [store.resolve(baserev)], first_parent
+            )
+        for sha in reversed(commits):
+            yield "%s %s" % (sha, self.__subject(self.__get_commit(sha), encoding))
+
+    def get_git_merge_base(self, oldrev, newrev, encoding="utf-8"):
+        """Get the git merge base.
+
+        :param oldrev (str): The old revision.
+        :param newrev (str): The new revision.
+        :param encoding (str): The encoding.
+        :return (str): The git merge base, empty if there is none.
+        """
+        store = self.__get_store()
+        bases = self.__merge_bases(store.resolve(oldrev), store.resolve(newrev))
+        return bases[0] if bases else ""
+
+    def get_git_refs(self, prefix="refs/heads/", encoding="utf-8"):
+        """Get the refs of the repository like git for-each-ref.
+
+        :param prefix (str): The prefix of the refs.
+        :param encoding (str): Unused, ref names are read as text.
+        :return (dict): The commit of each ref by full ref name.
+        """
+        return self.__get_store().refs(prefix)
+
+    def get_git_commit_info(self, rev, encoding="utf-8"):
+        """Get the git commit info like git show --raw --pretty=full.
+
+        :param rev (str): The revision.
+        :param encoding (str): The encoding.
+        :return (str): The git commit info.
+        """
+        commit = self.__get_commit(self.__get_store().resolve(rev))
+        lines = ["commit %s" % commit.sha]
+        if len(commit.parents) > 1:
+            lines.append("Merge: %s" % " ".join(p[:7] for p in commit.parents))
+        lines.append("Author: %s" % self.__identity(commit.author, encoding))
+        lines.append("Commit: %s" % self.__identity(commit.committer, encoding))
+        lines.append("")
+        lines.extend("    " + line for line in self.__message_lines(commit, encoding))
+        lines.append("")
+        lines.extend(self.__raw_lines(self.__commit_diff(commit), encoding))
+        return "\n".join(lines) + "\n"
+
+    def get_git_commit_infos(self, revs, encoding="utf-8", chunk_size=500):
+        """Get the git commit infos of several revisions.
+
+        :param revs (list): The revisions.
+        :param encoding (str): The encoding.
+        :param chunk_size (int): Unused, no git process is started.
+        :return (list): The git commit infos in the order of the revisions.
+        """
+        return [self.get_git_commit_info(rev, encoding) for rev in revs]
+
+    def iter_git_commit_infos(self, revs, encoding="utf-8", chunk_size=500):
+        """Iterate over the parsed git commit infos of several revisions.
+
+        The CommitInfo is built from the objects without formatting and
+        parsing the output of git show.
+
+        :param revs (list): The revisions.
+        :param encoding (str): The encoding.
+        :param chunk_size (int): Unused, no git process is started.
+        :return (iterator): The CommitInfo of each revision in the order of the revisions.
+        """
+        store = self.__get_store()
+        for rev in revs:
+            commit = self.__get_commit(store.resolve(rev))
+            info = CommitInfo(commit.sha)
+            info.author = self.__identity(commit.author, encoding)
+            if len(commit.parents) > 1:
+                info.merge = True
+                info.files.append("merge")
+            info.comments = self.__message_lines(commit, encoding)
+            for line in self.__raw_lines(self.__commit_diff(commit), encoding):
+                info.add_line(line)
+            yield info
+
+    def get_git_diff(self, oldrev, newrev, encoding="utf-8"):
+        """Get the git diff like git diff --raw.
+
+        :param oldrev (str): The old revision.
+        :param newrev (str): The new revision.
+        :param encoding (str): The encoding.
+        :return (str): The git diff.
+        """
+        store = self.__get_store()
+        old = self.__get_commit(store.resolve(oldrev))
+        new = self.__get_commit(store.resolve(newrev))
+        return "".join(
+            line + "\n"
+            for line in self.__raw_lines(
+                [(entry, None) for entry in self.__diff_trees(old.tree, new.tree)],
+                encoding,
+            )
+        )
+
+    def __get_store(self):
+        """Return the object store, it is opened on first use.
+
+        :return (ObjectStore): The object store.
+        """
+        if self.store is None:
+            self.store = ObjectStore(find_git_dir(self.cwd), self.cache_size)
+        return self.store
+
+    def __get_commit(self, sha):
+        """Return a parsed commit.
+
+        :param sha (str): The hex id of the commit.
+        :return (Commit): The commit.
+        """
+        commit = self.commits.get(sha)
+        if commit is None:
+            kind, data = self.__get_store().read(sha)
+            if kind != "commit":
+                raise ValueError("Object %s is a %s, not a commit" % (sha, kind))
+            commit = Commit(sha, data)
+            self.commits.put(sha, commit)
+        return commit
+
+    def __rev_list(self, include, exclude, first_parent):
+        """List the commits reachable from include but not from exclude.
+
+        Like git rev-list, the commits are walked newest first by commit date
+        and the walk stops when only commits reachable from exclude are left.
+
+        :param include (list): The hex ids of the commits to list.
+        :param exclude (list): The hex ids of the commits whose history is excluded.
+        :param first_parent (bool): Whether only first parents of included
+            commits are followed.
+        :return (list): The hex ids, newest first.
+        """
+        uninteresting = set()
+        # commits whose parents are known, git passes marks on through them
+        parsed = set(exclude) | set(include)
+        seen = set()
+        # queued commits that are not known to be uninteresting yet
+        queued = set()
+        queue = []
+        counter = 0
+
+        def push(sha):
+            nonlocal counter
+            if sha in seen:
+                return
+            seen.add(sha)
+            if sha not in uninteresting:
+                queued.add(sha)
+            counter += 1
+            heapq.heappush(queue, (-self.__get_commit(sha).date, counter, sha))
+
+        def mark_parents(sha):
+            stack = list(self.__get_commit(sha).parents)
+            while stack:
+                sha = stack.pop()
+                if sha in uninteresting:
+                    continue
+                uninteresting.add(sha)
+                queued.discard(sha)
+                if sha in parsed:
+                    stack.extend(self.__get_commit(sha).parents)
+
+        uninteresting.update(exclude)
+        for sha in exclude:
+            mark_parents(sha)
+        for sha in exclude + include:
+            push(sha)
+        result = []
+        slop = SLOP
+        # date of the last listed commit, the walk goes on while newer
+        # commits are queued
+        date = None
+        while queue:
+            _, _, sha = heapq.heappop(queue)
+            queued.discard(sha)
+            commit = self.__get_commit(sha)
+            if sha in uninteresting:
+                for parent in commit.parents:
+                    uninteresting.add(parent)
+                    queued.discard(parent)
+                    parsed.add(parent)
+                    mark_parents(parent)
+                    push(parent)
+                if not queue:
+                    break
+                if (date is not None and date <= -queue[0][0]) or queued:
+                    slop = SLOP
+                else:
+                    slop -= 1
+                    if not slop:
+                        break
+                continue
+            date = commit.date
+            result.append(sha)
+            for parent in commit.parents[:1] if first_parent else commit.parents:
+                parsed.add(parent)
+                push(parent)
+        return [sha for sha in result if sha not in uninteresting]
+
+    def __merge_bases(self, one, two):
+        """Find the best common ancestors of two commits.
+
+        :param one (str): The hex id of the first commit.
+        :param two (str): The hex id of the second commit.
+        :return (list): The hex ids of the merge bases, newest first.
+        """
+        if one == two:
+            return [one]
+        flags = {one: PARENT1, two: PARENT2}
+        queue = []
+        counter = 0
+        for sha in (one, two):
+            counter += 1
+            heapq.heappush(queue, (-self.__get_commit(sha).date, counter, sha))
+        result = []
+        while any(not flags[sha] & STALE for _, _, sha in queue):
+            _, _, sha = heapq.heappop(queue)
+            commit_flags = flags[sha] & (PARENT1 | PARENT2 | STALE)
+            if commit_flags & (PARENT1 | PARENT2) == PARENT1 | PARENT2:
+                if not commit_flags & STALE and sha not in result:
+                    result.append(sha)
+                commit_flags |= STALE
+            for parent in self.__get_commit(sha).parents:
+                if flags.get(parent, 0) & commit_flags == commit_flags:
+                    continue
+                flags[parent] = flags.get(parent, 0) | commit_flags
+                counter += 1
+                heapq.heappush(
+                    queue, (-self.__get_commit(parent).date, counter, parent)
+                )
+        # drop bases that are ancestors of other bases, the others are
+        # sorted by date like git does
+        bases = [
+            sha
+            for sha in result
+            if not any(
+                other != sha and self.__merge_bases(sha, other) == [sha]
+                for other in result
+            )
+        ]
+        bases.sort(key=lambda sha: -self.__get_commit(sha).date)
+        return bases
+
+    def __commit_diff(self, commit):
+        """Return the changes of a commit like git show --raw.
+
+        A merge lists the files that differ from all parents, like the
+        combined diff of git.
+
+        :param commit (Commit): The commit.
+        :return (list): The changes as (entry, combined) tuples, see __raw_lines.
+        """
+        if not commit.parents:
+            return [(entry, None) for entry in self.__diff_trees(None, commit.tree)]
+        if len(commit.parents) == 1:
+            parent = self.__get_commit(commit.parents[0])
+            return [
+                (entry, None) for entry in self.__diff_trees(parent.tree, commit.tree)
+            ]
+        diffs = [
+            {
+                entry[5]: entry
+                for entry in self.__diff_trees(
+                    self.__get_commit(parent).tree, commit.tree
+                )
+            }
+            for parent in commit.parents
+        ]
+        return [
+            (diffs[0][path], [diff[path] for diff in diffs])
+            for path in diffs[0]
+            if all(path in diff for diff in diffs[1:])
+        ]
+
+    def __diff_trees(self, old, new, prefix=b""):
+        """Compare two trees recursively like git diff-tree -r.
+
+        :param old (str): The hex id of the old tree, None for an empty tree.
+        :param new (str): The hex id of the new tree, None for an empty tree.
+        :param prefix (bytes): The path of the trees.
+        :return (iterator): The changed files as (old mode, new mode, old id,
+            new id, status, path) tuples in the order of git.
+        """
+        if old == new:
+            return
+        old_entries = self.__tree_entries(old)
+        new_entries = self.__tree_entries(new)
+        # only the few entries that differ are looked at, by their sort name
+        removed = {
+            self.__sort_name(entry): entry for entry in old_entries - new_entries
+        }
+        added = {self.__sort_name(entry): entry for entry in new_entries - old_entries}
+        for name in sorted(set(removed) | set(added)):
+            old_entry = removed.get(name)
+            new_entry = added.get(name)
+            path = prefix + name.rstrip(b"/")
+            if name.endswith(b"/"):
+                yield from self.__diff_trees(
+                    old_entry[2].hex() if old_entry else None,
+                    new_entry[2].hex() if new_entry else None,
+                    path + b"/",
+                )
+            elif old_entry is None:
+                yield (0, int(new_entry[0], 8), ZERO_SHA, new_entry[2].hex(), "A", path)
+            elif new_entry is None:
+                yield (int(old_entry[0], 8), 0, old_entry[2].hex(), ZERO_SHA, "D", path)
+            else:
+                old_mode = int(old_entry[0], 8)
+                new_mode = int(new_entry[0], 8)
+                yield (
+                    old_mode,
+                    new_mode,
+                    old_entry[2].hex(),
+                    new_entry[2].hex(),
+                    "M" if old_mode & MODE_TYPE == new_mode & MODE_TYPE else "T",
+                    path,
+                )
+
+    def __tree_entries(self, sha):
+        """Return the entries of a tree.
+
+        :param sha (str): The hex id of the tree, None for an empty tree.
+        :return (frozenset): The entries, see parse_tree.
+        """
+        if sha is None:
+            return frozenset()
+        entries = self.trees.get(sha)
+        if entries is None:
+            # most trees of a commit are compared again as trees of its parent
+            kind, data = self.__get_store().read(sha)
+            entries = frozenset(parse_tree(data))
+            self.trees.put(sha, entries)
+        return entries
+
+    def __sort_name(self, entry):
+        """Return the name git sorts a tree entry by.
+
+        :param entry (tuple): The entry, see parse_tree.
+        :return (bytes): The name, with a slash after the names of trees.
+        """
+        return entry[1] + b"/" if entry[0] == b"40000" else entry[1]
+
+    def __raw_lines(self, changes, encoding):
+        """Format changes like the raw output of git.
+
+        :param changes (list): The changes as (entry, combined) tuples, entry is
+            a change of __diff_trees and combined the changes of the path
+            against each parent of a merge, None for other commits.
+        :param encoding (str): The encoding of the paths.
+        :return (list): The lines.
+        """
+        lines = []
+        for entry, combined in changes:
+            path = entry[5].decode(encoding, "replace")
+            if combined is None:
+                lines.append(
+                    ":%06o %06o %s %s %s\t%s"
+                    % (entry[0], entry[1], entry[2][:7], entry[3][:7], entry[4], path)
+                )
+                continue
+            lines.append(
+                "%s%s %06o %s %s %s\t%s"
+                % (
+                    ":" * len(combined),
+                    " ".join("%06o" % change[0] for change in combined),
+                    entry[1],
+                    " ".join(change[2][:7] for change in combined),
+                    entry[3][:7],
+                    "".join(change[4] for change in combined),
+                    path,
+                )
+            )
+        return lines
+
+    def __identity(self, value, encoding):
+        """Return the name and email of an author or committer header.
+
+        :param value (bytes): The header value with timestamp and time zone.
+        :param encoding (str): The encoding.
+        :return (str): The name and email.
+        """
+        return value.rsplit(b" ", 2)[0].decode(encoding, "replace")
+
+    def __message_lines(self, commit, encoding):
+        """Return the lines of the commit message.
+
+        :param commit (Commit): The commit.
+        :param encoding (str): The encoding.
+        :return (list): The lines without trailing empty lines.
+        """
+        return commit.message.decode(encoding, "replace").rstrip("\n").split("\n")
+
+    def __subject(self, commit, encoding):
+        """Return the subject of a commit, its first paragraph on one line.
+
+        :param commit (Commit): The commit.
+        :param encoding (str): The encoding.
+        :return (str): The subject.
+        """
+        lines = []
+        for line in self.__message_lines(commit, encoding):
+            if not line.strip():
+                if lines:
+                    break
+                continue
+            lines.append(line.strip())
+        return " ".join(lines)
@@ -7,7 +7,8 @@ class BaseChangeSource(object, metaclass=ABCMeta):
     """Abstract base class for change sources.
 
     Change sources are responsible for getting changes from a source and
-    returning them as a list of changes.
+    returning them as a list of changes, or as an iterator that builds the
+    changes while they are consumed.
     """
 
     @abstractmethod
@@ -17,3 +18,29 @@ class BaseChangeSource(object, metaclass=ABCMeta):
         :return (list): A list of changes.
         """
         raise NotImplementedError
+
+    def iter_changes(self, **kwargs):
+        """Iterate over the changes of the change source.
+
+        The default implementation iterates over the list of get_changes.
+
+        :param kwargs (dict): The arguments of get_changes.
+        :return (iterator): The changes.
+        """
+        return iter(self.get_changes(**kwargs))
+
+    def record_publish(self, published):
+        """Record whether the iterated changes were published.
+
+        Change sources that track what was published update their state only
+        here, after the publish, so changes of a failed or killed publish are
+        not taken as published. The default implementation does nothing.
+
+        :param published (bool): True if the iterated changes were published,
+            False otherwise.
+        """
+        pass
+
+    def close(self):
+        """Release the resources of the change source, nothing by default."""
+        pass
@@ -1,13 +1,14 @@
 """Git change source."""
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 from bb_change_broker.change_source.base import BaseChangeSource
 from bb_change_broker.backend.cli import DefaultCli
+from bb_change_broker.util.cache import LRUCache
 from bb_change_broker.util.general import add_if_ex
 from bb_change_broker.util.git import (
-    extract_author,
-    extract_files,
     extract_files_from_diff,
-    extract_comments,
     extract_rev,
     extract_branch,
     is_zero,
@@ -23,7 +24,11 @@ class GitChangeSource(BaseChangeSource):
         logger,
         encoding="utf-8",
         first_parent=True,
-        cli=DefaultCli(),
+        cli=None,
+        jobs=1,
+        chunk_size=500,
+        cache_size=1024,
+        snapshot=None,
     ):
         """Initialize the git change source.
 
@@ -33,25 +38,64 @@ class GitChangeSource(BaseChangeSource):
         :param logger (bb_change_broker.util.log.Logger): The logger.
         :param first_parent (bool): The first parent flag controls if
             only the first parent of a merge commit is considered.
-        :param cli (object): The cli.
+        :param cli (object): The cli, None for a DefaultCli.
+        :param jobs (int): The maximum number of git commands that run in parallel.
+        :param chunk_size (int): The maximum number of commits per git show.
+        :param cache_size (int): The maximum number of merge bases kept
+            during a run.
+        :param snapshot (RefSnapshot): The snapshot of the branches that
+            bounds the commits of new branches, None to list all branches.
         """
         self.repository = repository
         self.encoding = encoding
         self.logger = logger
         self.first_parent = first_parent
-        self.cli = cli
+        self.cli = cli if cli is not None else DefaultCli()
+        self.jobs = jobs
+        self.chunk_size = chunk_size
+        self.cache_size = cache_size
+        # cache of the current run, refs updated to the same commits reuse it
+        self.merge_bases = LRUCache(cache_size)
+        self.snapshot = snapshot
+        # refs updated by the push that the boundaries of the snapshot
+        # do not contain yet, None without snapshot
+        self.pending_refs = None
+        # snapshot updates of the iterated pushes, applied once their changes
+        # are published
+        self.unpublished = []
 
-    def get_changes(self) -> list:
+    def get_changes(self, refs=None) -> list:
         """Get the changes.
 
+        :param refs (list): The updated refs as (oldrev, newrev, refname)
+            tuples, None to read them from stdin.
         :return (list): The changes.
         """
-        changes = []
+        changes = list(self.iter_changes(refs))
+        self.logger.info("got git changes: %s", changes)
+        return changes
 
+    def iter_changes(self, refs=None):
+        """Iterate over the changes while they are built.
+
+        The commits of all refs are listed first, which is cheap. Their infos
+        are fetched and parsed while the changes are consumed, so a change is
+        available before the infos of the following commits are read.
+
+        :param refs (list): The updated refs as (oldrev, newrev, refname)
+            tuples, None to read them from stdin.
+        :return (iterator): The changes.
+        """
         # XXX: Read from stdin because the git hook writes the data for each ref
         # into stdin. It is not possible to get the info which refs have
         # been updated during the latest push.
-        for oldrev, newrev, refname in self.cli.get_git_stdin():
+        if refs is None:
+            refs = self.cli.get_git_stdin()
+
+        self.merge_bases = LRUCache(self.cache_size)
+        refs, rebuilt = self.__load_snapshot(refs)
+        branches = []
+        for oldrev, newrev, refname in refs:
             branch = extract_branch(refname)
             self.logger.debug(
                 "oldrev: %s, newrev: %s, refname: %s, branch: %s",
@@ -61,11 +105,219 @@ class GitChangeSource(BaseChangeSource):
                 branch,
             )
             if branch:
-                changes.extend(
-                    self.__get_commits_by_branch(oldrev, newrev, refname, branch)
+                branches.append((oldrev, newrev, refname, branch))
+
+        # The commits of all refs are listed first and their infos are fetched
+        # afterwards, both steps run up to jobs git commands in parallel.
+        executor = ThreadPoolExecutor(max_workers=self.jobs) if self.jobs > 1 else None
+        try:
+            commits_by_branch = list(
+                self.__map(
+                    executor, lambda ref: self.__get_commits_by_branch(*ref), branches
                 )
-        self.logger.info("got git changes: %s", changes)
-        return changes
+            )
+            commits = [
+                commit for ref_commits in commits_by_branch for commit in ref_commits
+            ]
+            for change in self.__resolve_commits(executor, commits):
+                yield change
+            if self.snapshot is not None:
+                self.unpublished.append(
+                    self.__get_snapshot_update(
+                        refs, branches, commits_by_branch, rebuilt
+                    )
+                )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            self.__log_cache("merge base", self.merge_bases)
+
+    def record_publish(self, published):
+        """Apply the pushes whose changes were iterated to the snapshot.
+
+        Only pushes whose changes were iterated completely are applied, and
+        only if their publish succeeded. Otherwise the snapshot stays at the
+        published heads, and the next push or reconcile lists them again.
+
+        :param published (bool): True if the iterated changes were published,
+            False to drop the updates.
+        """
+        unpublished, self.unpublished = self.unpublished, []
+        if not published:
+            return
+        for heads, refs, covered in unpublished:
+            if heads is not None:
+                self.snapshot.rebuild(heads)
+                self.snapshot.save()
+            else:
+                self.snapshot.update(refs, covered)
+
+    def close(self):
+        """Close the cli, which releases the packs of an object cli."""
+        self.cli.close()
+
+    def get_missed_refs(self) -> list:
+        """Get the branches that changed since they were last published.
+
+        Without snapshot on disk, the current branches are taken as published.
+
+        :return (list): The missed updates as (oldrev, newrev, refname) tuples.
+        """
+        refs = self.cli.get_git_refs()
+        if not self.snapshot.load():
+            self.logger.info(
+                "No ref snapshot, taking the current branches as published"
+            )
+            self.snapshot.rebuild(refs)
+            self.snapshot.save()
+            return []
+        return self.snapshot.diff(refs)
+
+    def __load_snapshot(self, refs):
+        """Read the snapshot of the published branches before the push.
+
+        The updated branches start at their published heads, see
+        RefSnapshot.catch_up. A missing snapshot is built from all branches,
+        which already contain the push.
+
+        :param refs (list): The updated refs as (oldrev, newrev, refname) tuples.
+        :return (tuple): The refs to list and the head of each branch the
+            snapshot was rebuilt from, None if it was not rebuilt.
+        """
+        if self.snapshot is None:
+            return refs, None
+        if self.snapshot.load():
+            caught_up = self.snapshot.catch_up(refs)
+            for ref, (oldrev, newrev, refname) in zip(refs, caught_up):
+                if ref[0] != oldrev:
+                    self.logger.warning(
+                        "Missed update of %s, publishing it from %s", refname, oldrev
+                    )
+            self.pending_refs = caught_up
+            return caught_up, None
+        self.logger.warning("No ref snapshot, rebuilding it")
+        heads = self.cli.get_git_refs()
+        self.snapshot.rebuild(heads)
+        self.pending_refs = []
+        return refs, heads
+
+    def __get_snapshot_update(self, refs, branches, commits_by_branch, rebuilt):
+        """Return the update of the snapshot with the branches after the push.
+
+        :param refs (list): The updated refs as (oldrev, newrev, refname) tuples.
+        :param branches (list): The updated branches as (oldrev, newrev,
+            refname, branch) tuples.
+        :param commits_by_branch (list): The commits of each branch.
+        :param rebuilt (dict): The head of each branch the snapshot was
+            rebuilt from in this run, None if it was not rebuilt.
+        :return (tuple): The heads to rebuild the snapshot from, the refs and
+            the names of the covered branches, see RefSnapshot.update.
+        """
+        if rebuilt is not None:
+            return rebuilt, refs, set()
+        # a new branch without new commits is covered by the other branches
+        covered = {
+            refname
+            for (oldrev, newrev, refname, branch), commits in zip(
+                branches, commits_by_branch
+            )
+            if is_zero(oldrev) and not commits
+        }
+        return None, refs, covered
+
+    def __log_cache(self, name, cache):
+        """Log the hit rate of a cache of the run.
+
+        :param name (str): The name of the cache.
+        :param cache (LRUCache): The cache.
+        """
+        lookups = cache.hits + cache.misses
+        if lookups:
+            self.logger.debug(
+                "%s cache: %d hits, %d misses, hit rate %.1f%%",
+                name,
+                cache.hits,
+                cache.misses,
+                100.0 * cache.hits / lookups,
+            )
+
+    def __map(self, executor, function, items):
+        """Apply a function to each item, in parallel if there is an executor.
+
+        :param executor (ThreadPoolExecutor): The executor, None to run sequentially.
+        :param function (function): The function to apply.
+        :param items (list): The items.
+        :return (iterator): The results in the order of the items.
+        """
+        if executor is None:
+            return map(function, items)
+        return executor.map(function, items)
+
+    def __resolve_commits(self, executor, commits):
+        """Fetch the infos of the listed commits and build the changes.
+
+        :param executor (ThreadPoolExecutor): The executor, None to run sequentially.
+        :param commits (list): The complete changes and (branch, rev) tuples
+            of commits whose infos are not fetched yet.
+        :return (iterator): The changes in the order of the commits.
+        """
+        # refs that share history list the same commits, fetch them once and
+        # keep their infos until the last commit that uses them
+        uses = {}
+        for commit in commits:
+            if isinstance(commit, tuple):
+                uses[commit[1]] = uses.get(commit[1], 0) + 1
+        shown = len(uses)
+        total = sum(uses.values())
+        infos = self.__iter_commit_infos(executor, list(uses))
+        retained = {}
+        for commit in commits:
+            if not isinstance(commit, tuple):
+                yield commit
+                continue
+            branch, rev = commit
+            # the infos arrive in the order of the first use of each rev
+            commit_info = retained[rev] if rev in retained else next(infos)
+            uses[rev] -= 1
+            if uses[rev] > 0:
+                retained[rev] = commit_info
+            else:
+                retained.pop(rev, None)
+            yield self.__get_commit(branch, rev, commit_info)
+        if total:
+            self.logger.debug("commit infos: %d shown for %d uses", shown, total)
+
+    def __iter_commit_infos(self, executor, revs):
+        """Fetch the infos of commits in chunks.
+
+        Without executor, the infos are parsed while git shows them. With an
+        executor, up to jobs chunks are fetched ahead in parallel.
+
+        :param executor (ThreadPoolExecutor): The executor, None to run sequentially.
+        :param revs (list): The revisions.
+        :return (iterator): The CommitInfo of each revision in the order of the revisions.
+        """
+        # split the commits so that all jobs have work
+        size = max(1, min(self.chunk_size, -(-len(revs) // self.jobs)))
+        chunks = [revs[start : start + size] for start in range(0, len(revs), size)]
+        if executor is None:
+            for chunk in chunks:
+                for commit_info in self.cli.iter_git_commit_infos(chunk):
+                    yield commit_info
+            return
+        pending = deque()
+        for chunk in chunks:
+            if len(pending) >= self.jobs:
+                for commit_info in pending.popleft().result():
+                    yield commit_info
+            pending.append(
+                executor.submit(
+                    lambda chunk: list(self.cli.iter_git_commit_infos(chunk)), chunk
+                )
+            )
+        while pending:
+            for commit_info in pending.popleft().result():
+                yield commit_info
 
     def __get_commits_by_branch(self, oldrev, newrev, refname, branch) -> list:
         """Get the commits by branch.
@@ -95,9 +347,20 @@ class GitChangeSource(BaseChangeSource):
         :return (list): The commits.
         """
         self.logger.debug("get_commits_on_create")
-        return self.extract_commits(
-            self.cli.get_git_commits(
-                refname, newrev, None, self.first_parent, new_branch=True
+        boundaries = None
+        if self.pending_refs is not None:
+            boundaries = self.snapshot.get_boundaries(
+                self.pending_refs, refname, newrev
+            )
+            self.logger.debug("boundaries: %d", len(boundaries))
+        return self.__get_commits_from_list(
+            self.cli.iter_git_commits(
+                refname,
+                newrev,
+                None,
+                self.first_parent,
+                new_branch=True,
+                boundaries=boundaries,
             ),
             branch,
         )
@@ -113,7 +376,11 @@ class GitChangeSource(BaseChangeSource):
         """
         self.logger.debug("get_commits_on_update")
         changes = []
-        baserev = self.cli.get_git_merge_base(oldrev, newrev)
+        # refs updated to the same commits share the merge base
+        baserev = self.merge_bases.get((oldrev, newrev))
+        if baserev is None:
+            baserev = self.cli.get_git_merge_base(oldrev, newrev)
+            self.merge_bases.put((oldrev, newrev), baserev)
         self.logger.debug("baserev: %s", baserev)
         if baserev != oldrev:  # force push, first rewind to common base
             self.logger.debug("force push")
@@ -153,28 +420,39 @@ class GitChangeSource(BaseChangeSource):
         :return (list): The commits.
         """
         self.logger.debug("get_commits_between_revs")
-        input = self.cli.get_git_commits(
-            refname, newrev, baserev, self.first_parent, new_branch=False
+        return self.__get_commits_from_list(
+            self.cli.iter_git_commits(
+                refname, newrev, baserev, self.first_parent, new_branch=False
+            ),
+            branch,
         )
-        return [
-            self.__get_commit(branch, line) for line in input.split("\n") if line != ""
-        ]
 
-    def __get_commit(self, branch, line) -> dict:
+    def __get_commits_from_list(self, lines, branch) -> list:
+        """Get the commits of a rev-list output.
+
+        The infos of the commits are fetched later for all refs together.
+
+        :param lines (iterator): The lines of the rev-list output, one commit per line.
+        :param branch (str): The branch.
+        :return (list): The commits as (branch, rev) tuples.
+        """
+        return [(branch, extract_rev(line)) for line in lines if line.strip() != ""]
+
+    def __get_commit(self, branch, rev, commit_info) -> dict:
         """Get the commit.
 
         :param branch (str): The branch.
-        :param line (str): The line.
+        :param rev (str): The revision.
+        :param commit_info (CommitInfo): The parsed git show output of the commit.
         :return (dict): The commit.
         """
         self.logger.debug("get_commit")
         c = {}
-        rev = extract_rev(line)
         self.__add_commit_meta(rev, branch, c)
-        commit_info = self.cli.get_git_commit_info(rev)
-        c["author"] = extract_author(commit_info)
-        c["files"] = extract_files(commit_info)
-        c["comments"] = extract_comments(commit_info)
+        c["author"] = commit_info.author
+        # the info may be shared by several refs
+        c["files"] = list(commit_info.files)
+        c["comments"] = commit_info.get_comments()
         self.logger.debug("commit: %s", c)
         return c
 
@@ -2,6 +2,8 @@
 
 import sys
 import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from bb_change_broker.change_source.base import BaseChangeSource
 from bb_change_broker.backend.cli import DefaultCli
@@ -16,7 +18,9 @@ class SubversionChangeSource(BaseChangeSource):
         logger,
         filters,
         encoding="utf-8",
-        cli=DefaultCli(),
+        cli=None,
+        jobs=1,
+        state=None,
     ):
         """Initialize the subversion change source.
 
@@ -24,23 +28,118 @@ class SubversionChangeSource(BaseChangeSource):
         :param logger (Logger): The logger of the subversion change source.
         :param filters (str): The filters for the branch and file name extraction.
         :param encoding (str): The encoding of the subversion change source.
-        :param cli (DefaultCli): The cli of the subversion change source.
+        :param cli (DefaultCli): The cli of the subversion change source,
+            None for a DefaultCli.
+        :param jobs (int): The maximum number of revisions read in parallel.
+        :param state (RevisionState): The last published revision, None to
+            publish only the revision of the commit.
         """
         self.repository = repository
         self.logger = logger
         self.encoding = encoding
-        self.cli = cli
+        self.cli = cli if cli is not None else DefaultCli()
         self.filters = filters
+        self.jobs = jobs
+        self.state = state
+        # revisions whose changes were iterated, stored in the state once
+        # they are published
+        self.unpublished = []
 
-    def get_changes(self):
-        """Implementation of get_changes for svn change source."""
+    def get_changes(self, revision=None):
+        """Implementation of get_changes for svn change source.
+
+        :param revision (str): The revision, None for the youngest revision.
+        """
+        return list(self.iter_changes(revision))
+
+    def iter_changes(self, revision=None):
+        """Iterate over the changes of a commit.
+
+        With a state, the revisions after the last published one that failed
+        hooks skipped are published before the revision. The revision is
+        stored in the state by record_publish, once all changes were consumed
+        and published.
+
+        :param revision (str): The revision, None for the youngest revision.
+        :return (iterator): The changes.
+        """
         self.logger.info("get_changes for %s" % (self.repository,))
-        changed, changestring = self.__get_changestring("")
+        if self.state is None:
+            return iter(self.__get_revision_changes(revision))
+        return self.__iter_caught_up(revision)
+
+    def record_publish(self, published):
+        """Store the last iterated revision in the state if it was published.
+
+        :param published (bool): True if the iterated changes were published,
+            False to keep the state.
+        """
+        unpublished, self.unpublished = self.unpublished, []
+        if published and unpublished:
+            self.state.update(max(unpublished))
+
+    def iter_revisions(self, first, last):
+        """Iterate over the changes of a range of revisions in revision order.
+
+        Up to jobs revisions are read ahead in parallel.
+
+        :param first (int): The first revision.
+        :param last (int): The last revision, included.
+        :return (iterator): The changes.
+        """
+        revisions = (str(revision) for revision in range(first, last + 1))
+        if self.jobs <= 1:
+            for revision in revisions:
+                for change in self.__get_revision_changes(revision):
+                    yield change
+            return
+        executor = ThreadPoolExecutor(max_workers=self.jobs)
+        try:
+            pending = deque()
+            for revision in revisions:
+                if len(pending) >= self.jobs:
+                    for change in pending.popleft().result():
+                        yield change
+                pending.append(executor.submit(self.__get_revision_changes, revision))
+            while pending:
+                for change in pending.popleft().result():
+                    yield change
+        finally:
+            executor.shutdown()
+
+    def __iter_caught_up(self, revision):
+        """Iterate over the changes of the unpublished revisions up to a revision.
+
+        :param revision (str): The revision, None for the youngest revision.
+        :return (iterator): The changes.
+        """
+        if revision is None:
+            revision = self.cli.get_svn_commit_revision("", self.repository)
+        revision = int(revision)
+        last = self.state.load()
+        first = revision if last is None or last >= revision else last + 1
+        if first < revision:
+            self.logger.warning(
+                "Missed revisions %d to %d, publishing them" % (first, revision - 1)
+            )
+        for change in self.iter_revisions(first, revision):
+            yield change
+        self.unpublished.append(revision)
+
+    def __get_revision_changes(self, revision) -> list:
+        """Get the changes of a revision.
+
+        :param revision (str): The revision, None for the youngest revision.
+        :return (list): The changes.
+        """
+        rev_arg = "-r %s" % revision if revision is not None else ""
+        changed, changestring = self.__get_changestring(rev_arg)
         self.logger.debug("changed: %s" % (changed,))
 
-        message = self.cli.get_svn_commit_message("", self.repository)
-        who = self.cli.get_svn_commit_author("", self.repository)
-        revision = self.cli.get_svn_commit_revision("", self.repository)
+        message = self.cli.get_svn_commit_message(rev_arg, self.repository)
+        who = self.cli.get_svn_commit_author(rev_arg, self.repository)
+        if revision is None:
+            revision = self.cli.get_svn_commit_revision(rev_arg, self.repository)
         self.logger.debug(
             "message: %s, who: %s, revision: %s"
             % (message.strip(), who.strip(), revision.strip())
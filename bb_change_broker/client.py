@@ -1,21 +1,24 @@
 """Client that sends changes from change source to RabbitMQ."""
 
-import time, threading
-
-from bb_change_broker.change_source.git import GitChangeSource
-from bb_change_broker.change_source.svn import SubversionChangeSource
+from bb_change_broker.codec.registry import get_codec, DEFAULT_CODEC
 from bb_change_broker.publisher.broker import BrokerPublisher
+from bb_change_broker.backend.http_handler import PooledHTTPHandler
 from bb_change_broker.publisher.buildbot import BuildbotPublisher
+from bb_change_broker.publisher.fallback import FallbackPublisher
+from bb_change_broker.util.dedup import change_id
 from bb_change_broker.util.log import Logger
+from bb_change_broker.util.spool import Spool
 
 
 class Client:
     """Client that sends changes from change source to RabbitMQ."""
 
-    def __init__(self, config):
+    def __init__(self, config, cwd=None):
         """Initialize the client.
 
         :param config (dict): The configuration of the client.
+        :param cwd (str): The working directory of the git commands, None for
+            the current one, which is the repository when run from a hook.
         """
         self.logger = Logger(config["logging"] if "logging" in config else None)
         self.rabbitmq = BrokerPublisher(
@@ -24,6 +27,7 @@ class Client:
             username=config["rabbitmq"]["username"],
             password=config["rabbitmq"]["password"],
             logger=self.logger,
+            confirm_window=int(config["rabbitmq"].get("confirm_window", 256)),
         )
         self.buildbot = BuildbotPublisher(
             host=config["buildbot"]["host"],
@@ -31,57 +35,290 @@ class Client:
             username=config["buildbot"]["username"],
             password=config["buildbot"]["password"],
             encoding=config["DEFAULT"]["encoding"],
+            http_handler=PooledHTTPHandler(
+                pool_size=int(config["buildbot"].get("pool_size", 4)),
+                idle_timeout=int(config["buildbot"].get("idle_timeout", 60)),
+                timeout=int(config["buildbot"].get("timeout", 30)),
+            ),
             logger=self.logger,
+            availability_ttl=int(config["buildbot"].get("availability_ttl", 30)),
+            failure_threshold=int(config["buildbot"].get("failure_threshold", 3)),
         )
 
+        # only the change source of the config is imported
         if "git" in config:
+            from bb_change_broker.change_source.git import GitChangeSource
+
+            if config["git"].get("backend", "cli") == "objects":
+                from bb_change_broker.backend.object_cli import ObjectCli
+
+                cli = ObjectCli(cwd=cwd)
+            else:
+                from bb_change_broker.backend.cli import DefaultCli
+
+                cli = DefaultCli(cwd=cwd)
+            snapshot = None
+            if "snapshot" in config["git"]:
+                from bb_change_broker.util.ref_snapshot import RefSnapshot
+
+                snapshot = RefSnapshot(config["git"]["snapshot"])
             self.change_source = GitChangeSource(
                 repository=config["git"]["repository"],
                 logger=self.logger,
                 encoding=config["DEFAULT"]["encoding"],
+                cli=cli,
+                jobs=int(config["git"].get("jobs", 1)),
+                cache_size=int(config["git"].get("cache_size", 1024)),
+                snapshot=snapshot,
             )
         elif config["svn"] != None:
+            from bb_change_broker.change_source.svn import SubversionChangeSource
+
+            state = None
+            if "state" in config["svn"]:
+                from bb_change_broker.util.revision_state import RevisionState
+
+                state = RevisionState(config["svn"]["state"])
             self.change_source = SubversionChangeSource(
                 repository=config["svn"]["repository"],
                 filters=config["svn"]["branch_filters"],
                 logger=self.logger,
                 encoding=config["DEFAULT"]["encoding"],
+                jobs=int(config["svn"].get("jobs", 1)),
+                state=state,
             )
+        self.fallback = {
+            "workers": int(config["buildbot"].get("fallback_workers", 2)),
+            "batch_size": int(config["buildbot"].get("batch_size", 1)),
+            "retry_budget": int(config["buildbot"].get("fallback_retries", 3)),
+            "timeout": int(config["buildbot"].get("fallback_timeout", 30)),
+        }
         self.queue = config["rabbitmq"]["queue"]
+        self.encoding = config["DEFAULT"]["encoding"]
+        self.codec = get_codec(
+            config["rabbitmq"].get("codec", DEFAULT_CODEC),
+            encoding=config["DEFAULT"]["encoding"],
+        )
+        self.spool = (
+            Spool(
+                directory=config["spool"]["directory"],
+                logger=self.logger,
+                segment_size=int(config["spool"].get("segment_size", 16 * 1024 * 1024)),
+            )
+            if "spool" in config
+            else None
+        )
 
-    def run(self):
-        """Run the client."""
-        changes = self.change_source.get_changes()
-        for change in changes:
-            if not (
-                self.rabbitmq.publish(str(change), exchange="", routing_key=self.queue)
-            ):
+    def run(self, request=None):
+        """Run the client.
+
+        The changes are published while the change source builds them. The
+        change source takes them as published only after the publish
+        returned, see record_publish.
+
+        :param request (dict): The refs or revision to publish, see get_changes.
+        """
+        try:
+            self.__publish_and_record(self.iter_changes(request))
+        finally:
+            self.close()
+
+    def get_changes(self, request=None) -> list:
+        """Get the changes from the change source.
+
+        :param request (dict): The updated "refs" of a git push or the
+            "revision" of a svn commit. None to read them like a hook.
+        :return (list): The changes.
+        """
+        return list(self.iter_changes(request))
+
+    def iter_changes(self, request=None):
+        """Iterate over the changes of the change source while they are built.
+
+        :param request (dict): The refs or revision, see get_changes.
+        :return (iterator): The changes.
+        """
+        if request is None:
+            return self.change_source.iter_changes()
+        if "refs" in request:
+            return self.change_source.iter_changes(
+                refs=[tuple(ref) for ref in request["refs"]]
+            )
+        return self.change_source.iter_changes(revision=request["revision"])
+
+    def record_publish(self, published):
+        """Record the outcome of the publish of the iterated changes.
+
+        :param published (bool): True if the changes were published, False otherwise.
+        """
+        self.change_source.record_publish(published)
+
+    def publish(self, changes) -> bool:
+        """Publish changes to RabbitMQ.
+
+        The changes are published in chunks of the confirm window while they
+        are consumed. Changes that cannot be published are spooled if a spool
+        is configured, otherwise they are sent to Buildbot directly. After a
+        failure, the following changes take the same way, so they stay behind
+        the failed ones.
+
+        :param changes (iterable): The changes to publish, a list or an iterator.
+        :return (bool): True if all changes were published, spooled or sent
+            to Buildbot, False otherwise.
+        """
+        # older changes wait in the spool, keep the order
+        spooling = self.spool is not None and not self.spool.is_empty()
+        drain = spooling
+        failed_changes = []
+        for chunk in self.__chunks(changes, max(1, self.rabbitmq.confirm_window)):
+            messages = [self.codec.encode(change) for change in chunk]
+            if spooling:
+                self.__spool(messages)
+                continue
+            if failed_changes:
+                failed_changes.extend(chunk)
+                continue
+            failed = self.rabbitmq.publish_many(
+                messages,
+                exchange="",
+                routing_key=self.queue,
+                content_type=self.codec.content_type,
+                message_ids=[change_id(change, self.encoding) for change in chunk],
+            )
+            if failed and self.spool is not None:
                 self.logger.error(
-                    "Failed to publish change to RabbitMQ, sending to Buildbot instead."
+                    "Failed to publish %d change(s) to RabbitMQ, spooling them."
+                    % len(failed)
                 )
-                thread = threading.Thread(
-                    target=self.__buildbot_publish, args=(change, self.buildbot, 5, 1)
+                self.__spool([messages[index] for index in failed])
+                spooling = True
+            elif failed:
+                self.logger.error(
+                    "Failed to publish %d change(s) to RabbitMQ, sending to Buildbot instead."
+                    % len(failed)
                 )
-                thread.start()
+                failed_changes.extend(chunk[index] for index in failed)
+        if drain:
+            self.drain()
+        if failed_changes:
+            return self.__buildbot_publish(failed_changes)
+        return True
+
+    def close(self):
+        """Close the connections and the change source of the client."""
+        self.rabbitmq.close()
+        self.buildbot.close()
+        self.change_source.close()
+
+    def drain(self):
+        """Publish the changes of the spool to RabbitMQ.
+
+        :return (int): The number of published changes.
+        """
+        if self.spool is None:
+            self.logger.error("No spool configured, nothing to drain.")
+            return 0
+        return self.spool.drain(self.__publish_records)
+
+    def reconcile(self):
+        """Publish the updates of branches that no hook published.
+
+        The current branches are compared with the ref snapshot, the changes
+        of the branches that differ are published like those of one push.
+
+        :return (int): The number of missed ref updates.
+        """
+        if getattr(self.change_source, "snapshot", None) is None:
+            self.logger.error("No ref snapshot configured, nothing to reconcile.")
+            return 0
+        refs = self.change_source.get_missed_refs()
+        if refs:
+            self.logger.warning("Reconciling %d missed ref update(s)." % len(refs))
+            self.__publish_and_record(self.change_source.iter_changes(refs))
+        return len(refs)
+
+    def backfill(self, first, last):
+        """Publish the changes of a range of svn revisions.
+
+        The state of the last published revision is not changed.
+
+        :param first (int): The first revision.
+        :param last (int): The last revision, included.
+        """
+        if not hasattr(self.change_source, "iter_revisions"):
+            self.logger.error("Backfill needs a svn repository, nothing to publish.")
+            return
+        self.publish(self.change_source.iter_revisions(first, last))
 
-    def __buildbot_publish(self, change, buildbot, retry_timeout=5, max_retries=1):
-        """Publish a change to a Buildbot.
+    def __publish_and_record(self, changes):
+        """Publish changes and record the outcome, also if the publish raises.
 
-        :param change (Change): The change to publish.
-        :param buildbot (BuildbotPublisher): The Buildbot to publish to.
-        :param retry_timeout (int): The timeout in seconds to wait before retrying.
-        :param max_retries (int): The maximum number of retries.
+        :param changes (iterator): The changes of the change source.
         """
-        retry_counter = 0
-        while retry_counter < max_retries:
-            if buildbot.publish(change):
-                return
-            self.logger.error(
-                "Failed to publish change to Buildbot %s, waiting %s seconds and trying again."
-                % (buildbot.host, retry_timeout)
+        published = False
+        try:
+            published = self.publish(changes)
+        finally:
+            self.record_publish(published)
+
+    def __chunks(self, changes, size):
+        """Split changes into chunks while they are consumed.
+
+        :param changes (iterable): The changes.
+        :param size (int): The maximum number of changes per chunk.
+        :return (iterator): The chunks as lists.
+        """
+        chunk = []
+        for change in changes:
+            chunk.append(change)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def __spool(self, messages):
+        """Append messages to the spool.
+
+        :param messages (list): The encoded changes.
+        """
+        self.spool.append([(self.codec.content_type, message) for message in messages])
+
+    def __publish_records(self, records) -> int:
+        """Publish spooled messages to RabbitMQ.
+
+        :param records (list): The messages as (content type, body) tuples.
+        :return (int): The number of messages, counted from the start, that were published.
+        """
+        published = 0
+        while published < len(records):
+            content_type = records[published][0]
+            end = published
+            while end < len(records) and records[end][0] == content_type:
+                end += 1
+            failed = self.rabbitmq.publish_many(
+                [body for _, body in records[published:end]],
+                exchange="",
+                routing_key=self.queue,
+                content_type=content_type,
             )
-            time.sleep(retry_timeout)
-            retry_counter += 1
-        self.logger.error(
-            "Failed to publish change to Buildbot %s, exiting." % buildbot.host
+            if failed:
+                return published + min(failed)
+            published = end
+        return published
+
+    def __buildbot_publish(self, changes):
+        """Publish changes to Buildbot and wait for them up to the fallback timeout.
+
+        :param changes (list): The changes to publish.
+        :return (bool): True if all changes were sent, False otherwise.
+        """
+        fallback = FallbackPublisher(
+            self.buildbot,
+            logger=self.logger,
+            workers=self.fallback["workers"],
+            batch_size=self.fallback["batch_size"],
+            retry_budget=self.fallback["retry_budget"],
         )
+        fallback.submit(changes)
+        return fallback.wait(self.fallback["timeout"])
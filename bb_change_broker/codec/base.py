@@ -0,0 +1,67 @@
+"""Base class for wire codecs."""
+
+from abc import ABCMeta, abstractmethod
+
+
+class CodecError(Exception):
+    """Raised when a message cannot be encoded or decoded."""
+
+
+class BaseCodec(object, metaclass=ABCMeta):
+    """Abstract base class for wire codecs.
+
+    Codecs turn a change dict into the body of a broker message and back.
+    Changes are wrapped into a versioned envelope, so the format can evolve
+    without breaking clients and servers of different versions.
+    """
+
+    # name of the codec used in the configuration
+    name = None
+    # content type that is sent in the message properties
+    content_type = None
+    # version of the envelope
+    VERSION = 1
+
+    def encode(self, change) -> bytes:
+        """Encode a change.
+
+        :param change (dict): The change to encode.
+        :return (bytes): The encoded message.
+        """
+        return self.dumps({"version": self.VERSION, "change": change})
+
+    def decode(self, body) -> dict:
+        """Decode a message into a change.
+
+        :param body (bytes): The encoded message.
+        :return (dict): The change.
+        """
+        try:
+            envelope = self.loads(body)
+        except Exception as e:
+            raise CodecError("Failed to decode %s message: %s" % (self.name, e))
+        if not isinstance(envelope, dict) or "change" not in envelope:
+            raise CodecError("Message is not a %s envelope" % self.name)
+        if envelope.get("version") != self.VERSION:
+            raise CodecError(
+                "Unsupported envelope version %r" % (envelope.get("version"),)
+            )
+        return envelope["change"]
+
+    @abstractmethod
+    def dumps(self, envelope) -> bytes:
+        """Serialize an envelope.
+
+        :param envelope (dict): The envelope to serialize.
+        :return (bytes): The serialized envelope.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def loads(self, body):
+        """Deserialize an envelope.
+
+        :param body (bytes): The serialized envelope.
+        :return (dict): The envelope.
+        """
+        raise NotImplementedError
@@ -0,0 +1,49 @@
+"""JSON wire codec."""
+
+import json
+
+from bb_change_broker.codec.base import BaseCodec
+
+
+class JsonCodec(BaseCodec):
+    """Codec that encodes changes as JSON."""
+
+    name = "json"
+    content_type = "application/vnd.bb-change-broker.v1+json"
+
+    def __init__(self, encoding="utf-8"):
+        """Initialize the JSON codec.
+
+        :param encoding (str): The encoding of bytes in changes and of the message.
+        """
+        self.encoding = encoding
+
+    def dumps(self, envelope) -> bytes:
+        """Serialize an envelope to JSON.
+
+        :param envelope (dict): The envelope to serialize.
+        :return (bytes): The serialized envelope.
+        """
+        return json.dumps(
+            envelope, separators=(",", ":"), default=self.__default
+        ).encode(self.encoding)
+
+    def loads(self, body):
+        """Deserialize an envelope from JSON.
+
+        :param body (bytes): The serialized envelope.
+        :return (dict): The envelope.
+        """
+        if isinstance(body, bytes):
+            body = body.decode(self.encoding)
+        return json.loads(body)
+
+    def __default(self, value):
+        """Convert values that JSON does not support.
+
+        :param value (object): The value to convert.
+        :return (str): The converted value.
+        """
+        if isinstance(value, bytes):
+            return value.decode(self.encoding)
+        raise TypeError("%r is not JSON serializable" % (value,))
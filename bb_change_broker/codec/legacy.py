@@ -0,0 +1,63 @@
+"""Codec for the message format of clients without content type."""
+
+import ast
+
+from bb_change_broker.codec.base import BaseCodec, CodecError
+
+
+class LegacyCodec(BaseCodec):
+    """Codec for changes that are sent as Python literal without envelope.
+
+    Older clients send str(change) and no content type. The messages are
+    parsed with ast.literal_eval, so no code is executed.
+    """
+
+    name = "legacy"
+    content_type = None
+
+    def __init__(self, encoding="utf-8"):
+        """Initialize the legacy codec.
+
+        :param encoding (str): The encoding of the message.
+        """
+        self.encoding = encoding
+
+    def encode(self, change) -> bytes:
+        """Encode a change as Python literal.
+
+        :param change (dict): The change to encode.
+        :return (bytes): The encoded message.
+        """
+        return self.dumps(change)
+
+    def decode(self, body) -> dict:
+        """Decode a Python literal into a change.
+
+        :param body (bytes): The encoded message.
+        :return (dict): The change.
+        """
+        try:
+            change = self.loads(body)
+        except Exception as e:
+            raise CodecError("Failed to decode legacy message: %s" % e)
+        if not isinstance(change, (dict, list)):
+            raise CodecError("Legacy message is not a change")
+        return change
+
+    def dumps(self, envelope) -> bytes:
+        """Serialize a change as Python literal.
+
+        :param envelope (dict): The change to serialize.
+        :return (bytes): The serialized change.
+        """
+        return str(envelope).encode(self.encoding)
+
+    def loads(self, body):
+        """Parse a Python literal.
+
+        :param body (bytes): The serialized change.
+        :return (dict): The change.
+        """
+        if isinstance(body, bytes):
+            body = body.decode(self.encoding)
+        return ast.literal_eval(body)
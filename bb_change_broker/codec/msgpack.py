@@ -0,0 +1,48 @@
+"""MessagePack wire codec, only available if msgpack is installed."""
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+from bb_change_broker.codec.base import BaseCodec
+
+
+class MsgpackCodec(BaseCodec):
+    """Codec that encodes changes as MessagePack."""
+
+    name = "msgpack"
+    content_type = "application/vnd.bb-change-broker.v1+msgpack"
+
+    def __init__(self, encoding="utf-8"):
+        """Initialize the MessagePack codec.
+
+        :param encoding (str): The encoding of bytes in changes.
+        """
+        if msgpack is None:
+            raise ValueError("The msgpack codec requires the msgpack package")
+        self.encoding = encoding
+
+    @staticmethod
+    def is_available():
+        """Check if msgpack is installed.
+
+        :return (bool): True if msgpack is installed, False otherwise.
+        """
+        return msgpack is not None
+
+    def dumps(self, envelope) -> bytes:
+        """Serialize an envelope to MessagePack.
+
+        :param envelope (dict): The envelope to serialize.
+        :return (bytes): The serialized envelope.
+        """
+        return msgpack.packb(envelope, use_bin_type=False)
+
+    def loads(self, body):
+        """Deserialize an envelope from MessagePack.
+
+        :param body (bytes): The serialized envelope.
+        :return (dict): The envelope.
+        """
+        return msgpack.unpackb(body, raw=False)
@@ -0,0 +1,47 @@
+"""Lookup of wire codecs by name and content type."""
+
+from bb_change_broker.codec.json import JsonCodec
+from bb_change_broker.codec.legacy import LegacyCodec
+from bb_change_broker.codec.msgpack import MsgpackCodec
+
+CODECS = {codec.name: codec for codec in (JsonCodec, MsgpackCodec, LegacyCodec)}
+DEFAULT_CODEC = JsonCodec.name
+
+
+def get_codec(name=DEFAULT_CODEC, encoding="utf-8"):
+    """Return the codec with the given name.
+
+    :param name (str): The name of the codec.
+    :param encoding (str): The encoding of the codec.
+    :return (BaseCodec): The codec.
+    """
+    if name not in CODECS:
+        raise ValueError("Unknown codec %r" % (name,))
+    return CODECS[name](encoding=encoding)
+
+
+def get_codec_for_content_type(content_type, encoding="utf-8"):
+    """Return the codec for a message content type.
+
+    Messages without content type were sent by older clients and are
+    decoded with the legacy codec.
+
+    :param content_type (str): The content type of the message.
+    :param encoding (str): The encoding of the codec.
+    :return (BaseCodec): The codec.
+    """
+    for codec in CODECS.values():
+        if codec.content_type == content_type:
+            return codec(encoding=encoding)
+    raise ValueError("Unknown content type %r" % (content_type,))
+
+
+def decode_change(body, content_type, encoding="utf-8"):
+    """Decode a message body into a change.
+
+    :param body (bytes): The message body.
+    :param content_type (str): The content type of the message.
+    :param encoding (str): The encoding of the message.
+    :return (dict): The change.
+    """
+    return get_codec_for_content_type(content_type, encoding).decode(body)
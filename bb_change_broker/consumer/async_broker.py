@@ -0,0 +1,140 @@
+"""Module for consuming messages from broker with asyncio."""
+
+import asyncio
+
+from bb_change_broker.consumer.broker import BrokerConsumer
+
+
+class AsyncBrokerConsumer(BrokerConsumer):
+    """Asyncio counterpart of the BrokerConsumer.
+
+    Shares the retry queues with the BrokerConsumer. The callback runs on the
+    event loop and must not block, it schedules the work of a message as a
+    task. Acknowledgements and publishes can be sent from any task of the
+    loop, so no worker threads are needed.
+    """
+
+    def __init__(
+        self,
+        host,
+        port,
+        username,
+        password,
+        retry_on_disconnect=True,
+        handler=None,
+        logger=None,
+        prefetch_count=0,
+        retry_delays=(),
+    ):
+        """Initialize the broker consumer.
+
+        :param host (str): The host of the the broker.
+        :param port (int): The port of the the broker.
+        :param username (str): The username of the the broker.
+        :param password (str): The password of the the broker.
+        :param retry_on_disconnect (bool): Whether to retry on disconnect.
+            Note: This flag is only used when testing, because we need to exit the loop.
+        :param handler (BaseAsyncBrokerHandler): The handler for the broker,
+            None for a PikaAsyncHandler.
+        :param logger (Logger): The logger to use, None for a silent one.
+        :param prefetch_count (int): The maximum number of unacknowledged messages,
+            0 means no limit.
+        :param retry_delays (list): The delays in seconds before a failed message
+            is delivered again, see BrokerConsumer.
+        """
+        if handler is None:
+            from bb_change_broker.backend.async_broker import PikaAsyncHandler
+
+            handler = PikaAsyncHandler()
+        super().__init__(
+            host,
+            port,
+            username,
+            password,
+            retry_on_disconnect=retry_on_disconnect,
+            handler=handler,
+            logger=logger,
+            prefetch_count=prefetch_count,
+            retry_delays=retry_delays,
+        )
+        # created in consume, events are bound to the running loop
+        self.resumed = None
+
+    async def connect(self):
+        """Connect to broker.
+
+        :return (BaseAsyncBrokerConnection): The connection to RabbitMQ.
+        """
+        credentials = self.handler.credentials(self.username, self.password)
+        parameters = self.handler.connection_parameters(
+            self.host, self.port, "/", credentials
+        )
+        return await self.handler.connect(parameters)
+
+    async def consume(self, queue, callback, partition_key=None):
+        """Consume messages from broker until the connection is lost.
+
+        The connection is reopened after a disconnect if retry_on_disconnect
+        is set. While the consumer is paused, no connection is open.
+
+        :param queue (str): The queue to consume messages from.
+        :param callback (function): The callback function to call when a message is received.
+        :param partition_key (function): Unused, the callback orders its tasks itself.
+        """
+        self.resumed = asyncio.Event()
+        self.resumed.set()
+        retries = 0
+        while True:
+            await self.resumed.wait()
+            connection = None
+            try:
+                connection = await self.connect()
+                channel = await connection.channel()
+                # set retry to 0 when connection is successful
+                retries = 0
+                if self.prefetch_count > 0:
+                    await channel.basic_qos(prefetch_count=self.prefetch_count)
+                for name, arguments in self.retry_queues(queue):
+                    await channel.queue_declare(
+                        queue=name, durable=True, arguments=arguments
+                    )
+                consumer_tag = channel.basic_consume(queue, callback)
+                self.consumer = (connection, channel, consumer_tag)
+                await connection.wait_closed()
+                if self.is_paused():
+                    self.logger.warning("Stopped consuming from queue %s" % queue)
+                    continue
+                raise ConnectionError("Connection closed by broker")
+            except Exception as e:
+                self.logger.stack_trace(e)
+                if connection is not None and connection.is_open():
+                    await connection.close()
+                if not self.retry_on_disconnect:
+                    self.logger.error("Connection closed by broker, exiting")
+                    break
+                retries += 1
+                wait_time = min(2**retries, 30)
+                self.logger.warning(
+                    "Connection closed by broker, reconnecting in %d seconds"
+                    % wait_time
+                )
+                await asyncio.sleep(wait_time)
+            finally:
+                self.consumer = None
+
+    def pause(self):
+        """Stop consuming until resume is called.
+
+        The consumer is cancelled and the connection is closed, so messages
+        stay in the broker. Must be called on the event loop.
+        """
+        self.resumed.clear()
+        if self.consumer is None:
+            return
+        connection, channel, consumer_tag = self.consumer
+        self.logger.warning("Pausing consumer")
+        try:
+            channel.basic_cancel(consumer_tag)
+        except Exception as e:
+            self.logger.stack_trace(e)
+        asyncio.ensure_future(connection.close())
@@ -1,8 +1,10 @@
 """Module for consuming messages from broker."""
 
+import threading
 import time
 
 from bb_change_broker.consumer.base import BaseConsumer
+from bb_change_broker.consumer.pool import PartitionedWorkerPool, ThreadSafeChannel
 from bb_change_broker.backend.broker import (
     BaseBrokerConnection,
     PikaHandler,
@@ -13,6 +15,9 @@ from bb_change_broker.util.log import Logger
 class BrokerConsumer(BaseConsumer):
     """Consumer class that receives messages from broker."""
 
+    # header that counts the deliveries of a message that failed before
+    ATTEMPT_HEADER = "x-attempt"
+
     def __init__(
         self,
         host,
@@ -20,8 +25,11 @@ class BrokerConsumer(BaseConsumer):
         username,
         password,
         retry_on_disconnect=True,
-        handler=PikaHandler(),
-        logger=Logger(),
+        handler=None,
+        logger=None,
+        prefetch_count=0,
+        workers=1,
+        retry_delays=(),
     ):
         """Initialize the broker consumer.
 
@@ -31,16 +39,33 @@ class BrokerConsumer(BaseConsumer):
         :param password (str): The password of the the broker.
         :param retry_on_disconnect (bool): Whether to retry on disconnect.
             Note: This flag is only used when testing, because we need to exit the loop.
-        :param handler (BaseBrokerHandler): The handler for the broker.
-        :param logger (Logger): The logger to use.
+        :param handler (BaseBrokerHandler): The handler for the broker,
+            None for a PikaHandler.
+        :param logger (Logger): The logger to use, None for a silent one.
+        :param prefetch_count (int): The maximum number of unacknowledged messages,
+            0 means no limit.
+        :param workers (int): The number of worker threads that run the callback.
+            With one worker, the callback runs on the connection thread.
+        :param retry_delays (list): The delays in seconds before a failed message
+            is delivered again, one per attempt. The last delay is used for all
+            further attempts. Empty to requeue failed messages immediately.
         """
         self.host = host
         self.port = port
         self.username = username
         self.password = password
         self.retry_on_disconnect = retry_on_disconnect
-        self.handler = handler
-        self.logger = logger
+        self.handler = handler if handler is not None else PikaHandler()
+        self.logger = logger if logger is not None else Logger()
+        self.prefetch_count = prefetch_count
+        self.workers = workers
+        self.retry_delays = list(retry_delays)
+        # cleared while the consumer is paused
+        self.resumed = threading.Event()
+        self.resumed.set()
+        # connection, channel and consumer tag while consuming
+        self.consumer = None
+        self.lock = threading.Lock()
 
     def connect(self) -> BaseBrokerConnection:
         """Connect to broker.
@@ -58,22 +83,54 @@ class BrokerConsumer(BaseConsumer):
         """Close the connection to broker."""
         pass
 
-    def consume(self, queue, callback):
+    def consume(self, queue, callback, partition_key=None, decode=None):
         """Consume messages from broker.
 
+        With more than one worker, messages are dispatched to a worker pool.
+        Messages with the same partition key are processed in order by the
+        same worker. The callback receives a channel whose acknowledgements
+        are safe to send from any thread.
+
         :param queue (str): The queue to consume messages from.
         :param callback (function): The callback function to call when a message is received.
+        :param partition_key (function): Function that returns the partition key
+            of a message from its properties and body, the decoded body with decode.
+        :param decode (function): Function that decodes a message from its
+            properties and body once on the connection thread, its result is
+            passed to partition_key and as fifth argument to the callback.
         """
-
+        pool = (
+            PartitionedWorkerPool(self.workers, self.logger)
+            if self.workers > 1
+            else None
+        )
         retries = 0
         while True:
+            # while paused, no connection is open and messages stay in the broker
+            self.resumed.wait()
             try:
                 connection = self.connect()
                 channel = connection.channel()
                 # set retry to 0 when connection is successful
                 retries = 0
-                channel.basic_consume(queue, callback)
+                if self.prefetch_count > 0:
+                    channel.basic_qos(prefetch_count=self.prefetch_count)
+                self.__declare_retry_queues(channel, queue)
+                consumer_tag = channel.basic_consume(
+                    queue,
+                    self.__dispatcher(
+                        connection, callback, partition_key, decode, pool
+                    ),
+                )
+                with self.lock:
+                    self.consumer = (connection, channel, consumer_tag)
+                if not self.resumed.is_set():
+                    # paused while connecting
+                    channel.basic_cancel(consumer_tag)
                 channel.start_consuming()
+                # start_consuming returns when the consumer was cancelled
+                self.logger.warning("Stopped consuming from queue %s" % queue)
+                self.__close(connection)
             except Exception as e:
                 self.logger.stack_trace(e)
                 if not self.retry_on_disconnect:
@@ -87,3 +144,155 @@ class BrokerConsumer(BaseConsumer):
                 )
                 time.sleep(wait_time)
                 continue
+            finally:
+                with self.lock:
+                    self.consumer = None
+        if pool is not None:
+            pool.shutdown()
+
+    def pause(self):
+        """Stop consuming until resume is called.
+
+        The consumer is cancelled and the connection is closed, so messages
+        stay in the broker. Messages that are processed meanwhile can not be
+        acknowledged anymore and are delivered again after resume.
+        Can be called from any thread.
+        """
+        self.resumed.clear()
+        with self.lock:
+            consumer = self.consumer
+        if consumer is None:
+            return
+        connection, channel, consumer_tag = consumer
+        self.logger.warning("Pausing consumer")
+        try:
+            connection.add_callback_threadsafe(
+                lambda: channel.basic_cancel(consumer_tag)
+            )
+        except Exception as e:
+            # the connection is gone, consume reconnects only after resume
+            self.logger.stack_trace(e)
+
+    def resume(self):
+        """Continue consuming after pause. Can be called from any thread."""
+        if not self.resumed.is_set():
+            self.logger.info("Resuming consumer")
+            self.resumed.set()
+
+    def is_paused(self) -> bool:
+        """Return whether the consumer is paused.
+
+        :return (bool): True if the consumer is paused, False otherwise.
+        """
+        return not self.resumed.is_set()
+
+    def retry_queue(self, queue, attempt) -> str:
+        """Return the retry queue of an attempt.
+
+        :param queue (str): The queue the message was consumed from.
+        :param attempt (int): The number of failed deliveries, starting at 1.
+        :return (str): The name of the retry queue.
+        """
+        delay = self.retry_delays[min(attempt, len(self.retry_delays)) - 1]
+        return "%s.retry.%d" % (queue, delay * 1000)
+
+    def retry(self, ch, method, queue, properties, body):
+        """Deliver a message that failed again after a delay.
+
+        The message is published to the retry queue of its attempt and
+        acknowledged. When the TTL of the retry queue expires, the broker
+        dead-letters it back to the queue. Without retry delays, the message
+        is requeued immediately.
+
+        :param ch (BaseBrokerChannel): The channel of the message.
+        :param method (pika.spec.Basic.Deliver): The method of the message.
+        :param queue (str): The queue the message was consumed from.
+        :param properties (pika.spec.BasicProperties): The properties of the message.
+        :param body (str): The body of the message.
+        :return (int): The delay in seconds, 0 if the message was requeued.
+        """
+        if not self.retry_delays:
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            return 0
+        headers = dict(getattr(properties, "headers", None) or {})
+        attempt = int(headers.get(self.ATTEMPT_HEADER, 0)) + 1
+        headers[self.ATTEMPT_HEADER] = attempt
+        ch.basic_publish(
+            exchange="",
+            routing_key=self.retry_queue(queue, attempt),
+            body=body,
+            properties=ch.get_properties(
+                delivery_mode=2,
+                content_type=properties.content_type,
+                message_id=getattr(properties, "message_id", None),
+                headers=headers,
+            ),
+        )
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        return self.retry_delays[min(attempt, len(self.retry_delays)) - 1]
+
+    def __close(self, connection):
+        """Close a connection and ignore errors.
+
+        :param connection (BaseBrokerConnection): The connection to close.
+        """
+        try:
+            connection.close()
+        except Exception as e:
+            self.logger.stack_trace(e)
+
+    def retry_queues(self, queue) -> list:
+        """Return the retry queues of a queue.
+
+        Messages expire in a retry queue after its delay and are dead-lettered
+        back to the queue.
+
+        :param queue (str): The queue the messages are consumed from.
+        :return (list): The names and arguments of the retry queues.
+        """
+        return [
+            (
+                self.retry_queue(queue, attempt),
+                {
+                    "x-message-ttl": int(delay * 1000),
+                    "x-dead-letter-exchange": "",
+                    "x-dead-letter-routing-key": queue,
+                },
+            )
+            for attempt, delay in enumerate(self.retry_delays, start=1)
+        ]
+
+    def __declare_retry_queues(self, channel, queue):
+        """Declare the retry queues of a queue.
+
+        :param channel (BaseBrokerChannel): The channel to declare the queues on.
+        :param queue (str): The queue the messages are consumed from.
+        """
+        for name, arguments in self.retry_queues(queue):
+            channel.queue_declare(queue=name, durable=True, arguments=arguments)
+
+    def __dispatcher(self, connection, callback, partition_key, decode, pool):
+        """Return the function that dispatches received messages.
+
+        :param connection (BaseBrokerConnection): The connection to broker.
+        :param callback (function): The callback function to call when a message is received.
+        :param partition_key (function): Function that returns the partition key of a message.
+        :param decode (function): Function that decodes a message, None to pass the body only.
+        :param pool (PartitionedWorkerPool): The worker pool, None to run on the connection thread.
+        :return (function): The dispatcher.
+        """
+
+        def dispatch(ch, method, properties, body):
+            channel = ThreadSafeChannel(connection, ch, self.logger)
+            args = (channel, method, properties, body)
+            message = body
+            if decode is not None:
+                message = decode(properties, body)
+                args += (message,)
+            if pool is None:
+                callback(*args)
+                return
+            key = partition_key(properties, message) if partition_key else None
+            pool.submit(key, callback, *args)
+
+        return dispatch
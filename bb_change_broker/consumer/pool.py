@@ -0,0 +1,139 @@
+"""Worker pool that processes consumed messages in parallel."""
+
+import queue
+import threading
+
+
+class ThreadSafeChannel(object):
+    """Channel proxy that sends acknowledgements from any thread.
+
+    Broker connections are not thread safe. Acknowledgements and publishes
+    from worker threads are therefore scheduled on the thread that runs the
+    connection, in the order they were made.
+    """
+
+    def __init__(self, connection, channel, logger):
+        """Initialize the channel proxy.
+
+        Must be created on the thread that runs the connection.
+
+        :param connection (BaseBrokerConnection): The connection of the channel.
+        :param channel (BaseBrokerChannel): The channel to proxy.
+        :param logger (Logger): The logger to use.
+        """
+        self.connection = connection
+        self.channel = channel
+        self.logger = logger
+        self.thread_id = threading.get_ident()
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        """Publish a message.
+
+        :param exchange (str): The exchange to publish the message to.
+        :param routing_key (str): The routing key to publish the message with.
+        :param body (str): The message to publish.
+        :param properties (pika.BasicProperties): The properties of the message.
+        """
+        self.__call(
+            self.channel.basic_publish,
+            exchange=exchange,
+            routing_key=routing_key,
+            body=body,
+            properties=properties,
+        )
+
+    def get_properties(self, *args, **kwargs):
+        """Return properties for a message, see BaseBrokerChannel.get_properties."""
+        return self.channel.get_properties(*args, **kwargs)
+
+    def basic_ack(self, delivery_tag):
+        """Acknowledge a message.
+
+        :param delivery_tag (int): The delivery tag of the message.
+        """
+        self.__call(self.channel.basic_ack, delivery_tag=delivery_tag)
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        """Negatively acknowledge a message.
+
+        :param delivery_tag (int): The delivery tag of the message.
+        :param requeue (bool): Whether the message is requeued.
+        """
+        self.__call(self.channel.basic_nack, delivery_tag=delivery_tag, requeue=requeue)
+
+    def __call(self, method, **kwargs):
+        """Call a channel method on the connection thread.
+
+        :param method (function): The channel method to call.
+        :param kwargs (dict): The arguments of the method.
+        """
+        if threading.get_ident() == self.thread_id:
+            method(**kwargs)
+            return
+        try:
+            self.connection.add_callback_threadsafe(lambda: method(**kwargs))
+        except Exception as e:
+            # the connection is gone, the broker redelivers the message
+            self.logger.error("Failed to schedule %s on closed connection", method)
+            self.logger.stack_trace(e)
+
+
+class PartitionedWorkerPool(object):
+    """Pool of worker threads that keeps the order of tasks per key.
+
+    Tasks with the same key always run on the same worker in the order they
+    were submitted, tasks with different keys can run in parallel.
+    """
+
+    def __init__(self, workers, logger):
+        """Initialize the worker pool and start the workers.
+
+        :param workers (int): The number of worker threads.
+        :param logger (Logger): The logger to use.
+        """
+        self.logger = logger
+        self.queues = [queue.Queue() for _ in range(workers)]
+        self.threads = [
+            threading.Thread(target=self.__work, args=(q,), daemon=True)
+            for q in self.queues
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, key, function, *args):
+        """Submit a task.
+
+        :param key (object): The partition key of the task.
+        :param function (function): The function to run.
+        :param args (list): The arguments of the function.
+        """
+        self.queues[hash(key) % len(self.queues)].put((function, args))
+
+    def join(self):
+        """Wait until all submitted tasks are done."""
+        for q in self.queues:
+            q.join()
+
+    def shutdown(self):
+        """Finish all submitted tasks and stop the workers."""
+        for q in self.queues:
+            q.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def __work(self, q):
+        """Run the tasks of a queue.
+
+        :param q (queue.Queue): The queue of the worker.
+        """
+        while True:
+            task = q.get()
+            try:
+                if task is None:
+                    return
+                function, args = task
+                function(*args)
+            except Exception as e:
+                self.logger.stack_trace(e)
+            finally:
+                q.task_done()
@@ -0,0 +1,46 @@
+"""Hook side of the agent, hands the input of a hook to a running agent.
+
+This module only uses the standard library, so hooks that talk to an
+agent start fast.
+"""
+
+import json
+import socket
+import subprocess
+import sys
+
+
+def read_request(config) -> dict:
+    """Read the input of the hook.
+
+    :param config (dict): The configuration of the client.
+    :return (dict): The updated "refs" of a git push or the "revision" of a svn commit.
+    """
+    if "git" in config:
+        return {
+            "refs": [line.split() for line in sys.stdin.readlines() if line.strip()]
+        }
+    revision = subprocess.check_output(
+        ["svnlook", "youngest", config["svn"]["repository"]]
+    )
+    return {"revision": revision.decode(config["DEFAULT"]["encoding"]).strip()}
+
+
+def send_to_agent(path, request, timeout=2) -> bool:
+    """Send a request to the agent.
+
+    :param path (str): The path of the unix socket of the agent.
+    :param request (dict): The request.
+    :param timeout (float): The timeout in seconds.
+    :return (bool): True if the agent accepted the request, False otherwise.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            with sock.makefile("rb") as f:
+                reply = json.loads(f.readline())
+        return reply.get("status") == "ok"
+    except (OSError, ValueError):
+        return False
@@ -0,0 +1,117 @@
+"""Buildbot publisher for asyncio that sends changes to buildbot."""
+
+from bb_change_broker.publisher.buildbot import BuildbotPublisher
+
+
+class AsyncBuildbotPublisher(BuildbotPublisher):
+    """Asyncio counterpart of the BuildbotPublisher.
+
+    Shares the filtering of changes and the circuit breaker with the
+    BuildbotPublisher, but sends the changes with an asyncio HTTP handler.
+    """
+
+    def __init__(
+        self,
+        host,
+        port,
+        username,
+        password,
+        encoding="utf-8",
+        http_handler=None,
+        logger=None,
+        availability_ttl=30,
+        failure_threshold=3,
+    ) -> None:
+        """Initialize the buildbot publisher.
+
+        :param host (str): The host of the buildbot server.
+        :param port (int): The port of the buildbot server.
+        :param username (str): The username of the buildbot server.
+        :param password (str): The password of the buildbot server.
+        :param encoding (str): The encoding of the buildbot server.
+        :param http_handler (BaseAsyncHTTPHandler): The sender to use to send the
+            change to buildbot, None for an AsyncHTTPHandler.
+        :param logger (Logger): The logger to use, None for a silent one.
+        :param availability_ttl (int): The time in seconds buildbot is considered
+            unavailable after the circuit opened, before it is probed again.
+        :param failure_threshold (int): The number of failed publishes in a row
+            that open the circuit.
+        """
+        if http_handler is None:
+            from bb_change_broker.backend.async_http_handler import AsyncHTTPHandler
+
+            http_handler = AsyncHTTPHandler()
+        super().__init__(
+            host,
+            port,
+            username,
+            password,
+            encoding=encoding,
+            http_handler=http_handler,
+            logger=logger,
+            availability_ttl=availability_ttl,
+            failure_threshold=failure_threshold,
+        )
+
+    async def close(self):
+        """Close the connections to buildbot."""
+        await self.http_handler.close()
+
+    async def publish(self, change) -> bool:
+        """Send a change to buildbot.
+
+        :param change (dict): The change to send to buildbot.
+        :return (bool): True if the change was sent successfully, False otherwise.
+        """
+        if isinstance(change, list):
+            change = change[0]
+        return await self.publish_many([change])
+
+    async def publish_many(self, changes) -> bool:
+        """Send several changes to buildbot in one request.
+
+        :param changes (list): The changes to send to buildbot.
+        :return (bool): True if the changes were sent successfully, False otherwise.
+        """
+        try:
+            data = self.get_data(changes)
+            url = "http://" + self.host + ":" + str(self.port) + "/change_hook/base"
+            self.logger.info("Sending %r to %s" % (data, url))
+            resp = await self.http_handler.post(
+                data=data,
+                url=url,
+                encoding=self.encoding,
+                username=self.username,
+                password=self.password,
+            )
+            success = True if resp.status == 200 else False
+        except Exception as e:
+            self.logger.stack_trace(e)
+            success = False
+        self.record_result(success)
+        return success
+
+    async def is_available(self):
+        """Check if buildbot is available, see BuildbotPublisher.is_available.
+
+        :return (bool): True if buildbot is available, False otherwise.
+        """
+        if self.circuit_allows():
+            return True
+        if not self.probe_due():
+            return False
+        return self.record_probe(await self.__probe())
+
+    async def __probe(self):
+        """Probe buildbot with a cheap request.
+
+        :return (bool): True if buildbot answered, False otherwise.
+        """
+        try:
+            self.logger.debug("Checking if buildbot is available")
+            url = "http://" + self.host + ":" + str(self.port)
+            resp = await self.http_handler.head(url, self.encoding)
+            return True if resp.status == 200 else False
+        except Exception as e:
+            self.logger.stack_trace(e)
+            return False
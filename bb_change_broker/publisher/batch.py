@@ -0,0 +1,154 @@
+"""Publisher stage that sends changes to buildbot in batches."""
+
+import threading
+import time
+
+
+def coalesce(changes) -> list:
+    """Merge the changes of the same repository and branch.
+
+    The merged change is the newest change of its branch with the files of
+    all merged changes. It takes the place of the oldest merged change.
+    Changes without branch are not merged.
+
+    :param changes (list): The changes, oldest first.
+    :return (list): The merged changes as (change, indices of the merged changes).
+    """
+    merged = []
+    positions = {}
+    for index, change in enumerate(changes):
+        key = (change.get("repository"), change.get("branch"))
+        if key[1] is None or key not in positions:
+            positions[key] = len(merged)
+            merged.append((change, [index]))
+            continue
+        previous, indices = merged[positions[key]]
+        files = list(previous.get("files") or [])
+        seen = set(files)
+        for f in change.get("files") or []:
+            if f not in seen:
+                seen.add(f)
+                files.append(f)
+        merged[positions[key]] = (dict(change, files=files), indices + [index])
+    return merged
+
+
+class BatchPublisher(object):
+    """Collects changes and sends them to buildbot in batches.
+
+    A batch is sent when it holds batch_size changes or when its oldest
+    change has waited max_wait seconds. Each change has a callback that is
+    called with the result of its batch, so the broker deliveries of a batch
+    can be acknowledged together.
+
+    With coalescing, a batch is due when its oldest change has waited
+    max_wait seconds, whatever the batch size. All pending changes are taken
+    then and the changes of the same branch are merged before they are sent,
+    so commits on a branch within the window, or a backlog, result in one
+    change.
+    """
+
+    def __init__(self, publisher, batch_size, max_wait, logger, coalesce=False):
+        """Initialize the batch publisher and start its sender thread.
+
+        :param publisher (BuildbotPublisher): The publisher that sends the batches.
+        :param batch_size (int): The maximum number of changes per batch.
+        :param max_wait (float): The maximum time in seconds a change waits for its batch.
+        :param logger (Logger): The logger to use.
+        :param coalesce (bool): Whether changes of the same branch are merged.
+        """
+        self.publisher = publisher
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.logger = logger
+        self.coalesce = coalesce
+        # pending changes as (change, callback, time of submit)
+        self.pending = []
+        self.stopped = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def submit(self, change, callback):
+        """Add a change to the next batch.
+
+        :param change (dict): The change to send.
+        :param callback (function): Function that is called with True if the
+            batch of the change was sent successfully, False otherwise.
+        """
+        with self.condition:
+            self.pending.append((change, callback, time.monotonic()))
+            self.condition.notify()
+
+    def stop(self):
+        """Send the pending changes and stop the sender thread."""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join()
+
+    def __run(self):
+        """Send batches until the publisher is stopped."""
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                deadline = self.pending[0][2] + self.max_wait
+                while (
+                    self.coalesce or len(self.pending) < self.batch_size
+                ) and not self.stopped:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                size = len(self.pending) if self.coalesce else self.batch_size
+                batch = self.pending[:size]
+                del self.pending[:size]
+            if self.coalesce:
+                self.__send_coalesced(batch)
+            else:
+                self.__send(
+                    [change for change, callback, submitted in batch],
+                    [callback for change, callback, submitted in batch],
+                )
+
+    def __send_coalesced(self, pending):
+        """Merge the changes of the same branch and send them in batches.
+
+        :param pending (list): The pending changes as list of (change, callback, time of submit).
+        """
+        merged = coalesce([change for change, callback, submitted in pending])
+        if len(merged) < len(pending):
+            self.logger.info(
+                "Coalesced %d change(s) into %d" % (len(pending), len(merged))
+            )
+        for start in range(0, len(merged), self.batch_size):
+            chunk = merged[start : start + self.batch_size]
+            self.__send(
+                [change for change, indices in chunk],
+                [pending[index][1] for change, indices in chunk for index in indices],
+            )
+
+    def __send(self, changes, callbacks):
+        """Send a batch and report the result to the callbacks of its changes.
+
+        :param changes (list): The changes of the batch.
+        :param callbacks (list): The callbacks of the deliveries of the batch.
+        """
+        try:
+            success = self.publisher.is_available() and self.publisher.publish_many(
+                changes
+            )
+        except Exception as e:
+            self.logger.stack_trace(e)
+            success = False
+        self.logger.debug(
+            "Sent batch of %d change(s) to buildbot: %s" % (len(changes), success)
+        )
+        for callback in callbacks:
+            try:
+                callback(success)
+            except Exception as e:
+                self.logger.stack_trace(e)
@@ -1,5 +1,7 @@
 """Module for broker publisher class."""
 
+import time
+
 from bb_change_broker.publisher.base import BasePublisher
 from bb_change_broker.backend.broker import PikaHandler
 from bb_change_broker.util.log import Logger
@@ -9,7 +11,15 @@ class BrokerPublisher(BasePublisher):
     """Publisher class that sends changes to broker."""
 
     def __init__(
-        self, host, port, username, password, handler=PikaHandler(), logger=Logger()
+        self,
+        host,
+        port,
+        username,
+        password,
+        handler=None,
+        logger=None,
+        confirm_window=256,
+        confirm_timeout=30,
     ):
         """Initialize the broker publisher.
 
@@ -17,20 +27,43 @@ class BrokerPublisher(BasePublisher):
         :param port (int): The port of the broker.
         :param username (str): The username of the broker.
         :param password (str): The password of the broker.
-        :param handler (BaseBrokerHandler): The handler for the broker.
-        :param logger (Logger): The logger to use.
+        :param handler (BaseBrokerHandler): The handler for the broker,
+            None for a PikaHandler.
+        :param logger (Logger): The logger to use, None for a silent one.
+        :param confirm_window (int): The maximum number of published messages
+            that are not confirmed by the broker yet, 0 to publish without
+            publisher confirms.
+        :param confirm_timeout (int): The time in seconds to wait for a confirm
+            before the connection is treated as broken.
         """
         self.host = host
         self.port = port
         self.username = username
         self.password = password
-        self.handler = handler
-        self.logger = logger
+        self.handler = handler if handler is not None else PikaHandler()
+        self.logger = logger if logger is not None else Logger()
+        self.connection = None
+        self.channel = None
+        # queues declared on the current channel, they are declared only once
+        self.declared_queues = set()
+        self.confirm_window = confirm_window
+        self.confirm_timeout = confirm_timeout
+        # delivery tag of the last message published on the current channel
+        self.delivery_tag = 0
+        # unconfirmed messages of the current publish_many by delivery tag,
+        # and the outcome of the confirmed ones by message index
+        self.unconfirmed = {}
+        self.confirmed = {}
+        # whether a message of the current attempt was rejected
+        self.rejected = False
 
     def connect(self):
         """Connect to broker.
 
-        :return (pika.BlockingConnection): The connection to broker.
+        The connection and its channel are kept open and reused by the
+        following publishes until close is called.
+
+        :return (BaseBrokerConnection): The connection to broker.
         """
         self.logger.info(
             "Connecting to broker (%s, %s) with user %s ...",
@@ -42,40 +75,188 @@ class BrokerPublisher(BasePublisher):
         parameters = self.handler.connection_parameters(
             self.host, self.port, "/", credentials
         )
-        connection = self.handler.blocking_connection(parameters)
-        return connection
+        self.connection = self.handler.blocking_connection(parameters)
+        self.channel = self.connection.channel()
+        self.declared_queues = set()
+        self.delivery_tag = 0
+        self.unconfirmed = {}
+        if self.confirm_window > 0:
+            self.channel.confirm_delivery(self.__on_confirm, self.__on_return)
+        return self.connection
 
     def close(self):
         """Close the connection to broker."""
-        pass
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception as e:
+                self.logger.stack_trace(e)
+        self.connection = None
+        self.channel = None
+        self.declared_queues = set()
 
-    def publish(self, message, exchange, routing_key) -> bool:
+    def publish(self, message, exchange, routing_key, content_type=None) -> bool:
         """Publish a message to broker.
 
         :param message (str): The message to publish.
         :param exchange (str): The exchange to publish the message to.
         :param routing_key (str): The routing key to publish the message with.
+        :param content_type (str): The content type of the message.
         :return (bool): True if the message was published successfully, False otherwise.
         """
-        try:
-            connection = self.connect()
-            channel = connection.channel()
-            self.logger.info(
-                "Publishing message to queue %s ...",
-                routing_key,
-            )
-            channel.queue_declare(queue=routing_key, durable=True)
-            self.logger.debug("Send message: %s", message)
-            channel.basic_publish(
-                exchange=exchange,
-                routing_key=routing_key,
-                body=message,
-                properties=channel.get_properties(delivery_mode=2),
-            )
-            connection.close()
-            self.logger.debug("Message published successfully, closing connection.")
-            return True
-        except Exception as e:
-            self.logger.error("Failed to publish message")
-            self.logger.stack_trace(e)
-            return False
+        return not self.publish_many([message], exchange, routing_key, content_type)
+
+    def publish_many(
+        self,
+        messages,
+        exchange,
+        routing_key,
+        content_type=None,
+        max_retries=1,
+        message_ids=None,
+    ) -> list:
+        """Publish several messages to broker over the same channel.
+
+        With publisher confirms, up to confirm_window messages are published
+        before the first confirm is awaited, so a large push does not wait for
+        a round trip per message. Messages are published as mandatory, a
+        message is only published successfully when the broker acknowledged
+        it and did not return it as unroutable.
+
+        If the connection breaks, or messages were rejected, no further
+        messages are published and the connection is reopened. All messages
+        from the first one that was not confirmed on are published again in
+        order, so messages that were already in flight behind it are
+        published twice and the server drops the copies by their ids.
+
+        :param messages (list): The messages to publish.
+        :param exchange (str): The exchange to publish the messages to.
+        :param routing_key (str): The routing key to publish the messages with.
+        :param content_type (str): The content type of the messages.
+        :param max_retries (int): The maximum number of reconnects.
+        :param message_ids (list): The ids of the messages, None to send them without.
+        :return (list): The indices of the messages from the first one that
+            was not published on.
+        """
+        messages = list(messages)
+        remaining = list(range(len(messages)))
+        for attempt in range(max_retries + 1):
+            self.confirmed = {}
+            self.rejected = False
+            try:
+                channel = self.__get_channel()
+                self.__declare_queue(channel, routing_key)
+                self.logger.info(
+                    "Publishing %d message(s) to queue %s ...",
+                    len(remaining),
+                    routing_key,
+                )
+                for index in remaining:
+                    self.__wait_for_window(channel, self.confirm_window - 1)
+                    if self.rejected:
+                        break
+                    self.logger.debug("Send message: %s", messages[index])
+                    channel.basic_publish(
+                        exchange=exchange,
+                        routing_key=routing_key,
+                        body=messages[index],
+                        properties=channel.get_properties(
+                            delivery_mode=2,
+                            content_type=content_type,
+                            message_id=(
+                                message_ids[index] if message_ids is not None else None
+                            ),
+                        ),
+                        mandatory=self.confirm_window > 0,
+                    )
+                    if self.confirm_window > 0:
+                        self.delivery_tag += 1
+                        self.unconfirmed[self.delivery_tag] = (index, messages[index])
+                    else:
+                        self.confirmed[index] = True
+                self.__wait_for_window(channel, 0)
+            except Exception as e:
+                self.logger.error("Failed to publish message")
+                self.logger.stack_trace(e)
+                self.close()
+            failed = [i for i in remaining if not self.confirmed.get(i, False)]
+            if not failed:
+                self.logger.debug("Messages published successfully.")
+                return []
+            if self.connection is not None:
+                self.logger.error("%d message(s) were rejected by broker", len(failed))
+                # the queue may have been deleted, declare it again
+                self.declared_queues.discard(routing_key)
+            # keep the order, publish again from the first failed message on
+            remaining = remaining[remaining.index(failed[0]) :]
+        return remaining
+
+    def __wait_for_window(self, channel, size):
+        """Wait until at most size messages are not confirmed.
+
+        :param channel (BaseBrokerChannel): The channel of the messages.
+        :param size (int): The maximum number of unconfirmed messages.
+        """
+        deadline = time.monotonic() + self.confirm_timeout
+        while self.unconfirmed and len(self.unconfirmed) > size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                raise TimeoutError(
+                    "%d message(s) not confirmed by broker" % len(self.unconfirmed)
+                )
+            channel.process_data_events(time_limit=timeout)
+
+    def __on_confirm(self, delivery_tag, multiple, ack):
+        """Record the confirm of published messages.
+
+        :param delivery_tag (int): The delivery tag of the confirmed message.
+        :param multiple (bool): Whether all messages up to the tag are confirmed.
+        :param ack (bool): True if the broker took the messages, False if not.
+        """
+        if multiple:
+            tags = [tag for tag in self.unconfirmed if tag <= delivery_tag]
+        else:
+            tags = [delivery_tag] if delivery_tag in self.unconfirmed else []
+        for tag in tags:
+            index, message = self.unconfirmed.pop(tag)
+            # a returned message is acknowledged as well, keep it failed
+            self.confirmed.setdefault(index, ack)
+            self.rejected = self.rejected or not ack
+
+    def __on_return(self, body):
+        """Record a message that the broker could not route.
+
+        The message is matched to the oldest unconfirmed message with its body.
+
+        :param body (bytes): The body of the returned message.
+        """
+        for index, message in self.unconfirmed.values():
+            if index in self.confirmed:
+                continue
+            if isinstance(message, str):
+                message = message.encode("utf-8")
+            if message == body:
+                self.logger.warning("Message was returned by broker: %s", body)
+                self.confirmed[index] = False
+                self.rejected = True
+                return
+
+    def __get_channel(self):
+        """Return the channel of the open connection, reconnect if needed.
+
+        :return (BaseBrokerChannel): The channel to broker.
+        """
+        if self.connection is None or not self.connection.is_open():
+            self.close()
+            self.connect()
+        return self.channel
+
+    def __declare_queue(self, channel, queue):
+        """Declare a queue if it was not declared on the channel yet.
+
+        :param channel (BaseBrokerChannel): The channel to declare the queue on.
+        :param queue (str): The queue to declare.
+        """
+        if queue not in self.declared_queues:
+            channel.queue_declare(queue=queue, durable=True)
+            self.declared_queues.add(queue)
@@ -1,5 +1,8 @@
 """Buildbot sender class that sends changes to buildbot."""
 
+import threading
+import time
+
 from bb_change_broker.publisher.base import BasePublisher
 from bb_change_broker.backend.http_handler import DefaultHTTPHandler
 from bb_change_broker.util.log import Logger
@@ -22,6 +25,11 @@ class BuildbotPublisher(BasePublisher):
         "files",
     ]
 
+    # states of the circuit breaker that guards buildbot
+    CLOSED = "closed"  # buildbot is healthy, changes are sent
+    OPEN = "open"  # buildbot is down, changes are not sent until it is probed
+    HALF_OPEN = "half-open"  # probe succeeded, the next publish decides
+
     def __init__(
         self,
         host,
@@ -29,8 +37,10 @@ class BuildbotPublisher(BasePublisher):
         username,
         password,
         encoding="utf-8",
-        http_handler=DefaultHTTPHandler(),
-        logger=Logger(),
+        http_handler=None,
+        logger=None,
+        availability_ttl=30,
+        failure_threshold=3,
     ) -> None:
         """Initialize the buildbot sender.
 
@@ -39,16 +49,29 @@ class BuildbotPublisher(BasePublisher):
         :param username (str): The username of the buildbot server.
         :param password (str): The password of the buildbot server.
         :param encoding (str): The encoding of the buildbot server.
-        :param http_handler (HTTP): The sender to use to send the change to buildbot.
-        :param logger (Logger): The logger to use.
+        :param http_handler (HTTP): The sender to use to send the change to buildbot,
+            None for a DefaultHTTPHandler.
+        :param logger (Logger): The logger to use, None for a silent one.
+        :param availability_ttl (int): The time in seconds buildbot is considered
+            unavailable after the circuit opened, before it is probed again.
+        :param failure_threshold (int): The number of failed publishes in a row
+            that open the circuit.
         """
         self.host = host
         self.port = port
         self.username = username
         self.password = password
         self.encoding = encoding
-        self.http_handler = http_handler
-        self.logger = logger
+        self.http_handler = (
+            http_handler if http_handler is not None else DefaultHTTPHandler()
+        )
+        self.logger = logger if logger is not None else Logger()
+        self.availability_ttl = availability_ttl
+        self.failure_threshold = failure_threshold
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.lock = threading.Lock()
 
     def connect(self):
         """Connect to buildbot."""
@@ -56,7 +79,7 @@ class BuildbotPublisher(BasePublisher):
 
     def close(self):
         """Close the connection to buildbot."""
-        pass
+        self.http_handler.close()
 
     def publish(self, change) -> bool:
         """Send a change to buildbot.
@@ -64,11 +87,18 @@ class BuildbotPublisher(BasePublisher):
         :param change (dict): The change to send to buildbot.
         :return (bool): True if the change was sent successfully, False otherwise.
         """
-        try:
-            if isinstance(change, list):
-                change = change[0]
+        if isinstance(change, list):
+            change = change[0]
+        return self.publish_many([change])
 
-            data = self.__apply_filter(self.__decode_dict(change))
+    def publish_many(self, changes) -> bool:
+        """Send several changes to buildbot in one request.
+
+        :param changes (list): The changes to send to buildbot.
+        :return (bool): True if the changes were sent successfully, False otherwise.
+        """
+        try:
+            data = self.get_data(changes)
             url = "http://" + self.host + ":" + str(self.port) + "/change_hook/base"
             self.logger.info("Sending %r to %s" % (data, url))
             resp = self.http_handler.post(
@@ -78,25 +108,103 @@ class BuildbotPublisher(BasePublisher):
                 username=self.username,
                 password=self.password,
             )
-            return True if resp.status == 200 else False
+            success = True if resp.status == 200 else False
         except Exception as e:
             self.logger.stack_trace(e)
-            return False
+            success = False
+        self.record_result(success)
+        return success
+
+    def get_data(self, changes) -> list:
+        """Return the data of changes as buildbot expects it.
+
+        :param changes (list): The changes to send to buildbot.
+        :return (list): The changes with bytes decoded and unknown keys removed.
+        """
+        return [self.__apply_filter(self.__decode_dict(change)) for change in changes]
 
     def is_available(self):
         """Check if buildbot is available.
 
+        The result is taken from the circuit breaker. Buildbot is only probed
+        when the circuit is open and the availability ttl has expired.
+
         :return (bool): True if buildbot is available, False otherwise.
         """
+        if self.circuit_allows():
+            return True
+        if not self.probe_due():
+            return False
+        return self.record_probe(self.__probe())
+
+    def circuit_allows(self) -> bool:
+        """Return whether the circuit breaker lets changes through.
+
+        :return (bool): True if the circuit is closed or half-open, False if it is open.
+        """
+        with self.lock:
+            return self.state != self.OPEN
+
+    def probe_due(self) -> bool:
+        """Return whether the circuit is open and buildbot should be probed.
+
+        :return (bool): True if the availability ttl of the open circuit expired.
+        """
+        with self.lock:
+            return (
+                self.state == self.OPEN
+                and time.monotonic() - self.opened_at >= self.availability_ttl
+            )
+
+    def record_probe(self, available) -> bool:
+        """Update the circuit breaker with the result of a probe.
+
+        :param available (bool): Whether buildbot answered the probe.
+        :return (bool): The result of the probe.
+        """
+        with self.lock:
+            if available:
+                self.logger.info("Buildbot is reachable again, half-opening circuit")
+                self.state = self.HALF_OPEN
+            else:
+                self.opened_at = time.monotonic()
+        return available
+
+    def __probe(self):
+        """Probe buildbot with a cheap request.
+
+        :return (bool): True if buildbot answered, False otherwise.
+        """
         try:
             self.logger.debug("Checking if buildbot is available")
             url = "http://" + self.host + ":" + str(self.port)
-            resp = self.http_handler.get(url, self.encoding)
+            resp = self.http_handler.head(url, self.encoding)
             return True if resp.status == 200 else False
         except Exception as e:
             self.logger.stack_trace(e)
             return False
 
+    def record_result(self, success):
+        """Update the circuit breaker with the result of a publish.
+
+        :param success (bool): Whether the publish was successful.
+        """
+        with self.lock:
+            if success:
+                self.state = self.CLOSED
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.logger.warning(
+                        "Buildbot %s failed %d time(s), opening circuit",
+                        self.host,
+                        self.failures,
+                    )
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
     def __apply_filter(self, c):
         """Apply the filter to the change dict.
 
@@ -114,8 +222,10 @@ class BuildbotPublisher(BasePublisher):
         :return (dict): The change dict with bytes decoded.
         """
         return {
-            key: change[key].decode(self.encoding)
-            if isinstance(change[key], bytes)
-            else change[key]
+            key: (
+                change[key].decode(self.encoding)
+                if isinstance(change[key], bytes)
+                else change[key]
+            )
             for key in change
         }
@@ -0,0 +1,137 @@
+"""Bounded fallback publishing of changes to buildbot."""
+
+import queue
+import random
+import threading
+
+
+class FallbackPublisher(object):
+    """Sends changes to buildbot with a fixed number of threads.
+
+    Changes are sent in batches. Failed batches are retried with jittered
+    exponential backoff as long as the retry budget, which is shared by all
+    batches, is not used up. The threads are daemon threads, a request that
+    hangs past the timeout of wait does not keep the process alive.
+    """
+
+    def __init__(
+        self,
+        publisher,
+        logger,
+        workers=2,
+        batch_size=1,
+        retry_budget=3,
+        retry_delay=1,
+        max_retry_delay=10,
+    ):
+        """Initialize the fallback publisher.
+
+        :param publisher (BuildbotPublisher): The publisher that sends the batches.
+        :param logger (Logger): The logger to use.
+        :param workers (int): The number of threads that send batches.
+        :param batch_size (int): The maximum number of changes per request.
+        :param retry_budget (int): The number of retries shared by all batches.
+        :param retry_delay (float): The delay in seconds before the first retry.
+        :param max_retry_delay (float): The maximum delay in seconds between retries.
+        """
+        self.publisher = publisher
+        self.logger = logger
+        self.batch_size = max(1, batch_size)
+        self.retry_budget = retry_budget
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.batches = queue.Queue()
+        # numbers of submitted, finished and failed batches
+        self.finished = threading.Condition()
+        self.submitted = 0
+        self.done = 0
+        self.failed = 0
+        self.threads = [
+            threading.Thread(target=self.__work, daemon=True) for _ in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, changes):
+        """Queue changes to be sent to buildbot.
+
+        :param changes (list): The changes to send.
+        """
+        for start in range(0, len(changes), self.batch_size):
+            with self.finished:
+                self.submitted += 1
+            self.batches.put(changes[start : start + self.batch_size])
+
+    def wait(self, timeout):
+        """Wait for the queued changes and stop retrying afterwards.
+
+        :param timeout (float): The maximum time in seconds to wait.
+        :return (bool): True if all changes were sent, False otherwise.
+        """
+        with self.finished:
+            self.finished.wait_for(lambda: self.done == self.submitted, timeout)
+            not_done = self.submitted - self.done
+            failed = self.failed
+        # running batches stop retrying, queued batches are not sent anymore
+        self.stopped.set()
+        for _ in self.threads:
+            self.batches.put(None)
+        if not_done:
+            self.logger.error(
+                "Gave up on %d batch(es) of changes for Buildbot %s after %s seconds."
+                % (not_done, self.publisher.host, timeout)
+            )
+        return not not_done and not failed
+
+    def __work(self):
+        """Send the queued batches until wait stops the publisher."""
+        while True:
+            changes = self.batches.get()
+            if changes is None:
+                return
+            sent = not self.stopped.is_set() and self.__send(changes)
+            with self.finished:
+                self.done += 1
+                if not sent:
+                    self.failed += 1
+                self.finished.notify_all()
+
+    def __send(self, changes) -> bool:
+        """Send a batch, retry while the budget allows.
+
+        :param changes (list): The changes of the batch.
+        :return (bool): True if the batch was sent, False otherwise.
+        """
+        attempt = 0
+        while not self.stopped.is_set():
+            if self.publisher.is_available() and self.publisher.publish_many(changes):
+                return True
+            if not self.__take_retry():
+                break
+            delay = min(self.max_retry_delay, self.retry_delay * 2**attempt)
+            attempt += 1
+            delay = random.uniform(delay / 2, delay)
+            self.logger.error(
+                "Failed to publish %d change(s) to Buildbot %s, retrying in %.1f seconds."
+                % (len(changes), self.publisher.host, delay)
+            )
+            if self.stopped.wait(delay):
+                break
+        self.logger.error(
+            "Failed to publish %d change(s) to Buildbot %s, giving up."
+            % (len(changes), self.publisher.host)
+        )
+        return False
+
+    def __take_retry(self) -> bool:
+        """Take a retry from the shared budget.
+
+        :return (bool): True if a retry was left, False otherwise.
+        """
+        with self.lock:
+            if self.retry_budget <= 0:
+                return False
+            self.retry_budget -= 1
+            return True
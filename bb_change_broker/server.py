@@ -1,15 +1,25 @@
 """Server that consumes changes from broker and publishs them to buildbot."""
 
 import threading
+import time
 
+from bb_change_broker.codec.base import CodecError
+from bb_change_broker.codec.registry import decode_change
+from bb_change_broker.backend.http_handler import PooledHTTPHandler
+from bb_change_broker.publisher.batch import BatchPublisher
 from bb_change_broker.publisher.buildbot import BuildbotPublisher
 from bb_change_broker.consumer.broker import BrokerConsumer
+from bb_change_broker.util.dedup import DedupIndex, change_id
 from bb_change_broker.util.log import Logger
 
 
 class Server(object):
     """Server that consumes changes from broker and publishs them to buildbot."""
 
+    # seconds between availability checks while paused, buildbot itself is
+    # only probed after the availability ttl of the publisher
+    PROBE_INTERVAL = 1
+
     def __init__(self, config):
         """Initialize the server.
 
@@ -22,6 +32,12 @@ class Server(object):
             username=config["rabbitmq"]["username"],
             password=config["rabbitmq"]["password"],
             logger=self.logger,
+            prefetch_count=int(config["rabbitmq"].get("prefetch_count", 0)),
+            workers=int(config["rabbitmq"].get("workers", 1)),
+            retry_delays=[
+                float(delay)
+                for delay in config["rabbitmq"].get("retry_delays", [5, 30, 120, 600])
+            ],
         )
         self.buildbot = BuildbotPublisher(
             host=config["buildbot"]["host"],
@@ -29,29 +45,178 @@ class Server(object):
             username=config["buildbot"]["username"],
             password=config["buildbot"]["password"],
             encoding=config["DEFAULT"]["encoding"],
+            http_handler=PooledHTTPHandler(
+                pool_size=int(config["buildbot"].get("pool_size", 4)),
+                idle_timeout=int(config["buildbot"].get("idle_timeout", 60)),
+                timeout=int(config["buildbot"].get("timeout", 30)),
+            ),
             logger=self.logger,
+            availability_ttl=int(config["buildbot"].get("availability_ttl", 30)),
+            failure_threshold=int(config["buildbot"].get("failure_threshold", 3)),
         )
         self.queue = config["rabbitmq"]["queue"]
+        self.encoding = config["DEFAULT"]["encoding"]
+        dedup = config.get("dedup", {})
+        self.dedup = DedupIndex(
+            path=dedup.get("path"),
+            size=int(dedup.get("size", 10000)),
+            ttl=int(dedup.get("ttl", 86400)),
+        )
+        batch_size = int(config["buildbot"].get("batch_size", 1))
+        coalesce = bool(config["buildbot"].get("coalesce", False))
+        self.batcher = (
+            BatchPublisher(
+                self.buildbot,
+                batch_size=batch_size,
+                max_wait=int(config["buildbot"].get("batch_wait_ms", 100)) / 1000,
+                logger=self.logger,
+                coalesce=coalesce,
+            )
+            if batch_size > 1 or coalesce
+            else None
+        )
+        # thread that resumes the consumer when buildbot is back
+        self.prober = None
+        self.lock = threading.Lock()
 
-    def callback(self, ch, method, properties, body):
+    def callback(self, ch, method, properties, body, change=None):
         """Callback function that is called when a message is received from broker.
 
         :param ch (pika.channel.Channel): The channel of the message.
         :param method (pika.spec.Basic.Deliver): The method of the message.
         :param properties (pika.spec.BasicProperties): The properties of the message.
         :param body (str): The body of the message.
+        :param change (dict): The change decoded by the consumer, None to decode it here.
         """
         self.logger.info("Received message %r" % body)
-        if self.buildbot.is_available() and self.buildbot.publish(eval(body)):
+        if change is None:
+            try:
+                change = self.__decode(properties, body)
+            except (CodecError, ValueError) as e:
+                self.logger.error("Dropping message that cannot be decoded: %s" % e)
+                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+                return
+        # messages of older clients and of the spool have no id
+        message_id = getattr(properties, "message_id", None) or change_id(
+            change, self.encoding
+        )
+        if self.dedup.contains(message_id):
+            self.logger.info("Dropping duplicate change %s" % message_id)
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            return
+        if self.batcher is not None:
+            self.batcher.submit(
+                change,
+                lambda success: self.__finish(
+                    ch, method, properties, body, message_id, success
+                ),
+            )
+            return
+        self.__finish(
+            ch,
+            method,
+            properties,
+            body,
+            message_id,
+            self.buildbot.is_available() and self.buildbot.publish(change),
+        )
+
+    def __finish(self, ch, method, properties, body, message_id, success):
+        """Acknowledge a message after it was sent to buildbot.
+
+        A message that could not be sent is delivered again after a delay.
+
+        :param ch (BaseBrokerChannel): The channel of the message.
+        :param method (pika.spec.Basic.Deliver): The method of the message.
+        :param properties (pika.spec.BasicProperties): The properties of the message.
+        :param body (str): The body of the message.
+        :param message_id (str): The id of the change of the message.
+        :param success (bool): Whether the change was sent successfully.
+        """
+        if success:
             self.logger.debug("Sent to buildbot")
+            self.dedup.add(message_id)
             ch.basic_ack(delivery_tag=method.delivery_tag)
-        else:
-            self.logger.error("Failed to send to buildbot")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            return
+        try:
+            delay = self.rabbitmq.retry(ch, method, self.queue, properties, body)
+        except Exception as e:
+            # the broker redelivers the unacknowledged message
+            self.logger.error("Failed to schedule the retry of change %s" % message_id)
+            self.logger.stack_trace(e)
+            return
+        self.logger.error(
+            "Failed to send change %s to buildbot, retrying in %d seconds"
+            % (message_id, delay)
+        )
+        if not self.buildbot.is_available():
+            self.__pause()
+
+    def __pause(self):
+        """Stop consuming until buildbot is available again."""
+        with self.lock:
+            if self.prober is not None:
+                return
+            self.logger.warning("Buildbot is unavailable, pausing the consumer")
+            self.rabbitmq.pause()
+            self.prober = threading.Thread(target=self.__probe, daemon=True)
+            self.prober.start()
+
+    def __probe(self):
+        """Wait until buildbot is available and resume consuming."""
+        while not self.buildbot.is_available():
+            time.sleep(self.PROBE_INTERVAL)
+        with self.lock:
+            self.logger.info("Buildbot is available again")
+            self.prober = None
+            self.rabbitmq.resume()
+
+    def decode(self, properties, body):
+        """Decode a message once on the consumer thread.
+
+        :param properties (pika.spec.BasicProperties): The properties of the message.
+        :param body (str): The body of the message.
+        :return (dict): The change, None if the message cannot be decoded,
+            the callback then drops it.
+        """
+        try:
+            return self.__decode(properties, body)
+        except (CodecError, ValueError):
+            return None
+
+    def partition_key(self, properties, change):
+        """Return the partition key of a message.
+
+        Changes of the same repository and branch are processed in order.
+
+        :param properties (pika.spec.BasicProperties): The properties of the message.
+        :param change (dict): The decoded change, None if it cannot be decoded.
+        :return (tuple): The repository and branch of the change.
+        """
+        if change is None:
+            return None
+        return (change.get("repository"), change.get("branch"))
+
+    def __decode(self, properties, body):
+        """Decode the change of a message.
+
+        :param properties (pika.spec.BasicProperties): The properties of the message.
+        :param body (str): The body of the message.
+        :return (dict): The change, the first one of a list.
+        """
+        change = decode_change(body, properties.content_type, self.encoding)
+        if isinstance(change, list):
+            if not change:
+                raise ValueError("Message without change")
+            change = change[0]
+        if not isinstance(change, dict):
+            raise ValueError("Message is not a change: %r" % (change,))
+        return change
 
     def run(self):
         """Run the server."""
         thread = threading.Thread(
-            target=self.rabbitmq.consume, args=(self.queue, self.callback)
+            target=self.rabbitmq.consume,
+            args=(self.queue, self.callback, self.partition_key, self.decode),
         )
         thread.start()
@@ -0,0 +1,66 @@
+"""Bounded in-memory caches."""
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """Thread safe cache that drops the least recently used entry when full."""
+
+    def __init__(self, size):
+        """Initialize the cache.
+
+        :param size (int): The maximum number of entries.
+        """
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the value of a key and mark it as recently used.
+
+        :param key (object): The key.
+        :param default (object): The value returned if the key is not cached.
+        :return (object): The cached value or default.
+        """
+        with self.lock:
+            try:
+                value = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Cache a value.
+
+        :param key (object): The key.
+        :param value (object): The value.
+        """
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Remove a key from the cache.
+
+        :param key (object): The key.
+        :param default (object): The value returned if the key is not cached.
+        :return (object): The removed value or default.
+        """
+        with self.lock:
+            return self.entries.pop(key, default)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
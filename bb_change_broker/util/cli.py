@@ -1,16 +1,71 @@
 """This module contains functions for executing command line commands."""
 
 import subprocess
+import threading
 import shlex
 
 
-def check_output(command) -> str:
+def check_output(command, input=None, cwd=None) -> str:
     """Port of commands.getoutput in python2.
 
     :param command (str): The command to execute.
+    :param input (bytes): The data to write to the stdin of the command.
+    :param cwd (str): The working directory of the command, None for the current one.
     :return (str): The output of the command.
     """
     command = shlex.split(command)
-    process = subprocess.Popen(command, stdout=subprocess.PIPE)
-    stdout, stderr = process.communicate()
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE if input is not None else None,
+        stdout=subprocess.PIPE,
+        cwd=cwd,
+    )
+    stdout, stderr = process.communicate(input)
     return stdout
+
+
+def iter_output_lines(command, input=None, cwd=None):
+    """Execute a command and yield its output line by line while it runs.
+
+    The output is not buffered as a whole. If the caller stops early, the
+    command is killed.
+
+    :param command (str): The command to execute.
+    :param input (bytes): The data to write to the stdin of the command.
+    :param cwd (str): The working directory of the command, None for the current one.
+    :return (iterator): The lines of the output as bytes, with line breaks.
+    """
+    command = shlex.split(command)
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE if input is not None else None,
+        stdout=subprocess.PIPE,
+        cwd=cwd,
+    )
+
+    def write():
+        try:
+            process.stdin.write(input)
+            process.stdin.close()
+        except (BrokenPipeError, ValueError):
+            # the command exited or was killed before it read all input
+            pass
+
+    writer = None
+    if input is not None:
+        # write in the background, the command may output before it read all input
+        writer = threading.Thread(target=write)
+        writer.daemon = True
+        writer.start()
+    completed = False
+    try:
+        for line in process.stdout:
+            yield line
+        completed = True
+    finally:
+        process.stdout.close()
+        if not completed and process.poll() is None:
+            process.kill()
+        process.wait()
+        if writer is not None:
+            writer.join()
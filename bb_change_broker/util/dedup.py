@@ -0,0 +1,130 @@
+"""Index of delivered changes, used to drop duplicate messages."""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from bb_change_broker.util.cache import LRUCache
+
+
+def change_id(change, encoding="utf-8") -> str:
+    """Return the stable id of a change.
+
+    The id only depends on the repository, branch, revision and files, so a
+    change that is published again, by a hook retry or from the spool, gets
+    the same id.
+
+    :param change (dict): The change.
+    :param encoding (str): The encoding of bytes in the change.
+    :return (str): The hex digest of the change.
+    """
+
+    def text(value):
+        return value.decode(encoding) if isinstance(value, bytes) else value
+
+    key = [
+        text(change.get("repository")),
+        text(change.get("branch")),
+        text(change.get("revision")),
+        sorted(text(f) for f in change.get("files") or []),
+    ]
+    return hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+
+
+class DedupIndex(object):
+    """Index of the ids of delivered changes.
+
+    Recently seen ids are kept in an LRU cache. With a path, ids are also
+    stored in a sqlite database, so duplicates are recognized across restarts.
+    Ids expire after the TTL, both in memory and on disk.
+    """
+
+    # number of adds between two purges of expired ids on disk
+    PURGE_INTERVAL = 1000
+
+    def __init__(self, path=None, size=10000, ttl=86400):
+        """Initialize the index.
+
+        :param path (str): The path of the database, None for memory only.
+        :param size (int): The maximum number of ids kept in memory.
+        :param ttl (int): The time in seconds an id is remembered.
+        """
+        self.cache = LRUCache(size)
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.adds = 0
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            with self.db:
+                self.db.execute(
+                    "CREATE TABLE IF NOT EXISTS delivered"
+                    " (id TEXT PRIMARY KEY, delivered_at REAL NOT NULL)"
+                )
+                self.db.execute(
+                    "CREATE INDEX IF NOT EXISTS delivered_at ON delivered (delivered_at)"
+                )
+            self.purge()
+
+    def contains(self, key) -> bool:
+        """Return whether an id was delivered within the TTL.
+
+        :param key (str): The id.
+        :return (bool): True if the id was delivered, False otherwise.
+        """
+        now = time.time()
+        delivered_at = self.cache.get(key)
+        if delivered_at is None and self.db is not None:
+            with self.lock:
+                row = self.db.execute(
+                    "SELECT delivered_at FROM delivered WHERE id = ?", (key,)
+                ).fetchone()
+            if row is not None:
+                delivered_at = row[0]
+                self.cache.put(key, delivered_at)
+        if delivered_at is None:
+            return False
+        if now - delivered_at > self.ttl:
+            self.cache.pop(key)
+            return False
+        return True
+
+    def add(self, key):
+        """Record a delivered id.
+
+        :param key (str): The id.
+        """
+        now = time.time()
+        self.cache.put(key, now)
+        if self.db is None:
+            return
+        with self.lock:
+            with self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO delivered (id, delivered_at) VALUES (?, ?)",
+                    (key, now),
+                )
+            self.adds += 1
+            purge = self.adds % self.PURGE_INTERVAL == 0
+        if purge:
+            self.purge()
+
+    def purge(self):
+        """Remove the expired ids from the database."""
+        if self.db is None:
+            return
+        with self.lock:
+            with self.db:
+                self.db.execute(
+                    "DELETE FROM delivered WHERE delivered_at < ?",
+                    (time.time() - self.ttl,),
+                )
+
+    def close(self):
+        """Close the database."""
+        if self.db is not None:
+            with self.lock:
+                self.db.close()
+            self.db = None
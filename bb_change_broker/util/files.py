@@ -0,0 +1,55 @@
+"""Helpers for files that several processes share."""
+
+import fcntl
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """Hold an exclusive lock that is shared between processes.
+
+    :param path (str): The path of the lock file, created if missing.
+    :param blocking (bool): Whether to wait for the lock.
+    :return (bool): True if the lock was acquired, False otherwise.
+    """
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def write_atomic(path, data):
+    """Replace a file atomically, readers see either the old or the new data.
+
+    The data is flushed to disk before the file is replaced, and the
+    directory entry after it.
+
+    :param path (str): The path of the file.
+    :param data (str): The new content of the file.
+    """
+    temporary = "%s.%d.tmp" % (path, os.getpid())
+    with open(temporary, "w") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    sync_directory(os.path.dirname(path) or ".")
+
+
+def sync_directory(path):
+    """Flush the directory entries of a directory to disk.
+
+    :param path (str): The path of the directory.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -2,12 +2,121 @@
 
 import re
 
-AUTHOR_FILTER = r"^Author:\s+(.+)$"
-DIFF_FILTER = r"^:.*[MAD]\s+(.+)$"
-MERGE_FILTER = r"^Merge: .*$"
-COMMIT_FILTER = r"^([0-9a-f]+) (.*)$"
-BRANCH_FILTER = r"^refs\/heads\/(.+)$"
-ZERO_FILTER = r"^0*$"
+AUTHOR_FILTER = re.compile(r"^Author:\s+(.+)$")
+DIFF_FILTER = re.compile(r"^:.*[MAD]\s+(.+)$")
+MERGE_FILTER = re.compile(r"^Merge: .*$")
+COMMIT_FILTER = re.compile(r"^([0-9a-f]+) (.*)$")
+BRANCH_FILTER = re.compile(r"^refs\/heads\/(.+)$")
+ZERO_FILTER = re.compile(r"^0*$")
+COMMIT_HEADER_FILTER = re.compile(r"^commit ([0-9a-f]+)")
+
+
+class CommitInfo(object):
+    """The fields of a commit parsed from git show --raw --pretty=full."""
+
+    __slots__ = ("revision", "author", "files", "merge", "comments")
+
+    def __init__(self, revision=None):
+        """Initialize an empty commit info.
+
+        :param revision (str): The revision of the commit, None if the output
+            has no commit header.
+        """
+        self.revision = revision
+        self.author = None
+        # the files, a merge commit lists "merge" at the position of its Merge line
+        self.files = []
+        self.merge = False
+        self.comments = []
+
+    def add_line(self, line):
+        """Parse a line of the commit.
+
+        The first character selects the only pattern that can match, so each
+        line is matched at most once.
+
+        :param line (str): The line without line break.
+        """
+        first = line[:1]
+        if first == ":":
+            # the usual raw line is the status and a path without whitespace
+            # after a tab, which the diff pattern matches the same way,
+            # whitespace other than the space is not printable
+            meta, tab, path = line.partition("\t")
+            if (
+                tab
+                and meta[-1:] in "MAD"
+                and path
+                and " " not in path
+                and path.isprintable()
+            ):
+                self.files.append(path)
+                return
+            m = DIFF_FILTER.match(line)
+            if m:
+                self.files.append(m.group(1))
+        elif first == " ":
+            # XXX: If line starts with four spaces, is comment.
+            if line.startswith(4 * " "):
+                self.comments.append(line[4:])
+        elif first == "A":
+            if self.author is None:
+                m = AUTHOR_FILTER.match(line)
+                if m:
+                    self.author = m.group(1)
+        elif first == "M":
+            if MERGE_FILTER.match(line):
+                self.merge = True
+                self.files.append("merge")
+
+    def get_comments(self):
+        """Return the comments.
+
+        :return (str): The comment lines joined without separator.
+        """
+        return "".join(self.comments)
+
+
+def parse_commit_infos(lines, encoding="utf-8"):
+    """Parse the output of git show for one or several commits in one pass.
+
+    The lines can be read directly from the stdout of git, the output does not
+    need to be buffered. A commit ends where the header of the next one starts.
+
+    :param lines (iterable): The lines of the output as str or bytes, with or
+        without line breaks.
+    :param encoding (str): The encoding of bytes lines.
+    :return (iterator): The CommitInfo of each commit in the order of the output.
+    """
+    info = None
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode(encoding)
+        line = line.rstrip("\n")
+        if line[:7] == "commit ":
+            m = COMMIT_HEADER_FILTER.match(line)
+            if m:
+                if info is not None:
+                    yield info
+                info = CommitInfo(m.group(1))
+                continue
+        if info is None:
+            # output of a single commit without header
+            info = CommitInfo()
+        info.add_line(line)
+    if info is not None:
+        yield info
+
+
+def parse_commit_info(commit_info):
+    """Parse the output of git show for one commit.
+
+    :param commit_info (str): The git show output of the commit.
+    :return (CommitInfo): The parsed commit, empty if the output is empty.
+    """
+    for info in parse_commit_infos(commit_info.split("\n")):
+        return info
+    return CommitInfo()
 
 
 def extract_author(commit_info):
@@ -16,10 +125,7 @@ def extract_author(commit_info):
     :param commit_info: The commit info as a list of lines.
     :return: The author.
     """
-    for line in commit_info.split("\n"):
-        m = re.match(AUTHOR_FILTER, line)
-        if m:
-            return str(m.group(1))
+    return parse_commit_info(commit_info).author
 
 
 def extract_files(commit_info):
@@ -28,15 +134,7 @@ def extract_files(commit_info):
     :param commit_info: The commit info as a list of lines.
     :return: The files.
     """
-    files = []
-    for line in commit_info.split("\n"):
-        m = re.match(DIFF_FILTER, line)
-        if m:
-            files.append(str(m.group(1)))
-            continue
-        if re.match(MERGE_FILTER, line):
-            files.append("merge")
-    return files
+    return parse_commit_info(commit_info).files
 
 
 def extract_comments(commit_info):
@@ -45,11 +143,22 @@ def extract_comments(commit_info):
     :param commit_info: The commit info as a list of lines.
     :return: The comments.
     """
-    comments = []
-    for line in commit_info.split("\n"):
-        if line.startswith(4 * " "):  # XXX: If line starts with four spaces, is comment.
-            comments.append(line[4:])
-    return "".join(comments)
+    return parse_commit_info(commit_info).get_comments()
+
+
+def split_commits(output):
+    """Split the output of git show for several commits into one info per commit.
+
+    :param output: The output of git show for several commits.
+    :return: The commit infos in the order of the output.
+    """
+    commits = []
+    for line in output.split("\n"):
+        if COMMIT_HEADER_FILTER.match(line):
+            commits.append([])
+        if commits:
+            commits[-1].append(line)
+    return ["\n".join(lines) for lines in commits]
 
 
 def extract_branch(refname):
@@ -58,7 +167,7 @@ def extract_branch(refname):
     :param refname: The refname.
     :return: The branch.
     """
-    m = re.match(BRANCH_FILTER, refname)
+    m = BRANCH_FILTER.match(refname)
     return m.group(1) if m else None
 
 
@@ -70,7 +179,7 @@ def extract_files_from_diff(input):
     """
     files = []
     for line in input.split("\n"):
-        m = re.match(DIFF_FILTER, line)
+        m = DIFF_FILTER.match(line)
         if m:
             files.append(str(m.group(1)))
     return files
@@ -82,7 +191,7 @@ def extract_rev(input):
     :param input: The input.
     :return: The revision.
     """
-    m = re.match(COMMIT_FILTER, input.strip())
+    m = COMMIT_FILTER.match(input.strip())
     return m.group(1) if m else None
 
 
@@ -92,4 +201,4 @@ def is_zero(rev):
     :param newrev: The revision.
     :return: True if the branch is deleted, False otherwise.
     """
-    return re.match(ZERO_FILTER, rev)
+    return ZERO_FILTER.match(rev)
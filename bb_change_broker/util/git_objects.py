@@ -0,0 +1,525 @@
+"""Reader for the objects and refs of a git repository without running git."""
+
+import binascii
+import mmap
+import os
+import re
+import struct
+import zlib
+
+from bb_change_broker.util.cache import LRUCache
+
+OBJ_COMMIT = 1
+OBJ_TREE = 2
+OBJ_BLOB = 3
+OBJ_TAG = 4
+OBJ_OFS_DELTA = 6
+OBJ_REF_DELTA = 7
+
+TYPE_NAMES = {
+    OBJ_COMMIT: b"commit",
+    OBJ_TREE: b"tree",
+    OBJ_BLOB: b"blob",
+    OBJ_TAG: b"tag",
+}
+TYPE_NUMBERS = {name: number for number, name in TYPE_NAMES.items()}
+
+IDX_V2_HEADER = b"\377tOc\x00\x00\x00\x02"
+
+# an entry of a tree is the mode, the name and the binary id
+TREE_ENTRY_PATTERN = re.compile(rb"([0-7]+) ([^\0]*)\0(.{20})", re.DOTALL)
+
+
+def find_git_dir(path=None):
+    """Find the git directory of a repository.
+
+    Like git, GIT_DIR is used if set, otherwise the directory is searched
+    upwards for a .git directory or file, or a bare repository.
+
+    :param path (str): The directory to start from, None for the current one.
+    :return (str): The git directory.
+    """
+    path = os.path.abspath(path or os.getcwd())
+    if os.environ.get("GIT_DIR"):
+        return os.path.join(path, os.environ["GIT_DIR"])
+    while True:
+        dot_git = os.path.join(path, ".git")
+        if os.path.isdir(dot_git):
+            return dot_git
+        if os.path.isfile(dot_git):
+            # worktrees and submodules point to their git directory
+            with open(dot_git) as f:
+                gitdir = f.read().strip()
+            if gitdir.startswith("gitdir:"):
+                return os.path.join(path, gitdir[len("gitdir:") :].strip())
+        if os.path.isfile(os.path.join(path, "HEAD")) and os.path.isdir(
+            os.path.join(path, "objects")
+        ):
+            return path
+        parent = os.path.dirname(path)
+        if parent == path:
+            raise ValueError("Not a git repository: %s" % path)
+        path = parent
+
+
+def apply_delta(base, delta):
+    """Build an object from its base and a delta of a pack.
+
+    :param base (bytes): The content of the base object.
+    :param delta (bytes): The delta.
+    :return (bytes): The content of the object.
+    """
+    pos = 0
+    # skip the sizes of the base and the result
+    for _ in range(2):
+        while delta[pos] & 0x80:
+            pos += 1
+        pos += 1
+    result = []
+    end = len(delta)
+    while pos < end:
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:
+            # copy a range of the base, the set bits select the bytes present
+            offset = size = 0
+            for i in range(4):
+                if op & (1 << i):
+                    offset |= delta[pos] << (8 * i)
+                    pos += 1
+            for i in range(3):
+                if op & (0x10 << i):
+                    size |= delta[pos] << (8 * i)
+                    pos += 1
+            result.append(base[offset : offset + (size or 0x10000)])
+        elif op:
+            # insert the following bytes
+            result.append(delta[pos : pos + op])
+            pos += op
+        else:
+            raise ValueError("Invalid delta opcode 0")
+    return b"".join(result)
+
+
+class Pack(object):
+    """A pack file and its index, both memory mapped."""
+
+    def __init__(self, idx_path, cache):
+        """Open a pack.
+
+        :param idx_path (str): The path of the .idx file, the .pack file is next to it.
+        :param cache (LRUCache): The cache of delta bases shared by all packs,
+            keyed by the path of the pack, whose name is the hash of its content.
+        """
+        self.path = idx_path
+        self.cache = cache
+        with open(idx_path, "rb") as f:
+            self.idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(idx_path[: -len(".idx")] + ".pack", "rb") as f:
+            self.pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.idx[:8] == IDX_V2_HEADER:
+            self.version = 2
+            fanout = 8
+        else:
+            self.version = 1
+            fanout = 0
+        self.fanout = struct.unpack_from(">256I", self.idx, fanout)
+        self.count = self.fanout[255]
+        if self.version == 2:
+            self.names = fanout + 256 * 4
+            self.offsets = self.names + self.count * (20 + 4)
+            self.large_offsets = self.offsets + self.count * 4
+        else:
+            # v1 entries are the offset followed by the name
+            self.names = fanout + 256 * 4
+
+    def close(self):
+        """Close the memory maps."""
+        self.idx.close()
+        self.pack.close()
+
+    def find(self, sha):
+        """Return the offset of an object in the pack.
+
+        :param sha (bytes): The binary id of the object.
+        :return (int): The offset, None if the pack does not contain the object.
+        """
+        first = sha[0]
+        low = self.fanout[first - 1] if first else 0
+        high = self.fanout[first]
+        idx = self.idx
+        if self.version == 2:
+            names = self.names
+            while low < high:
+                middle = (low + high) // 2
+                name = idx[names + middle * 20 : names + middle * 20 + 20]
+                if name < sha:
+                    low = middle + 1
+                elif name > sha:
+                    high = middle
+                else:
+                    return self.__offset(middle)
+            return None
+        while low < high:
+            middle = (low + high) // 2
+            entry = self.names + middle * 24
+            name = idx[entry + 4 : entry + 24]
+            if name < sha:
+                low = middle + 1
+            elif name > sha:
+                high = middle
+            else:
+                return struct.unpack_from(">I", idx, entry)[0]
+        return None
+
+    def read(self, offset, store):
+        """Read the object at an offset.
+
+        :param offset (int): The offset of the object.
+        :param store (ObjectStore): The store, to resolve the bases of ref deltas.
+        :return (tuple): The type number and the content of the object.
+        """
+        cached = self.cache.get((self.path, offset))
+        if cached is not None:
+            return cached
+        pack = self.pack
+        byte = pack[offset]
+        pos = offset + 1
+        kind = (byte >> 4) & 7
+        size = byte & 0x0F
+        shift = 4
+        while byte & 0x80:
+            byte = pack[pos]
+            pos += 1
+            size |= (byte & 0x7F) << shift
+            shift += 7
+        if kind == OBJ_OFS_DELTA:
+            byte = pack[pos]
+            pos += 1
+            distance = byte & 0x7F
+            while byte & 0x80:
+                byte = pack[pos]
+                pos += 1
+                distance = ((distance + 1) << 7) | (byte & 0x7F)
+            base_kind, base = self.read(offset - distance, store)
+            result = (base_kind, apply_delta(base, self.__inflate(pos, size)))
+        elif kind == OBJ_REF_DELTA:
+            base_kind, base = store.read_raw(pack[pos : pos + 20])
+            result = (base_kind, apply_delta(base, self.__inflate(pos + 20, size)))
+        else:
+            result = (kind, self.__inflate(pos, size))
+        # trees and commits are the bases of the following deltas
+        if result[0] != OBJ_BLOB:
+            self.cache.put((self.path, offset), result)
+        return result
+
+    def __offset(self, index):
+        """Return the offset of the object with an index in a v2 index.
+
+        :param index (int): The position of the object in the index.
+        :return (int): The offset in the pack.
+        """
+        offset = struct.unpack_from(">I", self.idx, self.offsets + index * 4)[0]
+        if offset & 0x80000000:
+            offset = struct.unpack_from(
+                ">Q", self.idx, self.large_offsets + (offset & 0x7FFFFFFF) * 8
+            )[0]
+        return offset
+
+    def __inflate(self, pos, size):
+        """Decompress the data of an object.
+
+        :param pos (int): The start of the compressed data.
+        :param size (int): The size of the decompressed data.
+        :return (bytes): The decompressed data.
+        """
+        decompressor = zlib.decompressobj()
+        # compressed data is rarely larger than the data itself
+        chunk = size + 64
+        data = decompressor.decompress(self.pack[pos : pos + chunk])
+        while not decompressor.eof:
+            pos += chunk
+            if pos >= len(self.pack):
+                raise ValueError("Truncated object in pack")
+            data += decompressor.decompress(self.pack[pos : pos + chunk])
+        return data
+
+
+class ObjectStore(object):
+    """The objects of a repository, loose or in packs, and its refs.
+
+    Only repositories with SHA-1 object ids are supported.
+    """
+
+    def __init__(self, git_dir, cache_size=4096):
+        """Open the objects of a repository.
+
+        :param git_dir (str): The git directory.
+        :param cache_size (int): The number of delta bases kept in memory.
+        """
+        self.git_dir = git_dir
+        # linked worktrees share the objects and refs of the main repository
+        self.common_dir = git_dir
+        commondir = os.path.join(git_dir, "commondir")
+        if os.path.isfile(commondir):
+            with open(commondir) as f:
+                self.common_dir = os.path.normpath(
+                    os.path.join(git_dir, f.read().strip())
+                )
+        self.cache = LRUCache(cache_size)
+        self.object_dirs = self.__object_dirs(os.path.join(self.common_dir, "objects"))
+        self.packs = None
+        # status of the pack directories when the packs were listed
+        self.packs_status = None
+        self.packed_refs = None
+        # status of the packed-refs file when it was read
+        self.packed_refs_status = None
+
+    def close(self):
+        """Close the packs."""
+        for pack in self.packs or []:
+            pack.close()
+        self.packs = None
+
+    def read(self, sha):
+        """Read an object.
+
+        :param sha (str): The hex id of the object.
+        :return (tuple): The type ("commit", "tree", "blob" or "tag") and the content.
+        """
+        kind, data = self.read_raw(binascii.unhexlify(sha))
+        return TYPE_NAMES[kind].decode("ascii"), data
+
+    def read_raw(self, sha):
+        """Read an object by its binary id.
+
+        :param sha (bytes): The binary id of the object.
+        :return (tuple): The type number and the content.
+        """
+        for pack in self.__get_packs():
+            offset = pack.find(sha)
+            if offset is not None:
+                return pack.read(offset, self)
+        hex_sha = binascii.hexlify(sha).decode("ascii")
+        for object_dir in self.object_dirs:
+            path = os.path.join(object_dir, hex_sha[:2], hex_sha[2:])
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    raw = zlib.decompress(f.read())
+                header, _, data = raw.partition(b"\0")
+                return TYPE_NUMBERS[header.split(b" ")[0]], data
+        # a pack may have been added by a gc meanwhile
+        if self.__reload_packs():
+            return self.read_raw(sha)
+        raise KeyError("Object %s not found" % hex_sha)
+
+    def resolve(self, name):
+        """Resolve a revision to the id of a commit.
+
+        :param name (str): A hex id, a ref like refs/heads/master, HEAD or a branch.
+        :return (str): The hex id of the commit.
+        """
+        sha = None
+        if len(name) == 40 and all(c in "0123456789abcdef" for c in name):
+            sha = name
+        else:
+            for ref in (
+                name,
+                "refs/" + name,
+                "refs/heads/" + name,
+                "refs/tags/" + name,
+            ):
+                sha = self.read_ref(ref)
+                if sha is not None:
+                    break
+        if sha is None:
+            raise KeyError("Unknown revision %s" % name)
+        # peel annotated tags
+        kind, data = self.read(sha)
+        while kind == "tag":
+            sha = data.split(b"\n", 1)[0].split(b" ")[1].decode("ascii")
+            kind, data = self.read(sha)
+        return sha
+
+    def read_ref(self, ref):
+        """Read a ref, symbolic refs are followed.
+
+        :param ref (str): The full name of the ref, like refs/heads/master or HEAD.
+        :return (str): The hex id the ref points to, None if it does not exist.
+        """
+        for _ in range(10):
+            # HEAD of a linked worktree is its own, the other refs are shared
+            base = self.git_dir if ref == "HEAD" else self.common_dir
+            path = os.path.join(base, *ref.split("/"))
+            if os.path.isfile(path):
+                with open(path) as f:
+                    value = f.read().strip()
+                if value.startswith("ref:"):
+                    ref = value[len("ref:") :].strip()
+                    continue
+                return value
+            return self.__get_packed_refs().get(ref)
+        return None
+
+    def refs(self, prefix="refs/heads/"):
+        """Return the refs below a prefix, by default the heads of all branches.
+
+        :param prefix (str): The prefix of the refs, ending with a slash.
+        :return (dict): The hex id of each ref by its full name.
+        """
+        refs = {
+            ref: sha
+            for ref, sha in self.__get_packed_refs().items()
+            if ref.startswith(prefix)
+        }
+        root = os.path.join(self.common_dir, *prefix.rstrip("/").split("/"))
+        for directory, _, files in os.walk(root):
+            for name in files:
+                path = os.path.join(directory, name)
+                ref = prefix + os.path.relpath(path, root).replace(os.sep, "/")
+                sha = self.read_ref(ref)
+                if sha is not None:
+                    refs[ref] = sha
+        return refs
+
+    def __object_dirs(self, objects):
+        """Return the object directory and its alternates.
+
+        :param objects (str): The object directory.
+        :return (list): The object directories.
+        """
+        dirs = [objects]
+        alternates = os.path.join(objects, "info", "alternates")
+        if os.path.isfile(alternates):
+            with open(alternates) as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        dirs.extend(self.__object_dirs(os.path.join(objects, line)))
+        return dirs
+
+    def __get_packs(self):
+        """Return the packs, they are listed again when a pack directory changed.
+
+        :return (list): The packs.
+        """
+        if self.packs is None or self.packs_status != self.__packs_status():
+            self.__reload_packs()
+        return self.packs
+
+    def __reload_packs(self) -> bool:
+        """Open the packs that were not opened yet and drop the removed ones.
+
+        A repack or gc replaces packs. The dropped packs are unmapped once
+        no reader uses them anymore.
+
+        :return (bool): True if a new pack was opened, False otherwise.
+        """
+        self.packs_status = self.__packs_status()
+        paths = []
+        for object_dir in self.object_dirs:
+            pack_dir = os.path.join(object_dir, "pack")
+            if not os.path.isdir(pack_dir):
+                continue
+            for name in sorted(os.listdir(pack_dir)):
+                path = os.path.join(pack_dir, name)
+                if name.endswith(".idx") and os.path.isfile(
+                    path[: -len(".idx")] + ".pack"
+                ):
+                    paths.append(path)
+        opened = {pack.path: pack for pack in self.packs or []}
+        # readers of other threads keep iterating over the old list
+        self.packs = [
+            opened[path] if path in opened else Pack(path, self.cache) for path in paths
+        ]
+        return any(path not in opened for path in paths)
+
+    def __packs_status(self):
+        """Return the status of the pack directories, a new pack changes it.
+
+        :return (list): The status of each pack directory, None
+            for missing ones.
+        """
+        return [
+            self.__file_status(os.path.join(object_dir, "pack"))
+            for object_dir in self.object_dirs
+        ]
+
+    def __file_status(self, path):
+        """Return what changes when a file is replaced or written.
+
+        :param path (str): The path of the file.
+        :return (tuple): The inode, size and modification time, None if the
+            file does not exist.
+        """
+        try:
+            status = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return status.st_ino, status.st_size, status.st_mtime_ns
+
+    def __get_packed_refs(self):
+        """Return the refs of the packed-refs file.
+
+        The file is read again when git pack-refs or gc rewrote it.
+
+        :return (dict): The hex id of each ref by its full name.
+        """
+        path = os.path.join(self.common_dir, "packed-refs")
+        status = self.__file_status(path)
+        if self.packed_refs is None or status != self.packed_refs_status:
+            packed_refs = {}
+            if status is not None:
+                with open(path) as f:
+                    for line in f:
+                        # comments and the peeled ids of tags
+                        if line.startswith("#") or line.startswith("^"):
+                            continue
+                        parts = line.split()
+                        if len(parts) == 2:
+                            packed_refs[parts[1]] = parts[0]
+            self.packed_refs = packed_refs
+            self.packed_refs_status = status
+        return self.packed_refs
+
+
+class Commit(object):
+    """The fields of a commit object."""
+
+    __slots__ = ("sha", "tree", "parents", "author", "committer", "date", "message")
+
+    def __init__(self, sha, data):
+        """Parse a commit object.
+
+        :param sha (str): The hex id of the commit.
+        :param data (bytes): The content of the commit object.
+        """
+        self.sha = sha
+        self.tree = None
+        self.parents = []
+        self.author = self.committer = b""
+        self.date = 0
+        headers, _, self.message = data.partition(b"\n\n")
+        for line in headers.split(b"\n"):
+            # continuation lines of multi-line headers like gpgsig start with a space
+            key, _, value = line.partition(b" ")
+            if key == b"tree":
+                self.tree = value.decode("ascii")
+            elif key == b"parent":
+                self.parents.append(value.decode("ascii"))
+            elif key == b"author":
+                self.author = value
+            elif key == b"committer":
+                self.committer = value
+                self.date = int(value.rsplit(b" ", 2)[1])
+
+
+def parse_tree(data):
+    """Parse a tree object.
+
+    :param data (bytes): The content of the tree object.
+    :return (list): The entries as (mode, name, id) tuples in the order of the
+        tree, the mode is the octal string of the object, like b"100644" or
+        b"40000" for trees, and the id is binary.
+    """
+    return TREE_ENTRY_PATTERN.findall(data)
@@ -1,7 +1,6 @@
 """Implementation of a logger that logs to a file."""
 
 import logging
-import logging.config
 
 
 class Logger:
@@ -14,7 +13,10 @@ class Logger:
         :param debug_level (int): The debug level of the logger.
         """
         if logging_config is not None:
-            logging.config.dictConfig(logging_config)
+            # dictConfig pulls in a lot of modules, only load it when it is used
+            from logging.config import dictConfig
+
+            dictConfig(logging_config)
         else:
             logging.basicConfig(filename="/dev/null", level=logging.CRITICAL)
         self.logger = logging.getLogger("bb_change_broker")
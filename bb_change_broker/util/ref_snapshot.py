@@ -0,0 +1,199 @@
+"""Snapshot of the published branch heads of a repository that is kept on disk."""
+
+from bb_change_broker.util.files import file_lock, write_atomic
+from bb_change_broker.util.git import is_zero
+
+
+class RefSnapshot(object):
+    """Map of the published branch heads, updated after each publish.
+
+    Besides the head of each branch, the snapshot keeps boundary commits
+    whose history contains the commits of all branches. A new branch lists
+    the commits that are not reachable from the boundaries, which are much
+    fewer than all branches: a branch created without new commits adds no
+    boundary, and a fast-forward replaces the old head.
+
+    The file has a line with the head and the name of each branch, followed
+    by a line with each boundary commit.
+    """
+
+    LOCK_SUFFIX = ".lock"
+    HEADS = "refs/heads/"
+    ZERO = "0" * 40
+
+    def __init__(self, path):
+        """Initialize the snapshot.
+
+        :param path (str): The path of the snapshot file.
+        """
+        self.path = path
+        # head of each branch by full ref name
+        self.refs = {}
+        # number of branches per head
+        self.heads = {}
+        self.boundaries = set()
+
+    def load(self) -> bool:
+        """Read the snapshot from disk.
+
+        :return (bool): True if the snapshot exists, False otherwise.
+        """
+        self.refs = {}
+        self.heads = {}
+        self.boundaries = set()
+        try:
+            f = open(self.path)
+        except FileNotFoundError:
+            return False
+        with f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    self.__set(parts[1], parts[0])
+                elif len(parts) == 1:
+                    self.boundaries.add(parts[0])
+        return True
+
+    def catch_up(self, refs) -> list:
+        """Start the updated branches at their published heads.
+
+        A branch whose old revision differs from the snapshot missed an
+        update, for example because a hook was killed. It is listed from its
+        published head instead, so the push publishes the missed commits too.
+
+        :param refs (list): The updated refs as (oldrev, newrev, refname) tuples.
+        :return (list): The refs with the published heads as old revisions.
+        """
+        caught_up = []
+        for oldrev, newrev, refname in refs:
+            published = self.refs.get(refname)
+            if refname.startswith(self.HEADS) and published != (
+                None if is_zero(oldrev) else oldrev
+            ):
+                oldrev = published or self.ZERO
+            caught_up.append((oldrev, newrev, refname))
+        return caught_up
+
+    def diff(self, refs) -> list:
+        """Compare the snapshot with the current branches.
+
+        :param refs (dict): The current head of each branch by full ref name.
+        :return (list): The branches that changed since they were published
+            as (oldrev, newrev, refname) tuples, zero revisions for created
+            and deleted branches.
+        """
+        missed = [
+            (self.refs.get(refname, self.ZERO), sha, refname)
+            for refname, sha in sorted(refs.items())
+            if self.refs.get(refname) != sha
+        ]
+        missed.extend(
+            (sha, self.ZERO, refname)
+            for refname, sha in sorted(self.refs.items())
+            if refname not in refs
+        )
+        return missed
+
+    def rebuild(self, refs):
+        """Replace the snapshot with the current branches.
+
+        All heads are boundaries, see get_boundaries.
+
+        :param refs (dict): The head of each branch by full ref name.
+        """
+        self.refs = {}
+        self.heads = {}
+        for refname, sha in refs.items():
+            self.__set(refname, sha)
+        self.boundaries = set(self.heads)
+
+    def get_boundaries(self, refs, refname, newrev) -> list:
+        """Return the boundaries of a branch that was created by a push.
+
+        Like git rev-parse --not --branches, the boundaries cover all other
+        branches after the push, but not the commit of the new branch.
+
+        :param refs (list): The refs updated by the push as (oldrev, newrev,
+            refname) tuples, empty if the snapshot already contains them.
+        :param refname (str): The full name of the new branch.
+        :param newrev (str): The head of the new branch.
+        :return (list): The boundary commits.
+        """
+        boundaries = set(self.boundaries)
+        heads = dict(self.heads)
+        for pushed_oldrev, pushed_newrev, pushed_refname in refs:
+            if not pushed_refname.startswith(self.HEADS):
+                continue
+            # deleted or moved heads no longer cover their history, unless
+            # another branch still points to them
+            if not is_zero(pushed_oldrev):
+                heads[pushed_oldrev] = heads.get(pushed_oldrev, 1) - 1
+                if not heads[pushed_oldrev]:
+                    boundaries.discard(pushed_oldrev)
+            if pushed_refname != refname and not is_zero(pushed_newrev):
+                boundaries.add(pushed_newrev)
+        boundaries.discard(newrev)
+        return sorted(boundaries)
+
+    def update(self, refs, covered=()):
+        """Apply the refs of a push to the snapshot on disk.
+
+        The snapshot is read again while it is locked, so runs of concurrent
+        pushes do not drop each other's updates. A branch is only moved if
+        the snapshot still has its old revision, a run that published the
+        branch further already does not go back.
+
+        :param refs (list): The updated refs as (oldrev, newrev, refname) tuples.
+        :param covered (set): The names of branches that were created without
+            new commits, their heads are covered by the boundaries already.
+        """
+        with file_lock(self.path + self.LOCK_SUFFIX):
+            self.load()
+            for oldrev, newrev, refname in refs:
+                if not refname.startswith(self.HEADS):
+                    continue
+                if self.refs.get(refname) != (None if is_zero(oldrev) else oldrev):
+                    continue
+                self.__remove(refname)
+                if is_zero(newrev):
+                    continue
+                self.__set(refname, newrev)
+                if refname not in covered:
+                    self.boundaries.add(newrev)
+            self.__write()
+
+    def save(self):
+        """Write the snapshot to disk."""
+        with file_lock(self.path + self.LOCK_SUFFIX):
+            self.__write()
+
+    def __set(self, refname, sha):
+        """Set the head of a branch.
+
+        :param refname (str): The full name of the branch.
+        :param sha (str): The head.
+        """
+        self.refs[refname] = sha
+        self.heads[sha] = self.heads.get(sha, 0) + 1
+
+    def __remove(self, refname):
+        """Remove a branch, its head stops being a boundary if no other branch
+        points to it.
+
+        :param refname (str): The full name of the branch.
+        """
+        sha = self.refs.pop(refname, None)
+        if sha is None:
+            return
+        self.heads[sha] -= 1
+        if not self.heads[sha]:
+            del self.heads[sha]
+            self.boundaries.discard(sha)
+
+    def __write(self):
+        """Replace the file atomically with the current snapshot."""
+        lines = [
+            "%s %s\n" % (self.refs[refname], refname) for refname in sorted(self.refs)
+        ]
+        lines.extend("%s\n" % sha for sha in sorted(self.boundaries))
+        write_atomic(self.path, "".join(lines))
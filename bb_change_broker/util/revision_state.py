@@ -0,0 +1,42 @@
+"""Last published revision of a subversion repository that is kept on disk."""
+
+from bb_change_broker.util.files import file_lock, write_atomic
+
+
+class RevisionState(object):
+    """The last revision up to which all revisions were published.
+
+    Hooks of consecutive commits run concurrently and may finish in any
+    order, so the state only moves forward.
+    """
+
+    LOCK_SUFFIX = ".lock"
+
+    def __init__(self, path):
+        """Initialize the state.
+
+        :param path (str): The path of the state file.
+        """
+        self.path = path
+
+    def load(self):
+        """Read the last published revision.
+
+        :return (int): The revision, None if the state does not exist.
+        """
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip())
+        except FileNotFoundError:
+            return None
+
+    def update(self, revision):
+        """Store a published revision, unless a later one is stored already.
+
+        :param revision (int): The revision.
+        """
+        with file_lock(self.path + self.LOCK_SUFFIX):
+            last = self.load()
+            if last is not None and last >= revision:
+                return
+            write_atomic(self.path, "%d\n" % revision)
@@ -0,0 +1,307 @@
+"""Durable local spool for messages that could not be published."""
+
+import os
+import struct
+import zlib
+
+from bb_change_broker.util.files import file_lock, sync_directory, write_atomic
+
+
+class Spool(object):
+    """Append only spool of messages on disk.
+
+    Messages are appended to segment files and fsync'd before append
+    returns. Several processes can append at the same time. A drain replays
+    the messages of all closed segments in order and deletes a segment once
+    all its messages were published. A record that an append killed midway
+    left at the end of a segment is cut off by the next append, which only
+    checks the records after the end of the last append. A segment
+    with unreadable bytes after its messages is kept with the corrupt suffix
+    instead of being deleted.
+
+    Each record is a header with the length and crc32 of the payload,
+    followed by the payload: the content type, a newline and the body.
+    """
+
+    HEADER = struct.Struct(">II")
+    SEGMENT_SUFFIX = ".seg"
+    OFFSET_SUFFIX = ".offset"
+    END_SUFFIX = ".end"
+    CORRUPT_SUFFIX = ".corrupt"
+    APPEND_LOCK = "append.lock"
+    DRAIN_LOCK = "drain.lock"
+
+    def __init__(self, directory, logger, segment_size=16 * 1024 * 1024):
+        """Initialize the spool.
+
+        :param directory (str): The directory of the spool, created if missing.
+        :param logger (Logger): The logger to use.
+        :param segment_size (int): The size in bytes after which a new segment is started.
+        """
+        self.directory = directory
+        self.logger = logger
+        self.segment_size = segment_size
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, records):
+        """Append messages to the spool.
+
+        :param records (list): The messages as (content type, body) tuples.
+        """
+        data = b"".join(
+            self.__encode(content_type, body) for content_type, body in records
+        )
+        if not data:
+            return
+        with file_lock(self.__lock_path(self.APPEND_LOCK)):
+            segments = self.__segments()
+            if (
+                not segments
+                or os.path.getsize(self.__path(segments[-1])) >= self.segment_size
+            ):
+                segments.append(segments[-1] + 1 if segments else 0)
+            else:
+                self.__truncate(segments[-1])
+            with open(self.__path(segments[-1]), "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+                end = f.tell()
+            sync_directory(self.directory)
+            self.__write_end(segments[-1], end)
+        self.logger.info("Spooled %d message(s) in %s", len(records), self.directory)
+
+    def is_empty(self):
+        """Check if the spool holds no messages.
+
+        :return (bool): True if the spool is empty, False otherwise.
+        """
+        return all(
+            os.path.getsize(self.__path(segment)) == 0 for segment in self.__segments()
+        )
+
+    def drain(self, publish):
+        """Replay the spooled messages in order.
+
+        The segment that is currently written to is closed first, so new
+        messages go to a new segment. Only one process drains at a time,
+        other drains return immediately.
+
+        :param publish (function): Function that publishes a list of
+            (content type, body) tuples and returns how many of them, counted
+            from the start, were published.
+        :return (int): The number of published messages.
+        """
+        published = 0
+        with file_lock(self.__lock_path(self.DRAIN_LOCK), blocking=False) as locked:
+            if not locked:
+                self.logger.info(
+                    "Spool %s is drained by another process", self.directory
+                )
+                return 0
+            with file_lock(self.__lock_path(self.APPEND_LOCK)):
+                segments = self.__segments()
+                if not segments:
+                    return 0
+                if os.path.getsize(self.__path(segments[-1])) > 0:
+                    open(self.__path(segments[-1] + 1), "ab").close()
+                    sync_directory(self.directory)
+                else:
+                    segments.pop()
+            for segment in segments:
+                offset = self.__read_offset(segment)
+                records, end = self.__read(segment)
+                records = records[offset:]
+                count = publish(records) if records else 0
+                published += count
+                if count < len(records):
+                    self.__write_offset(segment, offset + count)
+                    self.logger.warning(
+                        "Stopped draining spool %s, %d message(s) left in segment %d",
+                        self.directory,
+                        len(records) - count,
+                        segment,
+                    )
+                    break
+                if end < os.path.getsize(self.__path(segment)):
+                    self.__set_aside(segment)
+                else:
+                    self.__remove(segment)
+        self.logger.info(
+            "Drained %d message(s) from spool %s", published, self.directory
+        )
+        return published
+
+    def __encode(self, content_type, body):
+        """Encode a message as record.
+
+        :param content_type (str): The content type of the message.
+        :param body (bytes): The body of the message.
+        :return (bytes): The record.
+        """
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        payload = (content_type or "").encode("utf-8") + b"\n" + body
+        return self.HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+    def __read(self, segment, start=0):
+        """Read the messages of a segment.
+
+        A record that was not written completely ends the segment.
+
+        :param segment (int): The number of the segment.
+        :param start (int): The position of the first record to read.
+        :return (tuple): The messages as (content type, body) tuples and the
+            position after them.
+        """
+        records = []
+        with open(self.__path(segment), "rb") as f:
+            f.seek(start)
+            data = f.read()
+        position = 0
+        while position < len(data):
+            header = data[position : position + self.HEADER.size]
+            if len(header) < self.HEADER.size:
+                break
+            length, crc = self.HEADER.unpack(header)
+            begin = position + self.HEADER.size
+            payload = data[begin : begin + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            content_type, body = payload.split(b"\n", 1)
+            records.append((content_type.decode("utf-8") or None, body))
+            position = begin + length
+        return records, start + position
+
+    def __truncate(self, segment):
+        """Cut off a record that an append did not write completely.
+
+        Only the bytes after the end of the last append are checked.
+
+        :param segment (int): The number of the segment.
+        """
+        path = self.__path(segment)
+        size = os.path.getsize(path)
+        start = self.__read_end(segment)
+        if start > size:
+            start = 0
+        if start == size:
+            return
+        end = self.__read(segment, start)[1]
+        if end == start and start > 0:
+            # the end is only a hint, the whole segment decides
+            end = self.__read(segment)[1]
+        if end == size:
+            return
+        self.logger.warning(
+            "Truncating %d byte(s) of an incomplete record in segment %d of spool %s",
+            size - end,
+            segment,
+            self.directory,
+        )
+        with open(path, "r+b") as f:
+            f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def __segments(self):
+        """Return the numbers of the segments in order.
+
+        :return (list): The segment numbers.
+        """
+        return sorted(
+            int(name[: -len(self.SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(self.SEGMENT_SUFFIX)
+        )
+
+    def __path(self, segment, suffix=SEGMENT_SUFFIX):
+        """Return the path of a segment file.
+
+        :param segment (int): The number of the segment.
+        :param suffix (str): The suffix of the file.
+        :return (str): The path.
+        """
+        return os.path.join(self.directory, "%020d%s" % (segment, suffix))
+
+    def __read_offset(self, segment):
+        """Return the number of already published messages of a segment.
+
+        :param segment (int): The number of the segment.
+        :return (int): The number of published messages.
+        """
+        try:
+            with open(self.__path(segment, self.OFFSET_SUFFIX), "r") as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    def __write_offset(self, segment, offset):
+        """Store the number of already published messages of a segment.
+
+        :param segment (int): The number of the segment.
+        :param offset (int): The number of published messages.
+        """
+        write_atomic(self.__path(segment, self.OFFSET_SUFFIX), str(offset))
+
+    def __read_end(self, segment):
+        """Return the end of the last append to a segment.
+
+        :param segment (int): The number of the segment.
+        :return (int): The position after the last appended record, 0 if unknown.
+        """
+        try:
+            with open(self.__path(segment, self.END_SUFFIX), "r") as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    def __write_end(self, segment, end):
+        """Store the end of the last append to a segment.
+
+        The end is only a hint, so it is not flushed to disk: a lost end
+        makes the next append check the whole segment.
+
+        :param segment (int): The number of the segment.
+        :param end (int): The position after the last appended record.
+        """
+        path = self.__path(segment, self.END_SUFFIX)
+        temporary = "%s.%d.tmp" % (path, os.getpid())
+        with open(temporary, "w") as f:
+            f.write(str(end))
+        os.replace(temporary, path)
+
+    def __remove(self, segment):
+        """Delete a segment, its offset and its end.
+
+        :param segment (int): The number of the segment.
+        """
+        for suffix in (self.OFFSET_SUFFIX, self.END_SUFFIX, self.SEGMENT_SUFFIX):
+            try:
+                os.remove(self.__path(segment, suffix))
+            except FileNotFoundError:
+                pass
+        sync_directory(self.directory)
+
+    def __set_aside(self, segment):
+        """Keep a segment with unreadable bytes for inspection.
+
+        :param segment (int): The number of the segment.
+        """
+        path = self.__path(segment, self.CORRUPT_SUFFIX)
+        self.logger.error(
+            "Segment %d of spool %s has unreadable bytes after its messages, kept as %s",
+            segment,
+            self.directory,
+            path,
+        )
+        os.replace(self.__path(segment), path)
+        self.__remove(segment)
+
+    def __lock_path(self, name):
+        """Return the path of a lock file of the spool.
+
+        :param name (str): The name of the lock file.
+        :return (str): The path.
+        """
+        return os.path.join(self.directory, name)
@@ -0,0 +1,76 @@
+"""Benchmark of the wire codecs.
+
+Compares encode and decode time and payload size of the codecs for change
+dicts with many files, as they are produced by large pushes.
+
+Usage: python benchmark/bench_codec.py [number_of_files]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bb_change_broker.codec.registry import CODECS, get_codec
+
+
+def make_change(number_of_files):
+    """Build a realistic change dict.
+
+    :param number_of_files (int): The number of files of the change.
+    :return (dict): The change.
+    """
+    return {
+        "branch": "feature/some-long-branch-name",
+        "revision": "83060a21145596e42d985c798c32aa4b581b7b4f",
+        "repository": "/srv/git/project.git",
+        "author": "Some User <some.user@example.com>",
+        "comments": "Refactor the module layout\n\nMove all sources to src/.\n" * 4,
+        "files": [
+            "src/module%03d/sub%02d/file_%05d.py" % (i % 100, i % 17, i)
+            for i in range(number_of_files)
+        ],
+    }
+
+
+def bench(codec, change, number):
+    """Measure a codec.
+
+    :param codec (BaseCodec): The codec to measure.
+    :param change (dict): The change to encode.
+    :param number (int): The number of repetitions.
+    :return (tuple): Encode and decode time in ms and payload size in bytes.
+    """
+    body = codec.encode(change)
+    assert codec.decode(body) == change
+    encode = min(timeit.repeat(lambda: codec.encode(change), number=number, repeat=3))
+    decode = min(timeit.repeat(lambda: codec.decode(body), number=number, repeat=3))
+    return encode / number * 1000, decode / number * 1000, len(body)
+
+
+def main():
+    """Run the benchmark."""
+    sizes = [int(sys.argv[1])] if len(sys.argv) > 1 else [10, 1000, 5000]
+    print(
+        "%-8s %8s %12s %12s %12s"
+        % ("codec", "files", "encode ms", "decode ms", "bytes")
+    )
+    for number_of_files in sizes:
+        change = make_change(number_of_files)
+        number = max(1, 2000 // number_of_files)
+        for name in CODECS:
+            try:
+                codec = get_codec(name)
+            except ValueError as e:
+                print("%-8s %8d skipped: %s" % (name, number_of_files, e))
+                continue
+            encode, decode, size = bench(codec, change, number)
+            print(
+                "%-8s %8d %12.3f %12.3f %12d"
+                % (name, number_of_files, encode, decode, size)
+            )
+
+
+if __name__ == "__main__":
+    main()
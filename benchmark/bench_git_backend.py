@@ -0,0 +1,93 @@
+"""Benchmark of the git backends of the change source.
+
+Builds a repository with git fast-import and collects the changes of pushes
+of different sizes with the DefaultCli, which runs git commands, and the
+ObjectCli, which reads the objects of the repository in the process.
+
+Usage: python benchmark/bench_git_backend.py [number_of_commits]
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bb_change_broker.backend.cli import DefaultCli
+from bb_change_broker.backend.object_cli import ObjectCli
+from bb_change_broker.change_source.git import GitChangeSource
+from bb_change_broker.util.log import Logger
+
+
+def make_repository(directory, number_of_commits, number_of_files=2000):
+    """Create a packed repository with a linear history on master.
+
+    :param directory (str): The directory of the repository.
+    :param number_of_commits (int): The number of commits.
+    :param number_of_files (int): The number of files of the tree.
+    """
+    subprocess.check_call(["git", "init", "-q", "--bare", directory])
+    stream = []
+    for i in range(number_of_commits):
+        stream.append(
+            "commit refs/heads/master\n"
+            "committer Some User <some.user@example.com> %d +0000\n"
+            "data <<EOF\nCommit %d\n\nChange some files.\nEOF\n" % (1600000000 + i, i)
+        )
+        # the first commit adds all files, the others change a few of them
+        paths = (
+            range(number_of_files)
+            if i == 0
+            else [(i * 7 + j * 131) % number_of_files for j in range(5)]
+        )
+        for path in paths:
+            content = "file %d version %d\n" % (path, i)
+            stream.append(
+                "M 100644 inline src/module%02d/file%05d.txt\ndata %d\n%s\n"
+                % (path % 50, path, len(content), content)
+            )
+    subprocess.run(
+        ["git", "fast-import", "--quiet"],
+        input="".join(stream).encode("utf-8"),
+        cwd=directory,
+        check=True,
+    )
+    # recent objects are stored whole like after a gc, older ones as deltas
+    subprocess.check_call(["git", "repack", "-adfq"], cwd=directory)
+
+
+def main():
+    """Run the benchmark."""
+    number_of_commits = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    directory = tempfile.mkdtemp()
+    try:
+        make_repository(directory, number_of_commits)
+        revs = (
+            subprocess.check_output(["git", "rev-list", "master"], cwd=directory)
+            .decode("ascii")
+            .split()
+        )
+        print("%-8s %8s %12s" % ("backend", "commits", "ms"))
+        for pushed in (1, 10, min(500, number_of_commits - 1)):
+            refs = [(revs[pushed], revs[0], "refs/heads/master")]
+            results = []
+            for name, cli in (
+                ("cli", DefaultCli(cwd=directory)),
+                ("objects", ObjectCli(cwd=directory)),
+            ):
+                change_source = GitChangeSource(directory, Logger(), cli=cli)
+                start = time.perf_counter()
+                changes = change_source.get_changes(refs)
+                elapsed = time.perf_counter() - start
+                results.append(changes)
+                print("%-8s %8d %12.1f" % (name, pushed, elapsed * 1000))
+            assert results[0] == results[1]
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Benchmark of the git show parser.
+
+Compares the single pass parser with the previous approach, which scanned the
+output of a commit once per extracted field with uncompiled patterns, for
+synthetic commits that touch many files.
+
+Usage: python benchmark/bench_git_parse.py [number_of_files]
+"""
+
+import io
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bb_change_broker.util.git import parse_commit_info, parse_commit_infos
+
+
+def make_commit_info(
+    number_of_files, revision="83060a21145596e42d985c798c32aa4b581b7b4f"
+):
+    """Build the git show --raw --pretty=full output of a commit.
+
+    :param number_of_files (int): The number of files of the commit.
+    :param revision (str): The revision of the commit.
+    :return (str): The output.
+    """
+    lines = [
+        "commit %s" % revision,
+        "Author: Some User <some.user@example.com>",
+        "Commit: Some User <some.user@example.com>",
+        "",
+        "    Refactor the module layout",
+        "",
+        "    Move all sources to src/.",
+        "",
+    ]
+    lines.extend(
+        ":100644 100644 e69de29 7b57bd2 %s\tsrc/module%03d/sub%02d/file_%05d.py"
+        % ("MAD"[i % 3], i % 100, i % 17, i)
+        for i in range(number_of_files)
+    )
+    return "\n".join(lines) + "\n"
+
+
+def parse_three_passes(commit_info):
+    """Parse a commit like the extract functions did before the single pass parser.
+
+    :param commit_info (str): The output of the commit.
+    :return (tuple): The author, files and comments.
+    """
+    author = None
+    for line in commit_info.split("\n"):
+        m = re.match(r"^Author:\s+(.+)$", line)
+        if m:
+            author = str(m.group(1))
+            break
+    files = []
+    for line in commit_info.split("\n"):
+        m = re.match(r"^:.*[MAD]\s+(.+)$", line)
+        if m:
+            files.append(str(m.group(1)))
+            continue
+        if re.match(r"^Merge: .*$", line):
+            files.append("merge")
+    comments = []
+    for line in commit_info.split("\n"):
+        if line.startswith(4 * " "):
+            comments.append(line[4:])
+    return author, files, "".join(comments)
+
+
+def parse_single_pass(commit_info):
+    """Parse a commit with the single pass parser.
+
+    :param commit_info (str): The output of the commit.
+    :return (tuple): The author, files and comments.
+    """
+    info = parse_commit_info(commit_info)
+    return info.author, info.files, info.get_comments()
+
+
+def parse_stream(output):
+    """Parse the bytes output of several commits as read from a pipe.
+
+    :param output (bytes): The output.
+    :return (int): The number of files of all commits.
+    """
+    return sum(len(info.files) for info in parse_commit_infos(io.BytesIO(output)))
+
+
+def main():
+    """Run the benchmark."""
+    sizes = [int(sys.argv[1])] if len(sys.argv) > 1 else [10, 1000, 50000]
+    print("%-14s %8s %12s" % ("parser", "files", "ms"))
+    for number_of_files in sizes:
+        commit_info = make_commit_info(number_of_files)
+        assert parse_three_passes(commit_info) == parse_single_pass(commit_info)
+        number = max(1, 20000 // number_of_files)
+        for name, function in (
+            ("three passes", parse_three_passes),
+            ("single pass", parse_single_pass),
+        ):
+            elapsed = min(
+                timeit.repeat(lambda: function(commit_info), number=number, repeat=3)
+            )
+            print("%-14s %8d %12.3f" % (name, number_of_files, elapsed / number * 1000))
+        # ten commits that share the files, parsed from a byte stream
+        output = "".join(
+            make_commit_info(number_of_files // 10 or 1, "%040x" % i) for i in range(10)
+        ).encode("utf-8")
+        elapsed = min(
+            timeit.repeat(lambda: parse_stream(output), number=number, repeat=3)
+        )
+        print("%-14s %8d %12.3f" % ("stream", number_of_files, elapsed / number * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Benchmark of the cold start of the entry points.
+
+Imports each entry point in a fresh interpreter with -X importtime and
+reports the median cumulative import time and the number of loaded modules.
+Exits with status 1 when the fastest import of a module exceeds its budget.
+Requires Python 3.7 or newer.
+
+Usage: python benchmark/bench_import.py [repetitions]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+MODULES = [
+    "bb_change_broker.hook",
+    "bb_change_broker.client",
+    "bb_change_broker.agent",
+    "bb_change_broker.server",
+]
+
+# import budgets in ms on a developer machine, where the hook takes about
+# 25 ms and the client about 70 ms
+BUDGETS = {
+    "bb_change_broker.hook": 50,
+    "bb_change_broker.client": 120,
+}
+
+
+def import_time(module):
+    """Import a module in a fresh interpreter.
+
+    :param module (str): The module to import.
+    :return (tuple): The cumulative import time in ms, the number of modules
+        and whether pika was loaded.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=dict(os.environ, PYTHONPATH=ROOT),
+        check=True,
+    )
+    times = {}
+    for line in proc.stderr.decode("utf-8").splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times[module] / 1000, len(times), "pika" in times
+
+
+def main():
+    """Run the benchmark."""
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(
+        "%-26s %10s %8s %6s %7s" % ("module", "import ms", "modules", "pika", "budget")
+    )
+    over_budget = False
+    for module in MODULES:
+        runs = [import_time(module) for _ in range(repetitions)]
+        budget = BUDGETS.get(module)
+        # the fastest run is the least disturbed by the load of the machine
+        over = budget is not None and min(run[0] for run in runs) > budget
+        over_budget = over_budget or over
+        print(
+            "%-26s %10.1f %8d %6s %7s"
+            % (
+                module,
+                statistics.median(run[0] for run in runs),
+                runs[0][1],
+                "yes" if runs[0][2] else "no",
+                "-" if budget is None else ("over" if over else "ok"),
+            )
+        )
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import asyncio
+
+from mock.broker import MockMethod, MockProperties
+from bb_change_broker.backend.async_broker import (
+    BaseAsyncBrokerChannel,
+    BaseAsyncBrokerConnection,
+    BaseAsyncBrokerHandler,
+)
+
+
+class MockAsyncBrokerHandler(BaseAsyncBrokerHandler):
+    """Class for asyncio broker handler, all connections share one channel."""
+
+    def __init__(self):
+        self.channel = MockAsyncChannel()
+        self.connections = 0
+
+    def credentials(self, username, password):
+        """Return credentials for broker connection."""
+        return None
+
+    def connection_parameters(self, host, port, virtual_host, credentials):
+        """Return connection parameters for broker connection."""
+        return None
+
+    async def connect(self, connection_parameters):
+        """Open a connection to broker."""
+        self.connections += 1
+        return MockAsyncConnection(self.channel)
+
+
+class MockAsyncConnection(BaseAsyncBrokerConnection):
+    """Class for asyncio broker connection."""
+
+    def __init__(self, channel):
+        """Initialize the connection.
+
+        :param channel (MockAsyncChannel): The channel of the connection.
+        """
+        self.ch = channel
+        self.open = True
+        self.closed = asyncio.get_event_loop().create_future()
+
+    async def channel(self):
+        """Return the channel of the connection."""
+        self.ch.connection = self
+        return self.ch
+
+    async def close(self):
+        """Close the connection to broker."""
+        if self.open:
+            self.open = False
+            self.closed.set_result(None)
+
+    def is_open(self):
+        """Return whether the connection to broker is open."""
+        return self.open
+
+    async def wait_closed(self):
+        """Wait until the connection is closed."""
+        await asyncio.shield(self.closed)
+
+
+class MockAsyncChannel(BaseAsyncBrokerChannel):
+    """Class for asyncio broker channel.
+
+    Delivers one message per iteration of the loop and closes the connection
+    when the queue is empty, to simulate a disconnect.
+    """
+
+    def __init__(self):
+        self.queue = {}
+        self.arguments = {}
+        self.callback = None
+        self.queue_name = None
+        self.connection = None
+        self.delivery_tag = 0
+        self.prefetch_count = 0
+        self.acked = []
+        self.nacked = []
+
+    async def queue_declare(self, queue, durable, arguments=None):
+        """Declare queue for broker channel."""
+        self.arguments[queue] = arguments
+        if queue not in self.queue:
+            self.queue[queue] = []
+
+    async def basic_qos(self, prefetch_count):
+        """Limit the number of unacknowledged messages."""
+        self.prefetch_count = prefetch_count
+
+    def basic_consume(self, queue, callback):
+        """Consume messages from broker."""
+        self.callback = callback
+        self.queue_name = queue
+        asyncio.get_event_loop().call_soon(self.deliver)
+        return "ctag"
+
+    def basic_cancel(self, consumer_tag):
+        """Cancel a consumer."""
+        self.callback = None
+
+    def deliver(self):
+        """Deliver the next message of the consumed queue."""
+        if self.callback is None:
+            return
+        messages = self.queue.setdefault(self.queue_name, [])
+        if not messages:
+            # close the connection, because the consumer won't stop consuming
+            asyncio.ensure_future(self.connection.close())
+            return
+        body, properties = messages.pop(0)
+        self.delivery_tag += 1
+        self.callback(self, MockMethod(self.delivery_tag), properties, body)
+        asyncio.get_event_loop().call_soon(self.deliver)
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        """Publish a message to broker."""
+        self.queue.setdefault(routing_key, []).append((body, properties))
+
+    def basic_ack(self, delivery_tag):
+        """Acknowledge a message."""
+        self.acked.append(delivery_tag)
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        """Negatively acknowledge a message."""
+        self.nacked.append(delivery_tag)
+
+    def get_properties(
+        self, delivery_mode, content_type=None, message_id=None, headers=None
+    ):
+        """Get broker properties."""
+        return MockProperties(delivery_mode, content_type, message_id, headers)
+
+    def get_messages(self, queue):
+        """Get the bodies of the messages in a queue.
+
+        :param queue (str): The queue.
+        """
+        return [body for body, properties in self.queue.get(queue, [])]
@@ -0,0 +1,51 @@
+import asyncio
+from unittest.mock import Mock
+from bb_change_broker.backend.async_http_handler import BaseAsyncHTTPHandler
+
+
+class MockAsyncHTTPHandler(BaseAsyncHTTPHandler):
+    """Mock asyncio HTTP handler class that stores the changes."""
+
+    def __init__(self, delay=0):
+        """Initialize the mock HTTP handler.
+
+        :param delay (float): The time in seconds a request takes.
+        """
+        self.delay = delay
+        self.changes = []
+        self.status = 200
+        self.probes = 0
+        self.posts = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.closed = False
+
+    async def post(self, data, url, encoding="utf-8", username=None, password=None):
+        """Add the data to the changes and return the configured status."""
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        resp = Mock()
+        resp.status = self.status
+        self.posts += 1
+        if resp.status == 200:
+            self.changes.extend(data if isinstance(data, list) else [data])
+        return resp
+
+    async def head(self, url, encoding="utf-8"):
+        """Count the probe and return the configured status."""
+        self.probes += 1
+        resp = Mock()
+        resp.status = self.status
+        return resp
+
+    async def close(self):
+        """Close the handler."""
+        self.closed = True
+
+    def get_post_data(self):
+        """Get the changes that were sent."""
+        return self.changes
@@ -5,11 +5,31 @@ from bb_change_broker.backend.broker import (
 )
 
 
+class MockProperties(object):
+    """Properties of a mocked message."""
+
+    def __init__(
+        self, delivery_mode=None, content_type=None, message_id=None, headers=None
+    ):
+        self.delivery_mode = delivery_mode
+        self.content_type = content_type
+        self.message_id = message_id
+        self.headers = headers
+
+
+class MockMethod(object):
+    """Delivery method of a mocked message."""
+
+    def __init__(self, delivery_tag):
+        self.delivery_tag = delivery_tag
+
+
 class MockBrokerHandler(BaseBrokerHandler):
     """Class for broker handler."""
 
     def __init__(self):
         self.connection = None
+        self.connections = 0
 
     def credentials(self, username, password):
         """Return credentials for broker connection."""
@@ -23,6 +43,8 @@ class MockBrokerHandler(BaseBrokerHandler):
         """Return blocking connection for broker connection."""
         if self.connection is None:
             self.connection = MockConnection(connection_parameters)
+        self.connection.open = True
+        self.connections += 1
         return self.connection
 
 
@@ -35,6 +57,7 @@ class MockConnection(BaseBrokerConnection):
         :param connection_parameters (pika.ConnectionParameters): The connection parameters for the broker connection.
         """
         self.ch = None
+        self.open = True
 
     def channel(self):
         """Return channel for broker connection.
@@ -47,7 +70,18 @@ class MockConnection(BaseBrokerConnection):
 
     def close(self):
         """Close the connection to broker."""
-        pass
+        self.open = False
+
+    def is_open(self):
+        """Return whether the connection to broker is open."""
+        return self.open
+
+    def add_callback_threadsafe(self, callback):
+        """Run the callback immediately.
+
+        :param callback (function): The callback to run.
+        """
+        callback()
 
 
 class MockChannel(BaseBrokerChannel):
@@ -59,25 +93,96 @@ class MockChannel(BaseBrokerChannel):
         self.queue = {}
         self.callback = None
         self.queue_name = None
+        self.declared = 0
+        self.fail_publish = 0
+        self.delivery_tag = 0
+        self.prefetch_count = 0
+        self.acked = []
+        self.nacked = []
+        self.arguments = {}
+        self.mandatory = []
+        # publisher confirms, None until confirm_delivery is called
+        self.on_confirm = None
+        self.on_return = None
+        self.publish_tag = 0
+        self.confirms = []
+        self.nack_publish = []
 
-    def queue_declare(self, queue, durable):
+    def queue_declare(self, queue, durable, arguments=None):
         """Declare queue for broker channel.
 
         :param queue (str): The queue to declare.
         :param durable (bool): Whether the queue is durable or not.
+        :param arguments (dict): The optional arguments of the queue.
         """
+        self.declared += 1
+        self.arguments[queue] = arguments
         if queue not in self.queue:
             self.queue[queue] = []
 
-    def basic_publish(self, exchange, routing_key, body, properties):
+    def basic_publish(self, exchange, routing_key, body, properties, mandatory=False):
         """Publish a message to broker.
 
         :param exchange (str): The exchange to publish the message to.
         :param routing_key (str): The routing key to publish the message with.
         :param body (str): The message to publish.
         :param properties (pika.BasicProperties): The properties of the message.
+        :param mandatory (bool): Whether the message is returned if it cannot be routed.
+        """
+        if self.fail_publish > 0:
+            # simulate a broken connection
+            self.fail_publish -= 1
+            raise Exception("Connection lost")
+        self.mandatory.append(mandatory)
+        if self.on_confirm is None:
+            self.queue[routing_key].append((body, properties))
+            return
+        self.publish_tag += 1
+        if body in self.nack_publish:
+            # simulate an internal error of the broker
+            self.nack_publish.remove(body)
+            self.confirms.append((None, self.publish_tag, False))
+        elif routing_key not in self.queue:
+            self.confirms.append((body if mandatory else None, self.publish_tag, True))
+        else:
+            self.queue[routing_key].append((body, properties))
+            self.confirms.append((None, self.publish_tag, True))
+
+    def confirm_delivery(self, on_confirm, on_return):
+        """Turn on publisher confirms.
+
+        :param on_confirm (function): Called with (delivery_tag, multiple, ack).
+        :param on_return (function): Called with the body of a returned message.
+        """
+        self.on_confirm = on_confirm
+        self.on_return = on_return
+        self.publish_tag = 0
+        self.confirms = []
+
+    def process_data_events(self, time_limit):
+        """Dispatch the pending confirms.
+
+        Consecutive acks are confirmed together with the multiple flag, like
+        the broker does.
+
+        :param time_limit (float): Unused, the confirms are already pending.
         """
-        self.queue[routing_key].append(body)
+        confirms, self.confirms = self.confirms, []
+        acked = None
+        for returned, delivery_tag, ack in confirms:
+            if ack and returned is None:
+                acked = delivery_tag
+                continue
+            if acked is not None:
+                self.on_confirm(acked, True, True)
+                acked = None
+            if returned is not None:
+                if isinstance(returned, str):
+                    returned = returned.encode("utf-8")
+                self.on_return(returned)
+            self.on_confirm(delivery_tag, False, ack)
+        if acked is not None:
+            self.on_confirm(acked, True, True)
 
     def start_consuming(self):
         """Start consuming messages from broker.
@@ -87,9 +192,17 @@ class MockChannel(BaseBrokerChannel):
         :param queue (str): The queue to consume messages from.
         :param callback (function): The callback function to call when a message is received.
         """
-        for message in self.queue[self.queue_name]:
-            self.callback(message)
+        messages = self.queue[self.queue_name]
         self.queue[self.queue_name] = []
+        for i, (body, properties) in enumerate(messages):
+            if self.callback is None:
+                # the consumer was cancelled, the rest stays in the queue
+                self.queue[self.queue_name] = messages[i:] + self.queue[self.queue_name]
+                return
+            self.delivery_tag += 1
+            self.callback(self, MockMethod(self.delivery_tag), properties, body)
+        if self.callback is None:
+            return
         # raise exception to simulate disconnect, because consumer won't stop consuming
         raise Exception("Disconnect")
 
@@ -101,10 +214,52 @@ class MockChannel(BaseBrokerChannel):
         """
         self.callback = callback
         self.queue_name = queue
+        return "ctag"
 
-    def get_properties(self, delivery_mode):
+    def basic_cancel(self, consumer_tag):
+        """Cancel a consumer.
+
+        :param consumer_tag (str): The consumer tag returned by basic_consume.
+        """
+        self.callback = None
+
+    def basic_qos(self, prefetch_count):
+        """Limit the number of unacknowledged messages.
+
+        :param prefetch_count (int): The maximum number of unacknowledged messages.
+        """
+        self.prefetch_count = prefetch_count
+
+    def basic_ack(self, delivery_tag):
+        """Acknowledge a message.
+
+        :param delivery_tag (int): The delivery tag of the message.
+        """
+        self.acked.append(delivery_tag)
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        """Negatively acknowledge a message.
+
+        :param delivery_tag (int): The delivery tag of the message.
+        :param requeue (bool): Whether the message is requeued.
+        """
+        self.nacked.append(delivery_tag)
+
+    def get_properties(
+        self, delivery_mode, content_type=None, message_id=None, headers=None
+    ):
         """Get broker properties.
 
         :param delivery_mode (int): The delivery mode of the message.
+        :param content_type (str): The content type of the message.
+        :param message_id (str): The id of the message.
+        :param headers (dict): The headers of the message.
         """
-        return None
+        return MockProperties(delivery_mode, content_type, message_id, headers)
+
+    def get_messages(self, queue):
+        """Get the bodies of the messages in a queue.
+
+        :param queue (str): The queue.
+        """
+        return [body for body, properties in self.queue[queue]]
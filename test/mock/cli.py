@@ -27,7 +27,13 @@ class MockCli(BaseCli):
         )]
 
     def get_git_commits(
-        self, refname, newrev, baserev, first_parent=True, new_branch=True
+        self,
+        refname,
+        newrev,
+        baserev,
+        first_parent=True,
+        new_branch=True,
+        boundaries=None,
     ):
         return (
             "24900f9565adfe70eca693610102b5b201720c21 bla\n"
@@ -8,6 +8,9 @@ class MockHTTPHandler(BaseHTTPHandler):
     def __init__(self) -> None:
         """Initialize the mock HTTP handler."""
         self.changes = []
+        self.status = 200
+        self.probes = 0
+        self.posts = 0
 
     def post(self, data, url, encoding="utf-8", username=None, password=None):
         """Add the data to the changes and return a successful response.
@@ -19,16 +22,28 @@ class MockHTTPHandler(BaseHTTPHandler):
         :param password (str): The password to use for basic auth.
         :return (HTTPResponse): The response from the url.
         """
-        self.changes.append(data)
         # mock an object that has a property called status and gives back 200
         resp = Mock()
-        resp.status = 200
+        resp.status = self.status
+        self.posts += 1
+        if resp.status == 200:
+            if isinstance(data, list):
+                self.changes.extend(data)
+            else:
+                self.changes.append(data)
         return resp
 
     def get(self, url, encoding="utf-8"):
         """Return a successful response."""
         resp = Mock()
-        resp.status = 200
+        resp.status = self.status
+        return resp
+
+    def head(self, url, encoding="utf-8"):
+        """Count the probe and return a successful response."""
+        self.probes += 1
+        resp = Mock()
+        resp.status = self.status
         return resp
 
     def get_post_data(self):
@@ -0,0 +1,110 @@
+import unittest, sys, os, tempfile, threading, time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "mock"))
+
+from bb_change_broker.agent import Agent
+from bb_change_broker.hook import send_to_agent
+from bb_change_broker.util.log import Logger
+
+
+class MockClient(object):
+    """Client that records the published changes."""
+
+    def __init__(self):
+        self.logger = Logger()
+        self.published = []
+        self.recorded = []
+        self.available = True
+        self.closed = False
+
+    def get_changes(self, request):
+        return [{"revision": ref[1], "branch": ref[2]} for ref in request["refs"]]
+
+    def publish(self, changes):
+        available = self.available
+        self.published.append(changes)
+        return available
+
+    def record_publish(self, published):
+        self.recorded.append(published)
+
+    def close(self):
+        self.closed = True
+
+
+class TestAgent(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.socket = os.path.join(self.directory.name, "agent.sock")
+        self.client = MockClient()
+        self.agent = Agent({"agent": {"socket": self.socket}}, client=self.client)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_agent(self):
+        # no agent running, the hook has to fall back to the client
+        self.assertFalse(send_to_agent(self.socket, {"refs": []}, timeout=1))
+
+        thread = threading.Thread(target=self.agent.run)
+        thread.start()
+        while self.agent.server is None or not os.path.exists(self.socket):
+            time.sleep(0.01)
+        for i in range(3):
+            self.assertTrue(
+                send_to_agent(
+                    self.socket, {"refs": [["0", str(i), "refs/heads/master"]]}
+                )
+            )
+        self.assertFalse(send_to_agent(self.socket, {"invalid": True}))
+        self.agent.shutdown()
+        thread.join()
+
+        published = [change for changes in self.client.published for change in changes]
+        self.assertEqual([change["revision"] for change in published], ["0", "1", "2"])
+        self.assertTrue(self.client.recorded)
+        self.assertTrue(all(self.client.recorded))
+        self.assertTrue(self.client.closed)
+        self.assertFalse(os.path.exists(self.socket))
+
+    def run_agent(self, agent):
+        thread = threading.Thread(target=agent.run)
+        thread.start()
+        while agent.server is None or not os.path.exists(self.socket):
+            time.sleep(0.01)
+        return thread
+
+    def test_journal_replay(self):
+        # a request confirmed by an agent that was killed before publishing it
+        self.agent.submit({"refs": [["0", "1", "refs/heads/master"]]})
+        self.assertEqual(self.client.published, [])
+        client = MockClient()
+        agent = Agent({"agent": {"socket": self.socket}}, client=client)
+        thread = self.run_agent(agent)
+        agent.shutdown()
+        thread.join()
+        self.assertEqual(
+            client.published, [[{"revision": "1", "branch": "refs/heads/master"}]]
+        )
+        self.assertTrue(agent.journal.is_empty())
+
+    def test_journal_failed_publish(self):
+        # requests stay in the journal until their publish succeeds
+        self.client.available = False
+        thread = self.run_agent(self.agent)
+        self.assertTrue(
+            send_to_agent(self.socket, {"refs": [["0", "1", "refs/heads/master"]]})
+        )
+        while not self.client.published:
+            time.sleep(0.01)
+        self.client.available = True
+        self.assertTrue(
+            send_to_agent(self.socket, {"refs": [["0", "2", "refs/heads/master"]]})
+        )
+        self.agent.shutdown()
+        thread.join()
+        published = [change for changes in self.client.published for change in changes]
+        self.assertEqual([change["revision"] for change in published][-2:], ["1", "2"])
+        self.assertEqual(self.client.recorded[0], False)
+        self.assertTrue(self.agent.journal.is_empty())
@@ -0,0 +1,113 @@
+import unittest, sys, os, asyncio
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "mock"))
+
+from mock.async_broker import MockAsyncBrokerHandler
+from mock.async_http_handler import MockAsyncHTTPHandler
+from mock.broker import MockProperties
+from bb_change_broker.async_server import AsyncServer
+from bb_change_broker.codec.json import JsonCodec
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "asyncio.run needs Python 3.7")
+class TestAsyncServer(unittest.TestCase):
+    def setUp(self):
+        self.config = {
+            "DEFAULT": {"encoding": "utf-8"},
+            "rabbitmq": {
+                "host": "localhost",
+                "port": 5672,
+                "username": "user",
+                "password": "password",
+                "queue": "changes",
+                "retry_delays": [5],
+            },
+            "buildbot": {
+                "host": "localhost",
+                "port": 8010,
+                "username": "user",
+                "password": "password",
+                "max_in_flight": 2,
+            },
+        }
+        self.codec = JsonCodec()
+
+    def server(self, delay=0):
+        server = AsyncServer(self.config)
+        server.rabbitmq.handler = MockAsyncBrokerHandler()
+        server.rabbitmq.retry_on_disconnect = False
+        server.buildbot.http_handler = MockAsyncHTTPHandler(delay)
+        server.PROBE_INTERVAL = 0.01
+        return server
+
+    def enqueue(self, server, changes):
+        for change in changes:
+            server.rabbitmq.handler.channel.basic_publish(
+                "",
+                "changes",
+                self.codec.encode(change),
+                MockProperties(2, self.codec.content_type),
+            )
+
+    def test_serve(self):
+        changes = [
+            {"repository": "repository", "branch": branch, "revision": str(i)}
+            for i in range(4)
+            for branch in ("master", "dev", "release")
+        ]
+        server = self.server(delay=0.01)
+        self.enqueue(server, changes)
+        asyncio.run(server.serve())
+
+        http_handler = server.buildbot.http_handler
+        channel = server.rabbitmq.handler.channel
+        self.assertEqual(sorted(channel.acked), list(range(1, 13)))
+        self.assertEqual(http_handler.max_in_flight, 2)
+        self.assertTrue(http_handler.closed)
+        for branch in ("master", "dev", "release"):
+            self.assertEqual(
+                [c["revision"] for c in http_handler.changes if c["branch"] == branch],
+                ["0", "1", "2", "3"],
+            )
+
+    def test_prefetch_count(self):
+        # the messages held as tasks are bounded by default
+        self.assertEqual(self.server().rabbitmq.prefetch_count, 8)
+        self.config["rabbitmq"]["prefetch_count"] = 0
+        with self.assertRaises(ValueError):
+            self.server()
+
+    def test_duplicates(self):
+        change = {"repository": "repository", "branch": "master", "revision": "1"}
+        server = self.server()
+        self.enqueue(server, [change, change])
+        asyncio.run(server.serve())
+        self.assertEqual(server.buildbot.http_handler.posts, 1)
+        self.assertEqual(server.rabbitmq.handler.channel.acked, [1, 2])
+
+    def test_retry_and_pause(self):
+        self.config["buildbot"]["failure_threshold"] = 1
+        self.config["buildbot"]["availability_ttl"] = 0
+        server = self.server()
+        http_handler = server.buildbot.http_handler
+        http_handler.status = 500
+        self.enqueue(server, [{"branch": "master", "revision": "1"}])
+
+        async def recover():
+            while not server.rabbitmq.is_paused():
+                await asyncio.sleep(0.01)
+            http_handler.status = 200
+
+        async def run():
+            await asyncio.gather(server.serve(), recover())
+
+        asyncio.run(run())
+        channel = server.rabbitmq.handler.channel
+        [(body, properties)] = channel.queue["changes.retry.5000"]
+        self.assertEqual(properties.headers, {"x-attempt": 1})
+        self.assertEqual(channel.arguments["changes.retry.5000"]["x-message-ttl"], 5000)
+        self.assertEqual(channel.acked, [1])
+        # the consumer reconnected after buildbot was available again
+        self.assertEqual(server.rabbitmq.handler.connections, 2)
+        self.assertFalse(server.rabbitmq.is_paused())
@@ -1,4 +1,4 @@
-import unittest, sys, os, json
+import unittest, sys, os, json, threading
 
 sys.path.insert(0, os.path.dirname(__file__))
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "mock"))
@@ -57,7 +57,10 @@ class TestBrokerPublisher(unittest.TestCase):
             )
         received_changes = []
         self.broker_consumer.consume(
-            queue="MyQueue", callback=lambda x: received_changes.append(self.__callback(x))
+            queue="MyQueue",
+            callback=lambda ch, method, properties, body: received_changes.append(
+                self.__callback(body)
+            ),
         )
 
         # sort before comparing
@@ -69,6 +72,253 @@ class TestBrokerPublisher(unittest.TestCase):
             changes,
         )
 
+    def test_publish_many(self):
+        # all messages go over one connection and the queue is declared once
+        messages = ["change1", "change2", "change3"]
+        failed = self.broker_publisher.publish_many(
+            messages, exchange="", routing_key="MyQueue"
+        )
+        self.broker_publisher.publish("change4", exchange="", routing_key="MyQueue")
+        channel = self.broker_handler.connection.channel()
+        self.assertEqual(failed, [])
+        self.assertEqual(self.broker_handler.connections, 1)
+        self.assertEqual(channel.declared, 1)
+        self.assertEqual(
+            channel.get_messages("MyQueue"),
+            ["change1", "change2", "change3", "change4"],
+        )
+
+    def test_publish_many_reconnect(self):
+        # a broken connection is reopened and publishing continues
+        self.broker_publisher.connect()
+        channel = self.broker_handler.connection.channel()
+        channel.fail_publish = 1
+        failed = self.broker_publisher.publish_many(
+            ["change1", "change2"], exchange="", routing_key="MyQueue"
+        )
+        self.assertEqual(failed, [])
+        self.assertEqual(self.broker_handler.connections, 2)
+        self.assertEqual(channel.get_messages("MyQueue"), ["change1", "change2"])
+
+    def test_publish_many_message_ids(self):
+        self.broker_publisher.publish_many(
+            ["change1", "change2"],
+            exchange="",
+            routing_key="MyQueue",
+            message_ids=["id1", "id2"],
+        )
+        channel = self.broker_handler.connection.channel()
+        self.assertEqual(
+            [properties.message_id for _, properties in channel.queue["MyQueue"]],
+            ["id1", "id2"],
+        )
+
+    def test_publish_many_failed(self):
+        self.broker_publisher.connect()
+        channel = self.broker_handler.connection.channel()
+        channel.fail_publish = 2
+        failed = self.broker_publisher.publish_many(
+            ["change1", "change2"], exchange="", routing_key="MyQueue"
+        )
+        self.assertEqual(failed, [0, 1])
+
+    def test_publish_many_confirm_window(self):
+        # messages are published ahead until the window is full
+        self.broker_publisher.confirm_window = 2
+        self.broker_publisher.connect()
+        channel = self.broker_handler.connection.channel()
+        outstanding = []
+        process_data_events = channel.process_data_events
+
+        def record(time_limit):
+            outstanding.append(len(channel.confirms))
+            process_data_events(time_limit)
+
+        channel.process_data_events = record
+        failed = self.broker_publisher.publish_many(
+            ["change1", "change2", "change3", "change4", "change5"],
+            exchange="",
+            routing_key="MyQueue",
+        )
+        self.assertEqual(failed, [])
+        self.assertEqual(outstanding, [2, 2, 1])
+        self.assertEqual(channel.mandatory, [True] * 5)
+        self.assertEqual(self.broker_publisher.unconfirmed, {})
+        self.assertEqual(
+            channel.get_messages("MyQueue"),
+            ["change1", "change2", "change3", "change4", "change5"],
+        )
+
+    def test_publish_many_nack(self):
+        # a negatively acknowledged message is published again, followed by
+        # the messages behind it
+        self.broker_publisher.confirm_window = 1
+        self.broker_publisher.connect()
+        channel = self.broker_handler.connection.channel()
+        channel.nack_publish = ["change2"]
+        failed = self.broker_publisher.publish_many(
+            ["change1", "change2", "change3"], exchange="", routing_key="MyQueue"
+        )
+        self.assertEqual(failed, [])
+        self.assertEqual(
+            channel.get_messages("MyQueue"), ["change1", "change2", "change3"]
+        )
+
+    def test_publish_many_nack_in_flight(self):
+        # messages in flight behind a rejected one are published again in order
+        self.broker_publisher.connect()
+        channel = self.broker_handler.connection.channel()
+        channel.nack_publish = ["change2"]
+        failed = self.broker_publisher.publish_many(
+            ["change1", "change2", "change3"], exchange="", routing_key="MyQueue"
+        )
+        self.assertEqual(failed, [])
+        self.assertEqual(
+            channel.get_messages("MyQueue"),
+            ["change1", "change3", "change2", "change3"],
+        )
+
+    def test_publish_many_returned(self):
+        # an unroutable message is returned and reported as not published
+        self.broker_publisher.connect()
+        channel = self.broker_handler.connection.channel()
+        channel.queue_declare = lambda queue, durable, arguments=None: None
+        failed = self.broker_publisher.publish_many(
+            ["change1", "change2"], exchange="", routing_key="MyQueue"
+        )
+        self.assertEqual(failed, [0, 1])
+
+    def test_publish_many_without_confirms(self):
+        self.broker_publisher.confirm_window = 0
+        failed = self.broker_publisher.publish_many(
+            ["change1", "change2"], exchange="", routing_key="MyQueue"
+        )
+        channel = self.broker_handler.connection.channel()
+        self.assertEqual(failed, [])
+        self.assertIsNone(channel.on_confirm)
+        self.assertEqual(channel.mandatory, [False, False])
+
+    def test_declare_retry_queues(self):
+        consumer = BrokerConsumer(
+            host="localhost",
+            port=8010,
+            username="user",
+            password="password",
+            retry_on_disconnect=False,
+            handler=self.broker_handler,
+            logger=self.logger,
+            retry_delays=[5, 0.5],
+        )
+        self.broker_publisher.publish("change1", exchange="", routing_key="MyQueue")
+        consumer.consume("MyQueue", lambda ch, method, properties, body: None)
+        channel = self.broker_handler.connection.channel()
+        self.assertEqual(
+            channel.arguments["MyQueue.retry.5000"],
+            {
+                "x-message-ttl": 5000,
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": "MyQueue",
+            },
+        )
+        self.assertEqual(channel.arguments["MyQueue.retry.500"]["x-message-ttl"], 500)
+
+    def test_pause(self):
+        messages = ["change1", "change2", "change3"]
+        self.broker_publisher.publish_many(messages, exchange="", routing_key="MyQueue")
+        received = []
+        paused = threading.Event()
+
+        def callback(ch, method, properties, body):
+            received.append(body)
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            if len(received) == 1:
+                self.broker_consumer.pause()
+                paused.set()
+
+        thread = threading.Thread(
+            target=self.broker_consumer.consume, args=("MyQueue", callback)
+        )
+        thread.start()
+        self.assertTrue(paused.wait(5))
+        # the other messages stay in the broker while paused
+        channel = self.broker_handler.connection.channel()
+        self.assertEqual(channel.get_messages("MyQueue"), ["change2", "change3"])
+        self.assertTrue(self.broker_consumer.is_paused())
+        self.broker_consumer.resume()
+        thread.join(5)
+        self.assertEqual(received, messages)
+        self.assertEqual(self.broker_handler.connections, 3)
+
+    def test_consume_with_workers(self):
+        # messages with the same key stay in order, all messages are acked
+        consumer = BrokerConsumer(
+            host="localhost",
+            port=8010,
+            username="user",
+            password="password",
+            retry_on_disconnect=False,
+            handler=self.broker_handler,
+            logger=self.logger,
+            prefetch_count=10,
+            workers=3,
+        )
+        messages = ["%s:%d" % (branch, i) for i in range(20) for branch in "abcd"]
+        self.broker_publisher.publish_many(messages, exchange="", routing_key="MyQueue")
+        received = {}
+
+        def callback(ch, method, properties, body):
+            branch, i = body.split(":")
+            received.setdefault(branch, []).append(int(i))
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+
+        consumer.consume(
+            queue="MyQueue",
+            callback=callback,
+            partition_key=lambda properties, body: body.split(":")[0],
+        )
+        channel = self.broker_handler.connection.channel()
+        self.assertEqual(channel.prefetch_count, 10)
+        self.assertEqual(sorted(channel.acked), list(range(1, len(messages) + 1)))
+        for branch in "abcd":
+            self.assertEqual(received[branch], list(range(20)))
+
+    def test_consume_decodes_once(self):
+        # the decoded message is passed to the partition key and the callback
+        consumer = BrokerConsumer(
+            host="localhost",
+            port=8010,
+            username="user",
+            password="password",
+            retry_on_disconnect=False,
+            handler=self.broker_handler,
+            logger=self.logger,
+            workers=2,
+        )
+        messages = ["%s:%d" % (branch, i) for i in range(5) for branch in "ab"]
+        self.broker_publisher.publish_many(messages, exchange="", routing_key="MyQueue")
+        decoded = []
+        received = []
+
+        def decode(properties, body):
+            decoded.append(body)
+            return tuple(body.split(":"))
+
+        def callback(ch, method, properties, body, message):
+            received.append((body, message))
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+
+        consumer.consume(
+            queue="MyQueue",
+            callback=callback,
+            partition_key=lambda properties, message: message[0],
+            decode=decode,
+        )
+        self.assertEqual(decoded, messages)
+        self.assertEqual(
+            sorted(received),
+            sorted((body, tuple(body.split(":"))) for body in messages),
+        )
+
     def __callback(self, message):
         self.logger.info("Received message %s" % message)
         return message
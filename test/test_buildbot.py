@@ -1,10 +1,13 @@
-import unittest, sys, os, json
+import unittest, sys, os, json, threading, time
 
 sys.path.insert(0, os.path.dirname(__file__))
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "mock"))
 
 from mock.http_handler import MockHTTPHandler
+from bb_change_broker.publisher.batch import BatchPublisher, coalesce
 from bb_change_broker.publisher.buildbot import BuildbotPublisher
+from bb_change_broker.publisher.fallback import FallbackPublisher
+from bb_change_broker.util.log import Logger
 
 
 class TestBuildbotPublisher(unittest.TestCase):
@@ -48,3 +51,210 @@ class TestBuildbotPublisher(unittest.TestCase):
             received_changes,
             changes,
         )
+
+    def test_circuit_breaker(self):
+        change = {"branch": "master", "revision": "1", "repository": "repository"}
+
+        # closed circuit does not probe buildbot
+        self.assertTrue(self.buildbot_publisher.is_available())
+        self.assertEqual(self.http_handler.probes, 0)
+
+        # failed publishes open the circuit
+        self.http_handler.status = 500
+        for i in range(3):
+            self.assertFalse(self.buildbot_publisher.publish(change))
+        self.assertEqual(self.buildbot_publisher.state, BuildbotPublisher.OPEN)
+        self.assertFalse(self.buildbot_publisher.is_available())
+        self.assertEqual(self.http_handler.probes, 0)
+
+        # after the ttl, buildbot is probed and the circuit half-opens
+        self.buildbot_publisher.availability_ttl = 0
+        self.http_handler.status = 200
+        self.assertTrue(self.buildbot_publisher.is_available())
+        self.assertEqual(self.http_handler.probes, 1)
+        self.assertEqual(self.buildbot_publisher.state, BuildbotPublisher.HALF_OPEN)
+
+        # a successful publish closes it again
+        self.assertTrue(self.buildbot_publisher.publish(change))
+        self.assertEqual(self.buildbot_publisher.state, BuildbotPublisher.CLOSED)
+
+    def test_circuit_breaker_half_open_failure(self):
+        change = {"branch": "master", "revision": "1", "repository": "repository"}
+        self.buildbot_publisher.availability_ttl = 0
+        self.buildbot_publisher.failure_threshold = 1
+        self.http_handler.status = 500
+        self.assertFalse(self.buildbot_publisher.publish(change))
+        self.assertEqual(self.buildbot_publisher.state, BuildbotPublisher.OPEN)
+        self.http_handler.status = 200
+        self.assertTrue(self.buildbot_publisher.is_available())
+        self.http_handler.status = 500
+        self.assertFalse(self.buildbot_publisher.publish(change))
+        self.assertEqual(self.buildbot_publisher.state, BuildbotPublisher.OPEN)
+
+    def test_publish_many(self):
+        changes = [{"branch": "master", "revision": str(i)} for i in range(3)]
+        self.assertTrue(self.buildbot_publisher.publish_many(changes))
+        self.assertEqual(self.http_handler.posts, 1)
+        self.assertEqual(self.http_handler.get_post_data(), changes)
+
+    def test_batch_publisher(self):
+        changes = [{"branch": "master", "revision": str(i)} for i in range(7)]
+        results = []
+        batcher = BatchPublisher(
+            self.buildbot_publisher, batch_size=3, max_wait=60, logger=Logger()
+        )
+        for change in changes:
+            batcher.submit(change, results.append)
+        batcher.stop()
+        self.assertEqual(self.http_handler.posts, 3)
+        self.assertEqual(self.http_handler.get_post_data(), changes)
+        self.assertEqual(results, [True] * 7)
+
+    def test_batch_publisher_max_wait(self):
+        sent = threading.Event()
+        batcher = BatchPublisher(
+            self.buildbot_publisher, batch_size=100, max_wait=0.01, logger=Logger()
+        )
+        batcher.submit({"branch": "master", "revision": "1"}, lambda ok: sent.set())
+        self.assertTrue(sent.wait(5))
+        self.assertEqual(self.http_handler.posts, 1)
+        batcher.stop()
+
+    def test_batch_publisher_failure(self):
+        self.http_handler.status = 500
+        results = []
+        batcher = BatchPublisher(
+            self.buildbot_publisher, batch_size=2, max_wait=60, logger=Logger()
+        )
+        for i in range(2):
+            batcher.submit({"branch": "master", "revision": str(i)}, results.append)
+        batcher.stop()
+        self.assertEqual(results, [False, False])
+
+    def test_coalesce(self):
+        changes = [
+            {"branch": "master", "revision": "1", "files": ["a", "b"]},
+            {"branch": "dev", "revision": "2", "files": ["c"]},
+            {"branch": "master", "revision": "3", "files": ["b", "d"]},
+            {"revision": "4"},
+            {"revision": "5"},
+        ]
+        self.assertEqual(
+            coalesce(changes),
+            [
+                (
+                    {"branch": "master", "revision": "3", "files": ["a", "b", "d"]},
+                    [0, 2],
+                ),
+                ({"branch": "dev", "revision": "2", "files": ["c"]}, [1]),
+                ({"revision": "4"}, [3]),
+                ({"revision": "5"}, [4]),
+            ],
+        )
+
+    def test_batch_publisher_coalesce(self):
+        results = []
+        batcher = BatchPublisher(
+            self.buildbot_publisher,
+            batch_size=2,
+            max_wait=60,
+            logger=Logger(),
+            coalesce=True,
+        )
+        # hold the lock of the sender, so all changes are pending when it wakes up
+        with batcher.condition:
+            for i in range(5):
+                batcher.submit(
+                    {"branch": "master", "revision": str(i), "files": [str(i)]},
+                    results.append,
+                )
+            batcher.submit({"branch": "dev", "revision": "5"}, results.append)
+            batcher.submit({"branch": "release", "revision": "6"}, results.append)
+        batcher.stop()
+        self.assertEqual(self.http_handler.posts, 2)
+        self.assertEqual(
+            [change["revision"] for change in self.http_handler.get_post_data()],
+            ["4", "5", "6"],
+        )
+        self.assertEqual(
+            self.http_handler.get_post_data()[0]["files"], ["0", "1", "2", "3", "4"]
+        )
+        self.assertEqual(results, [True] * 7)
+
+    def test_batch_publisher_coalesce_window(self):
+        # changes that arrive within the window are merged, even one per batch
+        results = []
+        sent = threading.Event()
+        batcher = BatchPublisher(
+            self.buildbot_publisher,
+            batch_size=1,
+            max_wait=0.5,
+            logger=Logger(),
+            coalesce=True,
+        )
+        for i in range(3):
+            # the sender is idle when the following changes arrive
+            time.sleep(0.05)
+            batcher.submit(
+                {"branch": "master", "revision": str(i), "files": [str(i)]},
+                lambda ok: results.append(ok) or len(results) == 3 and sent.set(),
+            )
+        self.assertTrue(sent.wait(5))
+        self.assertEqual(self.http_handler.posts, 1)
+        self.assertEqual(
+            self.http_handler.get_post_data(),
+            [{"branch": "master", "revision": "2", "files": ["0", "1", "2"]}],
+        )
+        batcher.stop()
+
+    def test_fallback_publisher(self):
+        changes = [{"branch": "master", "revision": str(i)} for i in range(5)]
+        fallback = FallbackPublisher(
+            self.buildbot_publisher, logger=Logger(), workers=2, batch_size=2
+        )
+        fallback.submit(changes)
+        self.assertTrue(fallback.wait(5))
+        self.assertEqual(self.http_handler.posts, 3)
+        received = sorted(
+            self.http_handler.get_post_data(), key=lambda k: k["revision"]
+        )
+        self.assertEqual(received, changes)
+
+    def test_fallback_publisher_retry_budget(self):
+        self.http_handler.status = 500
+        self.buildbot_publisher.failure_threshold = 100
+        fallback = FallbackPublisher(
+            self.buildbot_publisher,
+            logger=Logger(),
+            workers=2,
+            retry_budget=2,
+            retry_delay=0.001,
+        )
+        fallback.submit([{"branch": "master", "revision": str(i)} for i in range(3)])
+        self.assertFalse(fallback.wait(5))
+        # one attempt per change and the two retries of the shared budget
+        self.assertEqual(self.http_handler.posts, 5)
+
+    def test_fallback_publisher_timeout(self):
+        self.http_handler.status = 500
+        fallback = FallbackPublisher(
+            self.buildbot_publisher, logger=Logger(), workers=1, retry_delay=60
+        )
+        fallback.submit([{"branch": "master", "revision": str(i)} for i in range(3)])
+        self.assertFalse(fallback.wait(0.1))
+        for thread in fallback.threads:
+            thread.join()
+        self.assertEqual(self.http_handler.posts, 1)
+
+    def test_fallback_publisher_hanging_request(self):
+        # wait returns after the timeout while a request hangs, and the
+        # daemon thread does not keep the process alive
+        released = threading.Event()
+        self.addCleanup(released.set)
+        self.buildbot_publisher.publish_many = lambda changes: released.wait()
+        fallback = FallbackPublisher(self.buildbot_publisher, logger=Logger())
+        fallback.submit([{"branch": "master", "revision": "1"}])
+        started = time.monotonic()
+        self.assertFalse(fallback.wait(0.1))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertTrue(all(thread.daemon for thread in fallback.threads))
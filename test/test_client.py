@@ -0,0 +1,113 @@
+import unittest, sys, os, shutil, tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "mock"))
+
+from mock.broker import MockBrokerHandler
+from mock.cli import MockCli
+from bb_change_broker.client import Client
+from bb_change_broker.util.ref_snapshot import RefSnapshot
+from bb_change_broker.util.revision_state import RevisionState
+
+OLDREV = "24900f9565adfe70eca693610102b5b201720c21"
+NEWREV = "83060a21145596e42d985c798c32aa4b581b7b4f"
+
+
+def make_client(source):
+    """Create a client with a mocked cli and broker.
+
+    :param source (dict): The config of the change source.
+    :return (Client): The client.
+    """
+    config = {
+        "DEFAULT": {"encoding": "utf-8"},
+        "rabbitmq": {
+            "host": "localhost",
+            "port": "5672",
+            "username": "user",
+            "password": "password",
+            "queue": "changes",
+        },
+        "buildbot": {
+            "host": "localhost",
+            "port": "8010",
+            "username": "user",
+            "password": "password",
+        },
+    }
+    config.update(source)
+    client = Client(config)
+    client.change_source.cli = MockCli()
+    client.rabbitmq.handler = MockBrokerHandler()
+    return client
+
+
+def fail_publish(client):
+    """Let every publish of a client raise, like a killed connection.
+
+    :param client (Client): The client.
+    """
+
+    def publish_many(*args, **kwargs):
+        raise RuntimeError("publish killed")
+
+    client.rabbitmq.publish_many = publish_many
+
+
+class TestClient(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        path = os.path.join(self.directory, "refs.snapshot")
+        self.snapshot = RefSnapshot(path)
+        self.snapshot.rebuild({"refs/heads/master": OLDREV})
+        self.snapshot.save()
+        self.client = make_client(
+            {"git": {"repository": "repository", "snapshot": path}}
+        )
+        self.client.change_source.cli.get_git_refs = lambda: {
+            "refs/heads/master": NEWREV
+        }
+
+    def published_head(self):
+        self.snapshot.load()
+        return self.snapshot.refs["refs/heads/master"]
+
+    def test_run(self):
+        self.client.run()
+        self.assertEqual(self.published_head(), NEWREV)
+
+    def test_run_publish_failed(self):
+        # the snapshot does not move past changes that were not published
+        fail_publish(self.client)
+        with self.assertRaises(RuntimeError):
+            self.client.run()
+        self.assertEqual(self.published_head(), OLDREV)
+        self.assertEqual(self.client.change_source.unpublished, [])
+
+    def test_reconcile_publish_failed(self):
+        fail_publish(self.client)
+        with self.assertRaises(RuntimeError):
+            self.client.reconcile()
+        self.assertEqual(self.published_head(), OLDREV)
+        # the next reconcile publishes the update again
+        del self.client.rabbitmq.publish_many
+        self.assertEqual(self.client.reconcile(), 1)
+        self.assertEqual(self.published_head(), NEWREV)
+        self.assertEqual(self.client.reconcile(), 0)
+
+    def test_run_svn_publish_failed(self):
+        # the state does not move past revisions that were not published
+        state = RevisionState(os.path.join(self.directory, "revision"))
+        config = {
+            "repository": "/srv/svn/repository",
+            "branch_filters": [],
+            "state": state.path,
+        }
+        client = make_client({"svn": config})
+        fail_publish(client)
+        with self.assertRaises(RuntimeError):
+            client.run()
+        self.assertIsNone(state.load())
+        make_client({"svn": config}).run()
+        self.assertEqual(state.load(), 1)
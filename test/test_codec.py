@@ -0,0 +1,62 @@
+import unittest, sys, os
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "mock"))
+
+from bb_change_broker.codec.base import CodecError
+from bb_change_broker.codec.json import JsonCodec
+from bb_change_broker.codec.legacy import LegacyCodec
+from bb_change_broker.codec.msgpack import MsgpackCodec
+from bb_change_broker.codec.registry import (
+    get_codec,
+    get_codec_for_content_type,
+    decode_change,
+)
+
+
+class TestCodec(unittest.TestCase):
+    def setUp(self):
+        self.change = {
+            "branch": "master",
+            "revision": "83060a21145596e42d985c798c32aa4b581b7b4f",
+            "repository": "repository",
+            "author": "user <User@mail.com>",
+            "files": ["somefile.txt", "dir/ümlaut.txt"],
+            "comments": "New Feature",
+        }
+
+    def test_json_roundtrip(self):
+        codec = get_codec("json")
+        body = codec.encode(self.change)
+        self.assertIsInstance(body, bytes)
+        self.assertEqual(decode_change(body, codec.content_type), self.change)
+
+    def test_json_bytes(self):
+        codec = JsonCodec()
+        change = dict(self.change, comments=b"bytes")
+        self.assertEqual(codec.decode(codec.encode(change))["comments"], "bytes")
+
+    def test_legacy_roundtrip(self):
+        # older clients send str(change) without content type
+        body = str(self.change).encode("utf-8")
+        self.assertEqual(decode_change(body, None), self.change)
+
+    def test_legacy_does_not_execute_code(self):
+        with self.assertRaises(CodecError):
+            LegacyCodec().decode(b"__import__('os').getcwd()")
+
+    def test_unsupported_version(self):
+        with self.assertRaises(CodecError):
+            JsonCodec().decode(b'{"version":99,"change":{}}')
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            get_codec("xml")
+        with self.assertRaises(ValueError):
+            get_codec_for_content_type("text/xml")
+
+    @unittest.skipUnless(MsgpackCodec.is_available(), "msgpack is not installed")
+    def test_msgpack_roundtrip(self):
+        codec = get_codec("msgpack")
+        body = codec.encode(self.change)
+        self.assertEqual(decode_change(body, codec.content_type), self.change)
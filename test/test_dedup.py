@@ -0,0 +1,74 @@
+import unittest, sys, os, tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "mock"))
+
+from bb_change_broker.util.cache import LRUCache
+from bb_change_broker.util.dedup import DedupIndex, change_id
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_lru(self):
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        # b is the least recently used entry
+        cache.put("c", 3)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.get("b", 0), 0)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+
+class TestDedup(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "dedup.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_change_id(self):
+        change = {
+            "repository": "repository",
+            "branch": "master",
+            "revision": "f5934acec8193597e0ee60e1be99b0c18654a222",
+            "files": ["a", "b"],
+            "comments": "first",
+        }
+        same = dict(change, files=[b"b", b"a"], branch=b"master", comments="second")
+        self.assertEqual(change_id(change), change_id(same))
+        self.assertNotEqual(change_id(change), change_id(dict(change, branch="dev")))
+        self.assertNotEqual(change_id(change), change_id(dict(change, files=["a"])))
+
+    def test_persistent(self):
+        index = DedupIndex(self.path, size=1)
+        index.add("a")
+        index.add("b")
+        # a is only on disk
+        self.assertTrue(index.contains("a"))
+        self.assertFalse(index.contains("c"))
+        index.close()
+
+        index = DedupIndex(self.path, size=1)
+        self.assertTrue(index.contains("a"))
+        self.assertTrue(index.contains("b"))
+        index.close()
+
+    def test_ttl(self):
+        index = DedupIndex(self.path, ttl=-1)
+        index.add("a")
+        self.assertFalse(index.contains("a"))
+        index.purge()
+        index.close()
+
+        index = DedupIndex(self.path)
+        self.assertFalse(index.contains("a"))
+        index.close()
+
+    def test_memory_only(self):
+        index = DedupIndex()
+        self.assertFalse(index.contains("a"))
+        index.add("a")
+        self.assertTrue(index.contains("a"))
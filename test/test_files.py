@@ -0,0 +1,31 @@
+import unittest, sys, os, tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bb_change_broker.util.files import file_lock, write_atomic
+
+
+class TestFiles(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "file")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_file_lock(self):
+        with file_lock(self.path + ".lock") as locked:
+            self.assertTrue(locked)
+            # the lock is held, another holder does not get it
+            with file_lock(self.path + ".lock", blocking=False) as other:
+                self.assertFalse(other)
+        with file_lock(self.path + ".lock", blocking=False) as locked:
+            self.assertTrue(locked)
+
+    def test_write_atomic(self):
+        write_atomic(self.path, "first\n")
+        write_atomic(self.path, "second\n")
+        with open(self.path) as f:
+            self.assertEqual(f.read(), "second\n")
+        # the temporary file is replaced, nothing else is left behind
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ["file"])
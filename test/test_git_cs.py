@@ -1,4 +1,4 @@
-import unittest, sys, os
+import unittest, sys, os, shutil, tempfile
 
 sys.path.insert(0, os.path.dirname(__file__))
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "mock"))
@@ -6,6 +6,34 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), "mock"))
 from mock.cli import MockCli
 from bb_change_broker.change_source.git import GitChangeSource
 from bb_change_broker.util.log import Logger
+from bb_change_broker.util.ref_snapshot import RefSnapshot
+
+
+class MultiRefMockCli(MockCli):
+    """Mock cli with several refs and distinct commits per ref."""
+
+    def get_git_stdin(self):
+        return [
+            ("%040d" % (i + 1), "%040d" % (i + 100), "refs/heads/branch%d" % i)
+            for i in range(10)
+        ]
+
+    def get_git_merge_base(self, oldrev, newrev):
+        return oldrev
+
+    def get_git_commits(
+        self,
+        refname,
+        newrev,
+        baserev,
+        first_parent=True,
+        new_branch=True,
+        boundaries=None,
+    ):
+        return "\n".join("%s%02d subject" % (newrev[:38], i) for i in range(7))
+
+    def get_git_commit_info(self, rev):
+        return "Author: user <User@mail.com>\n\n    Commit %s\n" % rev
 
 
 class TestGitChangeSource(unittest.TestCase):
@@ -52,3 +80,232 @@ class TestGitChangeSource(unittest.TestCase):
         for id, change in enumerate(changes):
             for key, value in change.items():
                 self.assertEqual(value, exp_changes[id][key])
+
+    def test_get_changes_parallel(self):
+        # parallel processing keeps the order of the sequential processing
+        sequential = GitChangeSource(
+            "repository", cli=MultiRefMockCli(), logger=Logger()
+        ).get_changes()
+        parallel = GitChangeSource(
+            "repository", cli=MultiRefMockCli(), logger=Logger(), jobs=4, chunk_size=3
+        ).get_changes()
+        self.assertEqual(len(sequential), 70)
+        self.assertEqual(parallel, sequential)
+        for change in parallel:
+            self.assertEqual(change["comments"], "Commit %s" % change["revision"])
+
+    def test_iter_changes_lazy(self):
+        # the infos of a chunk are fetched when its first change is consumed
+        cli = MultiRefMockCli()
+        chunks = []
+        get_git_commit_infos = cli.get_git_commit_infos
+        cli.get_git_commit_infos = lambda revs: (
+            chunks.append(revs) or get_git_commit_infos(revs)
+        )
+        changes = GitChangeSource(
+            "repository", cli=cli, logger=Logger(), chunk_size=3
+        ).iter_changes()
+        self.assertEqual(chunks, [])
+        first = next(changes)
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(first["revision"], chunks[0][0])
+        self.assertEqual(len([first] + list(changes)), 70)
+        # the refs share their 7 commits
+        self.assertEqual(len(chunks), 3)
+
+    def test_iter_changes_shared_commits(self):
+        # a commit listed by several refs is fetched once and used by each ref
+        cli = MultiRefMockCli()
+        cli.get_git_commits = lambda *args, **kwargs: "%040d subject" % 1
+        chunks = []
+        get_git_commit_infos = cli.get_git_commit_infos
+        cli.get_git_commit_infos = lambda revs: (
+            chunks.append(revs) or get_git_commit_infos(revs)
+        )
+        changes = GitChangeSource("repository", cli=cli, logger=Logger()).get_changes()
+        self.assertEqual(chunks, [["%040d" % 1]])
+        self.assertEqual(
+            [change["branch"] for change in changes],
+            ["branch%d" % i for i in range(10)],
+        )
+        changes[0]["files"].append("other")
+        self.assertEqual(changes[1]["files"], [])
+
+    def test_iter_changes_small_cache(self):
+        # the shared commits are shown once whatever the cache size
+        cli = MultiRefMockCli()
+        chunks = []
+        get_git_commit_infos = cli.get_git_commit_infos
+        cli.get_git_commit_infos = lambda revs: (
+            chunks.append(revs) or get_git_commit_infos(revs)
+        )
+        changes = GitChangeSource(
+            "repository", cli=cli, logger=Logger(), cache_size=1
+        ).get_changes()
+        self.assertEqual(len(changes), 70)
+        for change in changes:
+            self.assertEqual(change["comments"], "Commit %s" % change["revision"])
+        # the 7 listed commits are shown once for all refs
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(len(chunks[0]), 7)
+
+    def test_merge_base_cache(self):
+        # refs updated to the same commits share the merge base
+        cli = MultiRefMockCli()
+        cli.get_git_stdin = lambda: [
+            ("%040d" % 1, "%040d" % 100, "refs/heads/branch%d" % i) for i in range(3)
+        ]
+        merge_bases = []
+        cli.get_git_merge_base = lambda oldrev, newrev: (
+            merge_bases.append((oldrev, newrev)) or oldrev
+        )
+        source = GitChangeSource("repository", cli=cli, logger=Logger())
+        with self.assertLogs("bb_change_broker", level="DEBUG") as logs:
+            changes = source.get_changes()
+        self.assertEqual(len(changes), 21)
+        self.assertEqual(merge_bases, [("%040d" % 1, "%040d" % 100)])
+        self.assertIn(
+            "merge base cache: 2 hits, 1 misses, hit rate 66.7%", "\n".join(logs.output)
+        )
+        self.assertIn(
+            "commit infos: 7 shown for 21 uses",
+            "\n".join(logs.output),
+        )
+        # the caches only live for one run
+        source.get_changes()
+        self.assertEqual(len(merge_bases), 2)
+
+    def test_snapshot(self):
+        # new branches are listed against the boundaries of the snapshot
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        snapshot = RefSnapshot(os.path.join(directory, "refs.snapshot"))
+        cli = MultiRefMockCli()
+        refs = {"refs/heads/master": "%040d" % 100, "refs/heads/new": "%040d" % 200}
+        get_git_refs = []
+        cli.get_git_refs = lambda: get_git_refs.append(True) or refs
+        cli.get_git_stdin = lambda: [
+            ("0" * 40, "%040d" % 200, "refs/heads/new"),
+        ]
+        boundaries = []
+        get_git_commits = cli.get_git_commits
+        cli.get_git_commits = lambda *args: (
+            boundaries.append(args[5]) or get_git_commits(*args)
+        )
+        source = GitChangeSource(
+            "repository", cli=cli, logger=Logger(), snapshot=snapshot
+        )
+        # the missing snapshot is built from the branches after the push
+        with self.assertLogs("bb_change_broker", level="WARNING"):
+            self.assertEqual(len(source.get_changes()), 7)
+        self.assertFalse(os.path.exists(snapshot.path))
+        source.record_publish(True)
+        self.assertEqual(get_git_refs, [True])
+        self.assertEqual(boundaries, [["%040d" % 100]])
+        # the next push updates the snapshot without reading all branches
+        cli.get_git_stdin = lambda: [
+            ("%040d" % 100, "%040d" % 101, "refs/heads/master"),
+            ("0" * 40, "%040d" % 300, "refs/heads/other"),
+        ]
+        self.assertEqual(len(source.get_changes()), 14)
+        source.record_publish(True)
+        self.assertEqual(get_git_refs, [True])
+        # the update of master is listed from its merge base
+        self.assertEqual(boundaries[1:], [None, ["%040d" % 101, "%040d" % 200]])
+        snapshot.load()
+        self.assertEqual(
+            snapshot.refs,
+            {
+                "refs/heads/master": "%040d" % 101,
+                "refs/heads/new": "%040d" % 200,
+                "refs/heads/other": "%040d" % 300,
+            },
+        )
+        self.assertEqual(
+            snapshot.boundaries, {"%040d" % 101, "%040d" % 200, "%040d" % 300}
+        )
+
+    def test_snapshot_missed_push(self):
+        # a branch that missed a push is listed from its published head
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        snapshot = RefSnapshot(os.path.join(directory, "refs.snapshot"))
+        snapshot.rebuild({"refs/heads/master": "%040d" % 1})
+        snapshot.save()
+        cli = MultiRefMockCli()
+        cli.get_git_stdin = lambda: [
+            ("%040d" % 2, "%040d" % 3, "refs/heads/master"),
+        ]
+        merge_bases = []
+        cli.get_git_merge_base = lambda oldrev, newrev: (
+            merge_bases.append((oldrev, newrev)) or oldrev
+        )
+        source = GitChangeSource(
+            "repository", cli=cli, logger=Logger(), snapshot=snapshot
+        )
+        with self.assertLogs("bb_change_broker", level="WARNING") as logs:
+            self.assertEqual(len(source.get_changes()), 7)
+        self.assertEqual(merge_bases, [("%040d" % 1, "%040d" % 3)])
+        self.assertIn("Missed update of refs/heads/master", "\n".join(logs.output))
+        source.record_publish(True)
+        snapshot.load()
+        self.assertEqual(snapshot.refs, {"refs/heads/master": "%040d" % 3})
+
+    def test_snapshot_not_published(self):
+        # the snapshot only moves once the changes of the push are published
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        snapshot = RefSnapshot(os.path.join(directory, "refs.snapshot"))
+        snapshot.rebuild({"refs/heads/master": "%040d" % 1})
+        snapshot.save()
+        cli = MultiRefMockCli()
+        cli.get_git_stdin = lambda: [
+            ("%040d" % 1, "%040d" % 2, "refs/heads/master"),
+        ]
+        source = GitChangeSource(
+            "repository", cli=cli, logger=Logger(), snapshot=snapshot
+        )
+        # all changes were iterated, but their publish failed
+        self.assertEqual(len(source.get_changes()), 7)
+        source.record_publish(False)
+        snapshot.load()
+        self.assertEqual(snapshot.refs, {"refs/heads/master": "%040d" % 1})
+        # the publish stopped before the last change
+        changes = source.iter_changes()
+        for change in range(6):
+            next(changes)
+        changes.close()
+        source.record_publish(True)
+        snapshot.load()
+        self.assertEqual(snapshot.refs, {"refs/heads/master": "%040d" % 1})
+
+    def test_missed_refs(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        snapshot = RefSnapshot(os.path.join(directory, "refs.snapshot"))
+        cli = MultiRefMockCli()
+        refs = {"refs/heads/master": "%040d" % 1, "refs/heads/old": "%040d" % 2}
+        cli.get_git_refs = lambda: dict(refs)
+        source = GitChangeSource(
+            "repository", cli=cli, logger=Logger(), snapshot=snapshot
+        )
+        # the first run takes the current branches as published
+        self.assertEqual(source.get_missed_refs(), [])
+        self.assertEqual(source.get_missed_refs(), [])
+        refs["refs/heads/master"] = "%040d" % 3
+        refs["refs/heads/new"] = "%040d" % 4
+        del refs["refs/heads/old"]
+        missed = source.get_missed_refs()
+        self.assertEqual(
+            missed,
+            [
+                ("%040d" % 1, "%040d" % 3, "refs/heads/master"),
+                ("0" * 40, "%040d" % 4, "refs/heads/new"),
+                ("%040d" % 2, "0" * 40, "refs/heads/old"),
+            ],
+        )
+        # publishing the missed refs updates the snapshot
+        self.assertEqual(len(source.get_changes(missed)), 14)
+        self.assertEqual(len(source.get_missed_refs()), 3)
+        source.record_publish(True)
+        self.assertEqual(source.get_missed_refs(), [])
@@ -1,4 +1,4 @@
-import unittest, sys, os
+import unittest, sys, os, io
 
 sys.path.insert(0, os.path.dirname(__file__))
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "mock"))
@@ -12,6 +12,9 @@ from bb_change_broker.util.git import (
     extract_branch,
     extract_files_from_diff,
     extract_rev,
+    split_commits,
+    parse_commit_info,
+    parse_commit_infos,
 )
 
 
@@ -54,3 +57,66 @@ class TestGit(unittest.TestCase):
             extract_rev(output.split("\n")[1]),
             "83060a21145596e42d985c798c32aa4b581b7b4f",
         )
+
+    def test_split_commits(self):
+        output = (
+            "commit 24900f9565adfe70eca693610102b5b201720c21\n"
+            + self.cli.get_git_commit_info("")
+            + "\n\ncommit 83060a21145596e42d985c798c32aa4b581b7b4f\n"
+            + "Merge: 24900f9 f5934ac\n"
+            + "Author: other <Other@mail.com>\n"
+            + "\n"
+            + "    commit message that mentions a commit\n"
+        )
+        commits = split_commits(output)
+        self.assertEqual(len(commits), 2)
+        self.assertEqual(extract_files(commits[0]), ["somefile.txt"])
+        self.assertEqual(extract_author(commits[1]), "other <Other@mail.com>")
+        self.assertEqual(extract_files(commits[1]), ["merge"])
+
+    def test_parse_commit_info(self):
+        info = parse_commit_info(self.cli.get_git_commit_info(""))
+        self.assertIsNone(info.revision)
+        self.assertEqual(info.author, "user <User@mail.com>")
+        self.assertEqual(info.files, ["somefile.txt"])
+        self.assertFalse(info.merge)
+        self.assertEqual(info.get_comments(), "New Feature")
+
+    def test_parse_commit_infos_stream(self):
+        # the parser reads the bytes lines of a pipe directly
+        output = (
+            "commit 24900f9565adfe70eca693610102b5b201720c21\n"
+            + self.cli.get_git_commit_info("")
+            + "\n\ncommit 83060a21145596e42d985c798c32aa4b581b7b4f\n"
+            + "Merge: 24900f9 f5934ac\n"
+            + "Author: other <Other@mail.com>\n"
+            + "\n"
+            + "    commit message that mentions a commit\n"
+        ).encode("utf-8")
+        infos = list(parse_commit_infos(io.BytesIO(output)))
+        self.assertEqual(
+            [info.revision for info in infos],
+            [
+                "24900f9565adfe70eca693610102b5b201720c21",
+                "83060a21145596e42d985c798c32aa4b581b7b4f",
+            ],
+        )
+        self.assertEqual(infos[0].files, ["somefile.txt"])
+        self.assertEqual(infos[1].author, "other <Other@mail.com>")
+        self.assertEqual(infos[1].files, ["merge"])
+        self.assertTrue(infos[1].merge)
+        self.assertEqual(
+            infos[1].get_comments(), "commit message that mentions a commit"
+        )
+
+    def test_parse_files_like_diff_pattern(self):
+        # paths with whitespace are matched by the diff pattern as before
+        lines = [
+            ":100644 100644 e69de29 7b57bd2 M\tsrc/file.py",
+            ":100644 100644 e69de29 7b57bd2 M\tdir with space/file.py",
+            ":100644 100644 e69de29 7b57bd2 M\tA b.txt",
+            ":100644 100644 e69de29 7b57bd2 R100\told.py\tnew.py",
+        ]
+        info = parse_commit_info("\n".join(lines))
+        self.assertEqual(info.files, extract_files_from_diff("\n".join(lines)))
+        self.assertEqual(info.files, ["src/file.py", "dir with space/file.py", "b.txt"])
@@ -0,0 +1,141 @@
+import unittest, sys, os, asyncio, json, socket, socketserver, threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "mock"))
+
+from bb_change_broker.backend.async_http_handler import AsyncHTTPHandler
+from bb_change_broker.backend.http_handler import PooledHTTPHandler
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """HTTP server with a thread per connection, http.server has it from 3.7."""
+
+    daemon_threads = True
+
+
+class ChangeHookHandler(BaseHTTPRequestHandler):
+    """Local change hook that keeps connections alive."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.posts.append((json.loads(body), self.headers["Authorization"]))
+        self.server.ports.add(self.client_address[1])
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        # chunked response
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in (b"hello ", b"world"):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestPooledHTTPHandler(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ChangeHookHandler)
+        self.server.posts = []
+        self.server.ports = set()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = "http://127.0.0.1:%d/change_hook/base" % self.server.server_port
+        self.http_handler = PooledHTTPHandler(pool_size=2, idle_timeout=60, timeout=5)
+
+    def tearDown(self):
+        self.http_handler.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_post_reuses_connection(self):
+        for i in range(5):
+            resp = self.http_handler.post(
+                {"revision": str(i)}, self.url, username="user", password="password"
+            )
+            self.assertEqual(resp.status, 200)
+        self.assertEqual(self.http_handler.head(self.url).status, 200)
+        self.assertEqual(len(self.server.ports), 1)
+        self.assertEqual(
+            [data for data, auth in self.server.posts],
+            [[{"revision": str(i)}] for i in range(5)],
+        )
+        self.assertEqual(self.server.posts[0][1], "Basic dXNlcjpwYXNzd29yZA==")
+
+    def test_idle_connections_are_evicted(self):
+        self.http_handler.idle_timeout = 0
+        for i in range(2):
+            self.http_handler.post({"revision": str(i)}, self.url)
+        self.assertEqual(len(self.server.ports), 2)
+
+    def test_stale_connection_is_replaced(self):
+        self.http_handler.post({"revision": "1"}, self.url)
+        # the server closes the idle connection
+        for connections in self.http_handler.idle.values():
+            for connection, last_used in connections:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+        resp = self.http_handler.post({"revision": "2"}, self.url)
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(len(self.server.posts), 2)
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "asyncio.run needs Python 3.7")
+class TestAsyncHTTPHandler(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ChangeHookHandler)
+        self.server.posts = []
+        self.server.ports = set()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = "http://127.0.0.1:%d/change_hook/base" % self.server.server_port
+        self.http_handler = AsyncHTTPHandler(pool_size=2, idle_timeout=60, timeout=5)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_post_reuses_connection(self):
+        async def run():
+            for i in range(5):
+                resp = await self.http_handler.post(
+                    {"revision": str(i)}, self.url, username="user", password="password"
+                )
+                self.assertEqual(resp.status, 200)
+            self.assertEqual((await self.http_handler.head(self.url)).status, 200)
+            resp = await self.http_handler.request("GET", self.url)
+            self.assertEqual(resp.read(), b"hello world")
+            await self.http_handler.close()
+
+        asyncio.run(run())
+        self.assertEqual(len(self.server.ports), 1)
+        self.assertEqual(
+            [data for data, auth in self.server.posts],
+            [[{"revision": str(i)}] for i in range(5)],
+        )
+        self.assertEqual(self.server.posts[0][1], "Basic dXNlcjpwYXNzd29yZA==")
+
+    def test_stale_connection_is_replaced(self):
+        async def run():
+            await self.http_handler.post({"revision": "1"}, self.url)
+            # the server closes the idle connection
+            for connections in self.http_handler.idle.values():
+                for (reader, writer), last_used in connections:
+                    writer.get_extra_info("socket").shutdown(socket.SHUT_RDWR)
+            resp = await self.http_handler.post({"revision": "2"}, self.url)
+            await self.http_handler.close()
+            return resp
+
+        self.assertEqual(asyncio.run(run()).status, 200)
+        self.assertEqual(len(self.server.posts), 2)
@@ -0,0 +1,153 @@
+import unittest, sys, os, json, socketserver, subprocess, tempfile, threading
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "mock"))
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# number of loaded modules, which does not depend on the load of the machine,
+# the import times are measured by benchmark/bench_import.py.
+# The hook loads about 70 and the client mode about 160, pika alone adds
+# about 80.
+HOOK_MODULE_BUDGET = 100
+CLIENT_MODULE_BUDGET = 200
+
+# modules the hook must not load when it hands its input to the agent
+HOOK_FORBIDDEN = (
+    "pika",
+    "urllib.request",
+    "logging.config",
+    "bb_change_broker.client",
+    "bb_change_broker.server",
+    "bb_change_broker.change_source.git",
+    "bb_change_broker.change_source.svn",
+)
+
+# modules the client mode must not load before it publishes, the change
+# source of the config is expected
+CLIENT_FORBIDDEN = (
+    "pika",
+    "logging.config",
+    "bb_change_broker.server",
+    "bb_change_broker.agent",
+    "bb_change_broker.change_source.svn",
+)
+
+
+def loaded_modules(args, stdin=b""):
+    """Run python with -X importtime and list the imported modules.
+
+    :param args (list): The arguments of python.
+    :param stdin (bytes): The input of the process.
+    :return (set): The names of the imported modules.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime"] + args,
+        input=stdin,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=dict(os.environ, PYTHONPATH=ROOT),
+        cwd=ROOT,
+        check=True,
+    )
+    modules = set()
+    for line in proc.stderr.decode("utf-8").splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        modules.add(line.rsplit("|", 1)[1].strip())
+    return modules
+
+
+class OkHandler(socketserver.StreamRequestHandler):
+    """Agent stand-in that accepts every request."""
+
+    def handle(self):
+        self.rfile.readline()
+        self.wfile.write(json.dumps({"status": "ok"}).encode("utf-8") + b"\n")
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "-X importtime needs Python 3.7")
+class TestImportTime(unittest.TestCase):
+    def test_hook_module(self):
+        modules = loaded_modules(["-c", "import bb_change_broker.hook"])
+        self.assertLess(len(modules), HOOK_MODULE_BUDGET)
+        for module in HOOK_FORBIDDEN:
+            self.assertNotIn(module, modules)
+
+    def test_hook_entry_point(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "agent.sock")
+        server = socketserver.ThreadingUnixStreamServer(path, OkHandler)
+        self.addCleanup(server.server_close)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+
+        config = os.path.join(directory.name, "config.json")
+        with open(config, "w") as f:
+            json.dump(
+                {
+                    "DEFAULT": {"mode": "client", "encoding": "utf-8"},
+                    "git": {"repository": "/srv/git/project.git"},
+                    "agent": {"socket": path},
+                },
+                f,
+            )
+        modules = loaded_modules(
+            [os.path.join(ROOT, "bin", "bb_change_broker"), config, "client"],
+            stdin=b"0000 1111 refs/heads/master\n",
+        )
+        for module in HOOK_FORBIDDEN:
+            self.assertNotIn(module, modules)
+
+    def test_client_entry_point(self):
+        # the hook without agent runs the client, which only connects to the
+        # broker when there are changes to publish
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        config = os.path.join(directory.name, "config.json")
+        with open(config, "w") as f:
+            json.dump(
+                {
+                    "DEFAULT": {"mode": "client", "encoding": "utf-8"},
+                    "git": {"repository": "/srv/git/project.git"},
+                    "svn": None,
+                    "rabbitmq": {
+                        "host": "127.0.0.1",
+                        "port": 5672,
+                        "username": "user",
+                        "password": "password",
+                        "queue": "changes",
+                    },
+                    "buildbot": {
+                        "host": "127.0.0.1",
+                        "port": 8010,
+                        "username": "user",
+                        "password": "password",
+                    },
+                },
+                f,
+            )
+        modules = loaded_modules(
+            [os.path.join(ROOT, "bin", "bb_change_broker"), config, "client"]
+        )
+        self.assertIn("bb_change_broker.change_source.git", modules)
+        self.assertLess(len(modules), CLIENT_MODULE_BUDGET)
+        for module in CLIENT_FORBIDDEN:
+            self.assertNotIn(module, modules)
+
+    def test_default_arguments(self):
+        # importing the publishers must not build loggers or handlers
+        modules = loaded_modules(
+            [
+                "-c",
+                "import logging, bb_change_broker.publisher.buildbot, "
+                "bb_change_broker.publisher.broker, "
+                "bb_change_broker.consumer.broker; "
+                "assert not logging.getLogger().handlers",
+            ]
+        )
+        self.assertNotIn("logging.config", modules)
+        self.assertNotIn("urllib.request", modules)
@@ -0,0 +1,234 @@
+import unittest, sys, os, shutil, subprocess, tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bb_change_broker.backend.cli import DefaultCli
+from bb_change_broker.backend.object_cli import ObjectCli
+from bb_change_broker.util.git import parse_commit_info
+from bb_change_broker.util.git_objects import apply_delta
+
+
+@unittest.skipUnless(shutil.which("git"), "git is not installed")
+class TestObjectCli(unittest.TestCase):
+    """Compare the object cli with the output of git."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Create a repository with packed and loose objects."""
+        cls.directory = tempfile.mkdtemp()
+        cls.env = dict(
+            os.environ,
+            GIT_AUTHOR_NAME="Some User",
+            GIT_AUTHOR_EMAIL="some.user@example.com",
+            GIT_COMMITTER_NAME="Other User",
+            GIT_COMMITTER_EMAIL="other.user@example.com",
+            GIT_CONFIG_NOSYSTEM="1",
+            HOME=cls.directory,
+        )
+        cls.date = 1600000000
+        cls.git("init", "-q", "-b", "master")
+        cls.commit({"a.txt": "a\n", "dir/b.txt": "b\n", "dir/sub/c.txt": "c\n"})
+        cls.commit({"a.txt": "a\na\n", "dir/d.txt": "d\n"}, "Add d\n\nWith a body.\n")
+        cls.git("checkout", "-q", "-b", "feature")
+        cls.commit({"dir/sub/c.txt": None, "e.txt": "e\n"})
+        cls.commit({"dir/b.txt": "b\nb\n"})
+        cls.git("checkout", "-q", "master")
+        cls.commit({"f.txt": "f\n"})
+        cls.commit({"dir/d.txt": "d\nd\n"})
+        cls.date += 60
+        cls.git("merge", "-q", "--no-ff", "-m", "Merge feature", "feature")
+        # deltas against ref ids, then against offsets
+        cls.git("-c", "repack.useDeltaBaseOffset=false", "repack", "-adfq")
+        cls.commit({"a.txt": "a\na\na\n"})
+        os.chmod(os.path.join(cls.directory, "e.txt"), 0o755)
+        cls.commit({"g.txt": "g\n"}, "Make e executable")
+        cls.git("repack", "-dq")
+        cls.git("tag", "-a", "-m", "Release", "v1")
+        cls.git("pack-refs", "--all")
+        cls.git("checkout", "-q", "-b", "new")
+        cls.commit({"h.txt": "h\n"})
+        cls.commit({"h.txt": "h\nh\n"})
+        cls.git("checkout", "-q", "master")
+        cls.commit({"i.txt": "i\n"})
+        cls.commits = cls.git("rev-list", "--all").split()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    @classmethod
+    def git(cls, *args):
+        """Run git in the repository.
+
+        :param args (list): The arguments of git.
+        :return (str): The output.
+        """
+        env = dict(
+            cls.env,
+            GIT_AUTHOR_DATE="%d +0000" % cls.date,
+            GIT_COMMITTER_DATE="%d +0000" % cls.date,
+        )
+        return subprocess.check_output(
+            ("git",) + args, cwd=cls.directory, env=env
+        ).decode("utf-8")
+
+    @classmethod
+    def commit(cls, files, message="Update files"):
+        """Write files and commit them.
+
+        :param files (dict): The content of each path, None to delete it.
+        :param message (str): The commit message.
+        """
+        for path, content in files.items():
+            path = os.path.join(cls.directory, path)
+            if content is None:
+                os.remove(path)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(content)
+        cls.date += 60
+        cls.git("add", "-A")
+        cls.git("commit", "-q", "-m", message)
+
+    def setUp(self):
+        """Set up the test."""
+        self.cli = DefaultCli(cwd=self.directory)
+        self.object_cli = ObjectCli(cwd=self.directory)
+
+    def tearDown(self):
+        self.object_cli.close()
+
+    def test_commit_info(self):
+        for rev in self.commits:
+            self.assertEqual(
+                self.object_cli.get_git_commit_info(rev),
+                self.cli.get_git_commit_info(rev),
+            )
+
+    def test_iter_commit_infos(self):
+        infos = list(self.object_cli.iter_git_commit_infos(self.commits))
+        self.assertEqual(len(infos), len(self.commits))
+        for rev, info in zip(self.commits, infos):
+            expected = parse_commit_info(self.cli.get_git_commit_info(rev))
+            self.assertEqual(info.revision, expected.revision)
+            self.assertEqual(info.author, expected.author)
+            self.assertEqual(info.files, expected.files)
+            self.assertEqual(info.merge, expected.merge)
+            self.assertEqual(info.get_comments(), expected.get_comments())
+
+    def test_merge_base_and_diff(self):
+        for oldrev in self.commits:
+            for newrev in self.commits:
+                self.assertEqual(
+                    self.object_cli.get_git_merge_base(oldrev, newrev),
+                    self.cli.get_git_merge_base(oldrev, newrev),
+                )
+                self.assertEqual(
+                    self.object_cli.get_git_diff(oldrev, newrev),
+                    self.cli.get_git_diff(oldrev, newrev),
+                )
+
+    def test_commits(self):
+        for baserev in self.commits:
+            for first_parent in (True, False):
+                self.assertEqual(
+                    self.object_cli.get_git_commits(
+                        "refs/heads/master",
+                        "master",
+                        baserev,
+                        first_parent,
+                        new_branch=False,
+                    ).strip(),
+                    self.cli.get_git_commits(
+                        "refs/heads/master",
+                        "master",
+                        baserev,
+                        first_parent,
+                        new_branch=False,
+                    ).strip(),
+                )
+
+    def test_new_branch(self):
+        for refname in ("refs/heads/new", "refs/heads/feature"):
+            self.assertEqual(
+                self.object_cli.get_git_commits(refname, refname, None).strip(),
+                self.cli.get_git_commits(refname, refname, None).strip(),
+            )
+        self.assertEqual(
+            len(self.object_cli.get_git_commits("new", "new", None).split("\n")), 2
+        )
+
+    def test_new_branch_boundaries(self):
+        boundaries = [self.git("rev-parse", "feature").strip()]
+        for cli in (self.cli, self.object_cli):
+            commits = cli.get_git_commits(
+                "refs/heads/new", "new", None, boundaries=boundaries
+            )
+            # the commits of master and new that are not on feature
+            self.assertEqual(
+                commits.strip(),
+                self.git(
+                    "rev-list", "--reverse", "--pretty=oneline", "new", "^feature"
+                ).strip(),
+            )
+
+    def test_refs(self):
+        self.assertEqual(self.object_cli.get_git_refs(), self.cli.get_git_refs())
+        self.assertEqual(
+            self.object_cli.get_git_refs("refs/tags/"),
+            self.cli.get_git_refs("refs/tags/"),
+        )
+
+    def test_resolve(self):
+        store = self.object_cli._ObjectCli__get_store()
+        # the tag is peeled, the branches are read from packed-refs
+        self.assertEqual(store.resolve("v1"), self.git("rev-parse", "v1^{}").strip())
+        self.assertEqual(
+            store.resolve("feature"), self.git("rev-parse", "feature").strip()
+        )
+        self.assertEqual(store.resolve("HEAD"), self.git("rev-parse", "HEAD").strip())
+        self.assertEqual(
+            sorted(store.refs()),
+            ["refs/heads/feature", "refs/heads/master", "refs/heads/new"],
+        )
+        with self.assertRaises(KeyError):
+            store.resolve("unknown")
+
+    def test_repository_changes(self):
+        # a copy, the other tests use the repository
+        directory = os.path.join(tempfile.mkdtemp(), "copy")
+        self.addCleanup(shutil.rmtree, os.path.dirname(directory))
+        shutil.copytree(self.directory, directory)
+        git = lambda *args: subprocess.check_call(
+            ("git",) + args, cwd=directory, env=self.env
+        )
+        object_cli = ObjectCli(cwd=directory)
+        self.addCleanup(object_cli.close)
+        store = object_cli._ObjectCli__get_store()
+        self.assertIn("refs/heads/feature", store.refs())
+        # pack-refs rewrites packed-refs and removes the loose refs
+        git("branch", "-q", "-D", "feature")
+        git("pack-refs", "--all")
+        self.assertEqual(
+            object_cli.get_git_refs(), DefaultCli(cwd=directory).get_git_refs()
+        )
+        self.assertEqual(store.resolve("new"), self.git("rev-parse", "new").strip())
+        # gc replaces the packs, the removed ones are dropped
+        git("repack", "-adq")
+        for commit in self.commits:
+            store.read(commit)
+        self.assertEqual(len(store.packs), 1)
+        self.assertTrue(os.path.isfile(store.packs[0].path))
+
+
+class TestApplyDelta(unittest.TestCase):
+    def test_apply_delta(self):
+        base = b"0123456789"
+        # sizes 10 and 9, copy 4 bytes at offset 2, insert "abc", copy 2 bytes at 8
+        delta = b"\x0a\x09" + b"\x91\x02\x04" + b"\x03abc" + b"\x91\x08\x02"
+        self.assertEqual(apply_delta(base, delta), b"2345abc89")
+
+    def test_apply_delta_invalid(self):
+        with self.assertRaises(ValueError):
+            apply_delta(b"base", b"\x04\x04\x00")
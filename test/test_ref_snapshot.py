@@ -0,0 +1,132 @@
+import unittest, sys, os, shutil, tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bb_change_broker.util.ref_snapshot import RefSnapshot
+
+ZERO = "0" * 40
+A = "a" * 40
+B = "b" * 40
+C = "c" * 40
+D = "d" * 40
+
+
+class TestRefSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "refs.snapshot")
+        self.snapshot = RefSnapshot(self.path)
+        self.snapshot.rebuild({"refs/heads/master": A, "refs/heads/release": A})
+        self.snapshot.save()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def load(self):
+        snapshot = RefSnapshot(self.path)
+        self.assertTrue(snapshot.load())
+        return snapshot
+
+    def test_load_missing(self):
+        snapshot = RefSnapshot(os.path.join(self.directory, "missing"))
+        self.assertFalse(snapshot.load())
+        self.assertEqual(snapshot.refs, {})
+
+    def test_save_and_load(self):
+        snapshot = self.load()
+        self.assertEqual(
+            snapshot.refs, {"refs/heads/master": A, "refs/heads/release": A}
+        )
+        self.assertEqual(snapshot.boundaries, {A})
+        with open(self.path) as f:
+            self.assertEqual(
+                f.read(),
+                "%s refs/heads/master\n%s refs/heads/release\n%s\n" % (A, A, A),
+            )
+
+    def test_catch_up(self):
+        snapshot = self.load()
+        refs = [
+            (A, B, "refs/heads/master"),
+            (ZERO, B, "refs/heads/new"),
+            (C, B, "refs/tags/v1"),
+        ]
+        self.assertEqual(snapshot.catch_up(refs), refs)
+        # the missed commits of master and release are listed again
+        self.assertEqual(
+            snapshot.catch_up(
+                [(C, B, "refs/heads/master"), (ZERO, B, "refs/heads/release")]
+            ),
+            [(A, B, "refs/heads/master"), (A, B, "refs/heads/release")],
+        )
+        self.assertEqual(
+            snapshot.catch_up([(C, B, "refs/heads/other")]),
+            [(ZERO, B, "refs/heads/other")],
+        )
+
+    def test_diff(self):
+        snapshot = self.load()
+        self.assertEqual(
+            snapshot.diff({"refs/heads/master": A, "refs/heads/release": A}), []
+        )
+        self.assertEqual(
+            snapshot.diff({"refs/heads/master": B, "refs/heads/new": C}),
+            [
+                (A, B, "refs/heads/master"),
+                (ZERO, C, "refs/heads/new"),
+                (A, ZERO, "refs/heads/release"),
+            ],
+        )
+
+    def test_get_boundaries(self):
+        snapshot = self.load()
+        refs = [(A, B, "refs/heads/master"), (ZERO, C, "refs/heads/new")]
+        # the other updated branch is a boundary, the new branch is not
+        self.assertEqual(snapshot.get_boundaries(refs, "refs/heads/new", C), [A, B])
+        # a deleted head stays a boundary while another branch points to it
+        refs = [(A, ZERO, "refs/heads/master"), (ZERO, C, "refs/heads/new")]
+        self.assertEqual(snapshot.get_boundaries(refs, "refs/heads/new", C), [A])
+        refs.append((A, ZERO, "refs/heads/release"))
+        self.assertEqual(snapshot.get_boundaries(refs, "refs/heads/new", C), [])
+
+    def test_update(self):
+        # a fast-forward replaces the head, master and release diverge
+        self.snapshot.update([(A, B, "refs/heads/master")])
+        snapshot = self.load()
+        self.assertEqual(snapshot.refs["refs/heads/master"], B)
+        self.assertEqual(snapshot.boundaries, {A, B})
+        self.snapshot.update([(A, C, "refs/heads/release")])
+        self.assertEqual(self.load().boundaries, {B, C})
+        # a branch without new commits adds no boundary
+        self.snapshot.update(
+            [(ZERO, B, "refs/heads/copy")], covered={"refs/heads/copy"}
+        )
+        self.assertEqual(self.load().boundaries, {B, C})
+        self.snapshot.update([(ZERO, D, "refs/heads/new")])
+        self.assertEqual(self.load().boundaries, {B, C, D})
+        # the head of a deleted branch is kept while another branch points to it
+        self.snapshot.update([(B, ZERO, "refs/heads/master")])
+        snapshot = self.load()
+        self.assertNotIn("refs/heads/master", snapshot.refs)
+        self.assertEqual(snapshot.boundaries, {B, C, D})
+        self.snapshot.update([(B, ZERO, "refs/heads/copy")])
+        self.assertEqual(self.load().boundaries, {C, D})
+
+    def test_update_published_further(self):
+        # a run does not move a branch that another run published further
+        self.snapshot.update([(A, C, "refs/heads/master")])
+        self.snapshot.update([(A, B, "refs/heads/master")])
+        self.assertEqual(self.load().refs["refs/heads/master"], C)
+        self.snapshot.update([(ZERO, B, "refs/heads/release")])
+        self.assertEqual(self.load().refs["refs/heads/release"], A)
+
+    def test_concurrent_updates(self):
+        # each run applies its refs to the snapshot on disk
+        other = RefSnapshot(self.path)
+        other.load()
+        self.snapshot.load()
+        self.snapshot.update([(A, B, "refs/heads/master")])
+        other.update([(A, C, "refs/heads/release")])
+        self.assertEqual(
+            self.load().refs, {"refs/heads/master": B, "refs/heads/release": C}
+        )
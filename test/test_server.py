@@ -0,0 +1,158 @@
+import unittest, sys, os, json, tempfile, time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "mock"))
+
+from mock.broker import MockChannel, MockMethod, MockProperties
+from bb_change_broker.codec.json import JsonCodec
+from bb_change_broker.server import Server
+
+
+class MockBuildbot(object):
+    """Buildbot publisher that records the published changes."""
+
+    def __init__(self, available=True):
+        self.available = available
+        self.published = []
+
+    def is_available(self):
+        return self.available
+
+    def publish(self, change):
+        self.published.append(change)
+        return True
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.config = {
+            "DEFAULT": {"encoding": "utf-8"},
+            "rabbitmq": {
+                "host": "localhost",
+                "port": 5672,
+                "username": "user",
+                "password": "password",
+                "queue": "changes",
+            },
+            "buildbot": {
+                "host": "localhost",
+                "port": 8010,
+                "username": "user",
+                "password": "password",
+            },
+            "dedup": {"path": os.path.join(self.directory.name, "dedup.db")},
+        }
+        self.codec = JsonCodec()
+        self.change = {
+            "repository": "repository",
+            "branch": "master",
+            "revision": "f5934acec8193597e0ee60e1be99b0c18654a222",
+            "files": ["a"],
+        }
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def server(self):
+        server = Server(self.config)
+        server.buildbot = MockBuildbot()
+        server.PROBE_INTERVAL = 0.01
+        return server
+
+    def deliver(self, server, ch, tag, message_id=None):
+        server.callback(
+            ch,
+            MockMethod(tag),
+            MockProperties(2, self.codec.content_type, message_id),
+            self.codec.encode(self.change),
+        )
+
+    def test_duplicates(self):
+        server = self.server()
+        ch = MockChannel("")
+        self.deliver(server, ch, 1, message_id="id")
+        self.deliver(server, ch, 2, message_id="id")
+        # without id the server derives it from the change
+        self.deliver(server, ch, 3)
+        self.deliver(server, ch, 4)
+        self.assertEqual(len(server.buildbot.published), 2)
+        self.assertEqual(ch.acked, [1, 2, 3, 4])
+
+        # the index survives a restart
+        server.dedup.close()
+        server = self.server()
+        self.deliver(server, ch, 5, message_id="id")
+        self.assertEqual(server.buildbot.published, [])
+
+    def test_decoded_change(self):
+        # the consumer decodes once, the callback uses the decoded change
+        server = self.server()
+        ch = MockChannel("")
+        properties = MockProperties(2, self.codec.content_type, "id")
+        body = self.codec.encode([self.change])
+        self.assertEqual(
+            server.partition_key(properties, server.decode(properties, body)),
+            ("repository", "master"),
+        )
+        server.callback(ch, MockMethod(1), properties, body, self.change)
+        self.assertEqual(server.buildbot.published, [self.change])
+        # messages that cannot be decoded have no key and are dropped
+        properties = MockProperties(2, self.codec.content_type, "other")
+        self.assertIsNone(server.decode(properties, b"[]"))
+        self.assertIsNone(server.partition_key(properties, None))
+        server.callback(ch, MockMethod(2), properties, b"[]", None)
+        self.assertEqual(ch.acked, [1])
+        self.assertEqual(ch.nacked, [2])
+
+    def test_failed_delivery_is_not_recorded(self):
+        self.config["rabbitmq"]["retry_delays"] = []
+        server = self.server()
+        server.buildbot.available = False
+        ch = MockChannel("")
+        self.deliver(server, ch, 1, message_id="id")
+        server.buildbot.available = True
+        self.deliver(server, ch, 2, message_id="id")
+        self.assertEqual(ch.nacked, [1])
+        self.assertEqual(ch.acked, [2])
+        self.assertEqual(len(server.buildbot.published), 1)
+
+    def test_retry(self):
+        self.config["rabbitmq"]["retry_delays"] = [1, 10]
+        server = self.server()
+        server.buildbot.available = False
+        ch = MockChannel("")
+        for attempt in (1, 2):
+            ch.queue_declare(server.rabbitmq.retry_queue("changes", attempt), True)
+
+        self.deliver(server, ch, 1, message_id="id")
+        self.assertEqual(ch.acked, [1])
+        self.assertEqual(ch.nacked, [])
+        # the failed message travels through the retry queues with its attempt
+        for tag, (queue, attempt) in enumerate(
+            [("changes.retry.1000", 1), ("changes.retry.10000", 2)], start=2
+        ):
+            [(body, properties)] = ch.queue[queue]
+            ch.queue[queue] = []
+            self.assertEqual(properties.headers, {"x-attempt": attempt})
+            self.assertEqual(properties.message_id, "id")
+            server.callback(ch, MockMethod(tag), properties, body)
+        # the last delay is kept for all further attempts
+        [(body, properties)] = ch.queue["changes.retry.10000"]
+        self.assertEqual(properties.headers, {"x-attempt": 3})
+        self.assertEqual(server.buildbot.published, [])
+        server.buildbot.available = True
+
+    def test_pause_while_unavailable(self):
+        server = self.server()
+        server.buildbot.available = False
+        ch = MockChannel("")
+        ch.queue_declare(server.rabbitmq.retry_queue("changes", 1), True)
+        self.deliver(server, ch, 1)
+        self.assertTrue(server.rabbitmq.is_paused())
+
+        server.buildbot.available = True
+        deadline = time.monotonic() + 5
+        while server.rabbitmq.is_paused() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(server.rabbitmq.is_paused())
@@ -0,0 +1,110 @@
+import unittest, sys, os, tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "mock"))
+
+from bb_change_broker.util.spool import Spool
+from bb_change_broker.util.log import Logger
+
+
+class TestSpool(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.spool = Spool(self.directory.name, logger=Logger(), segment_size=64)
+        self.records = [("application/json", b"change%d" % i) for i in range(10)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_drain(self):
+        self.assertTrue(self.spool.is_empty())
+        self.spool.append(self.records[:5])
+        self.spool.append(self.records[5:])
+        self.assertFalse(self.spool.is_empty())
+        published = []
+
+        def publish(records):
+            published.extend(records)
+            return len(records)
+
+        self.assertEqual(self.spool.drain(publish), 10)
+        self.assertEqual(published, self.records)
+        self.assertTrue(self.spool.is_empty())
+        self.assertEqual(self.spool.drain(publish), 0)
+
+    def test_drain_partially(self):
+        self.spool.append(self.records)
+        published = []
+        # publish only 3 messages, the rest stays in the spool
+        self.assertEqual(self.spool.drain(lambda records: 3), 3)
+        self.spool.append([(None, b"legacy")])
+
+        def publish(records):
+            published.extend(records)
+            return len(records)
+
+        self.assertEqual(self.spool.drain(publish), 8)
+        self.assertEqual(published, self.records[3:] + [(None, b"legacy")])
+
+    def test_corrupt_tail(self):
+        self.spool.append(self.records[:2])
+        segment = [
+            name for name in os.listdir(self.directory.name) if name.endswith(".seg")
+        ]
+        with open(os.path.join(self.directory.name, segment[0]), "ab") as f:
+            f.write(b"\x00\x00\x00\xffbroken")
+        published = []
+        self.spool.drain(lambda records: published.extend(records) or len(records))
+        self.assertEqual(published, self.records[:2])
+
+    def test_torn_append(self):
+        # an append killed midway leaves part of a record
+        self.spool.append(self.records[:1])
+        segment = os.path.join(self.directory.name, "%020d.seg" % 0)
+        with open(segment, "ab") as f:
+            f.write(b"\x00\x00\x00\xff\x00")
+        self.spool.append(self.records[1:3])
+        published = []
+        self.spool.drain(lambda records: published.extend(records) or len(records))
+        self.assertEqual(published, self.records[:3])
+
+    def test_append_checks_tail(self):
+        # the records before the end of the last append are not read again
+        self.spool.append(self.records[:1])
+        segment = os.path.join(self.directory.name, "%020d.seg" % 0)
+        size = os.path.getsize(segment)
+        with open(segment, "r+b") as f:
+            f.seek(Spool.HEADER.size)
+            f.write(b"x")
+        self.spool.append(self.records[1:2])
+        self.assertEqual(os.path.getsize(segment), 2 * size)
+
+    def test_torn_append_lost_end(self):
+        # an end that is not the end of a record makes the append read it all
+        self.spool.append(self.records[:1])
+        segment = os.path.join(self.directory.name, "%020d.seg" % 0)
+        with open(segment, "ab") as f:
+            f.write(b"\x00\x00\x00\xff\x00")
+        with open(os.path.join(self.directory.name, "%020d.end" % 0), "w") as f:
+            f.write("3")
+        self.spool.append(self.records[1:3])
+        published = []
+        self.spool.drain(lambda records: published.extend(records) or len(records))
+        self.assertEqual(published, self.records[:3])
+        self.assertEqual(
+            [name for name in os.listdir(self.directory.name) if ".lock" not in name],
+            ["%020d.seg" % 1],
+        )
+
+    def test_corrupt_segment_kept(self):
+        self.spool.append(self.records[:1])
+        segment = os.path.join(self.directory.name, "%020d.seg" % 0)
+        with open(segment, "ab") as f:
+            f.write(b"\x00\x00\x00\x01\x00" + b"valid records after it")
+        published = []
+        self.spool.drain(lambda records: published.extend(records) or len(records))
+        self.assertEqual(published, self.records[:1])
+        self.assertFalse(os.path.exists(segment))
+        with open(os.path.join(self.directory.name, "%020d.corrupt" % 0), "rb") as f:
+            self.assertTrue(f.read().endswith(b"valid records after it"))
+        self.assertTrue(self.spool.is_empty())
@@ -1,4 +1,4 @@
-import unittest, sys, os
+import unittest, sys, os, shutil, tempfile
 
 sys.path.insert(0, os.path.dirname(__file__))
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "mock"))
@@ -6,6 +6,7 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), "mock"))
 from mock.cli import MockCli
 from bb_change_broker.change_source.svn import SubversionChangeSource
 from bb_change_broker.util.log import Logger
+from bb_change_broker.util.revision_state import RevisionState
 
 
 class TestSubversionChangeSource(unittest.TestCase):
@@ -82,3 +83,86 @@ class TestSubversionChangeSource(unittest.TestCase):
         for id, change in enumerate(changes):
             for key, value in change.items():
                 self.assertEqual(value, exp_changes[id][key])
+
+
+class RangeMockCli(MockCli):
+    """Mock cli with a commit per revision that records the read revisions."""
+
+    def __init__(self, *args, **kwargs):
+        self.read = []
+
+    def get_svn_commit_revision(self, rev_arg, repository):
+        return "9\n"
+
+    def get_svn_commit_message(self, rev_arg, repository):
+        self.read.append(rev_arg)
+        return "Commit %s" % rev_arg[3:]
+
+
+class TestSubversionRevisions(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.state = RevisionState(os.path.join(self.directory, "revision"))
+        self.cli = RangeMockCli()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def source(self, **kwargs):
+        return SubversionChangeSource(
+            "/srv/svn/repository", cli=self.cli, filters=[], logger=Logger(), **kwargs
+        )
+
+    def test_iter_revisions(self):
+        for jobs in (1, 4):
+            changes = list(self.source(jobs=jobs).iter_revisions(3, 12))
+            self.assertEqual(
+                [change["revision"] for change in changes],
+                [str(revision) for revision in range(3, 13)],
+            )
+            self.assertEqual(
+                [change["comments"] for change in changes],
+                ["Commit %d" % revision for revision in range(3, 13)],
+            )
+
+    def test_catch_up(self):
+        source = self.source(state=self.state)
+        # without a stored revision, only the given revision is published
+        self.assertEqual(len(source.get_changes("5")), 1)
+        source.record_publish(True)
+        self.assertEqual(self.state.load(), 5)
+        # the skipped revisions are published before the youngest one
+        with self.assertLogs("bb_change_broker", level="WARNING"):
+            changes = source.get_changes()
+        self.assertEqual(
+            [change["revision"] for change in changes], ["6", "7", "8", "9"]
+        )
+        self.assertEqual(self.state.load(), 5)
+        source.record_publish(True)
+        self.assertEqual(self.state.load(), 9)
+        # a hook that finishes late does not move the state back
+        self.assertEqual(len(source.get_changes("7")), 1)
+        source.record_publish(True)
+        self.assertEqual(self.state.load(), 9)
+
+    def test_catch_up_not_published(self):
+        # the state does not move past revisions whose publish failed
+        self.state.update(5)
+        source = self.source(state=self.state)
+        with self.assertLogs("bb_change_broker", level="WARNING"):
+            self.assertEqual(len(source.get_changes()), 4)
+        source.record_publish(False)
+        self.assertEqual(self.state.load(), 5)
+        # neither does a publish that stopped before the last change
+        with self.assertLogs("bb_change_broker", level="WARNING"):
+            changes = source.iter_changes()
+            next(changes)
+        changes.close()
+        source.record_publish(True)
+        self.assertEqual(self.state.load(), 5)
+
+    def test_state_update(self):
+        self.assertIsNone(self.state.load())
+        self.state.update(3)
+        self.state.update(2)
+        self.assertEqual(self.state.load(), 3)
@@ -0,0 +1,27 @@
+import unittest, sys, os
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bb_change_broker.util.cli import check_output, iter_output_lines
+
+
+class TestCli(unittest.TestCase):
+    def test_check_output(self):
+        self.assertEqual(check_output("cat", input=b"a\nb\n"), b"a\nb\n")
+
+    def test_iter_output_lines(self):
+        lines = iter_output_lines("cat", input=b"".join(b"%d\n" % i for i in range(5)))
+        self.assertEqual(list(lines), [b"0\n", b"1\n", b"2\n", b"3\n", b"4\n"])
+
+    def test_iter_output_lines_streams(self):
+        # the first line is available before the command printed the rest,
+        # and the command is killed when the caller stops
+        lines = iter_output_lines("sh -c 'echo first; sleep 30; echo second'")
+        self.assertEqual(next(lines), b"first\n")
+        lines.close()
+
+    def test_iter_output_lines_large_input(self):
+        # input larger than the pipe buffer does not block the output
+        data = b"x" * 1023 + b"\n"
+        lines = iter_output_lines("cat", input=data * 1024)
+        self.assertEqual(sum(1 for line in lines), 1024)